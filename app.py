@@ -5,15 +5,26 @@ import time
 import logging
 import asyncio
 import threading
-import queue
 import re
+import concurrent.futures
+import heapq
+import itertools
+import shutil
+from collections import OrderedDict, deque
 from threading import Lock
 from flask import Flask, session, request, render_template, jsonify, redirect
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from telethon import TelegramClient, events, functions
 from telethon.errors import SessionPasswordNeededError, PhoneCodeExpiredError, PhoneCodeInvalidError, PasswordHashInvalidError, FloodWaitError, UserAlreadyParticipantError, InviteHashExpiredError, InviteHashInvalidError
+from telethon.errors import UsernameInvalidError, UsernameNotOccupiedError, ChannelPrivateError, ChannelInvalidError, PeerIdInvalidError, UnauthorizedError
+from telethon.errors import ChatWriteForbiddenError, UserBannedInChannelError
+from telethon.tl.types import InputPeerUser, InputPeerChat, InputPeerChannel, InputPeerSelf, ChatInviteAlready
+from telethon.tl.functions.messages import ImportChatInviteRequest, CheckChatInviteRequest
 from telethon.sessions import StringSession
 import socket
+from keyword_matcher import KeywordMatcher
+from schedule_rules import ScheduleRule
+from job_store import JobStore, JOB_PENDING, JOB_RUNNING, JOB_DONE, TARGET_PENDING, TARGET_CLAIMED, TARGET_DONE, TARGET_SKIPPED, TARGET_FAILED
 
 # تحميل متغيرات البيئة من ملف .env
 try:
@@ -39,6 +50,19 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", os.urandom(24))
 
 # إعداد SocketIO
+# WebSocket في وضع threading يحتاج مكتبة simple-websocket - polling يبقى كبديل احتياطي
+# SOCKETIO_TRANSPORTS=polling يعيد السلوك السابق (polling فقط)
+SOCKETIO_TRANSPORTS = [
+    transport.strip() for transport in os.environ.get('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',')
+    if transport.strip()
+]
+if 'websocket' in SOCKETIO_TRANSPORTS:
+    try:
+        import simple_websocket  # noqa: F401
+    except ImportError:
+        logger.warning("simple-websocket is not installed - Socket.IO falls back to polling only")
+        SOCKETIO_TRANSPORTS = [transport for transport in SOCKETIO_TRANSPORTS if transport != 'websocket'] or ['polling']
+
 socketio = SocketIO(
     app, 
     cors_allowed_origins="*",
@@ -47,8 +71,8 @@ socketio = SocketIO(
     ping_interval=10,
     logger=False, 
     engineio_logger=False,
-    allow_upgrades=False,
-    transports=['polling']
+    allow_upgrades='websocket' in SOCKETIO_TRANSPORTS,
+    transports=SOCKETIO_TRANSPORTS
 )
 
 # إعدادات النظام
@@ -152,6 +176,9 @@ except (ValueError, TypeError):
 if not API_ID or not API_HASH:
     logger.warning("⚠️ لم يتم إعداد TELEGRAM_API_ID و TELEGRAM_API_HASH - وظائف التليجرام لن تعمل")
 
+# المنطقة الزمنية الافتراضية للإرسال المجدول بوقت محدد أو cron (مثل Asia/Riyadh)
+SCHEDULE_TIMEZONE = os.environ.get('SCHEDULE_TIMEZONE', 'UTC')
+
 # نظام الروابط المؤقتة
 TEMP_LINKS = {}
 TEMP_LINKS_LOCK = Lock()
@@ -198,17 +225,213 @@ def get_temp_link_info(token):
     with TEMP_LINKS_LOCK:
         return TEMP_LINKS.get(token, None)
 
+# =========================== 
+# تجميع رسائل السجل قبل إرسالها للواجهة
+# ===========================
+LOG_BATCH_INTERVAL = int(os.environ.get('LOG_BATCH_INTERVAL_MS', '250')) / 1000
+LOG_BATCH_MAX_LINES = int(os.environ.get('LOG_BATCH_MAX_LINES', '50'))
+LOG_BACKLOG_LIMIT = int(os.environ.get('LOG_BACKLOG_LIMIT', '500'))
+
+class LogBuffer:
+    """يجمع رسائل السجل لكل غرفة ويرسلها كحدث log_batch واحد
+
+    الدفعة تُرسل بعد interval ثانية من أول رسالة فيها أو فور وصولها max_lines.
+    إذا تراكم لغرفة أكثر من backlog_limit رسالة تُحذف الأقدم ويُرسل عددها في dropped.
+    """
+
+    def __init__(self, interval=LOG_BATCH_INTERVAL, max_lines=LOG_BATCH_MAX_LINES, backlog_limit=LOG_BACKLOG_LIMIT):
+        self.interval = interval
+        self.max_lines = max(1, max_lines)
+        self.backlog_limit = max(self.max_lines, backlog_limit)
+        self._rooms = {}     # room -> deque من الرسائل
+        self._dropped = {}   # room -> عدد الرسائل المحذوفة منذ آخر دفعة
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'lines': 0, 'batches': 0, 'dropped': 0}
+
+    def start(self):
+        with self._cond:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._loop, name="log-buffer", daemon=True)
+                self._thread.start()
+
+    def add(self, room, message):
+        """إضافة رسالة لسجل الغرفة"""
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            lines = self._rooms.setdefault(room, deque())
+            if len(lines) >= self.backlog_limit:
+                lines.popleft()
+                self._pending -= 1
+                self._dropped[room] = self._dropped.get(room, 0) + 1
+                self.stats['dropped'] += 1
+
+            lines.append(message)
+            self._pending += 1
+            self.stats['lines'] += 1
+            if self._pending == 1 or len(lines) == self.max_lines:
+                self._cond.notify()
+
+    def _full(self):
+        return any(len(lines) >= self.max_lines for lines in self._rooms.values())
+
+    def _take(self):
+        """أخذ دفعة (حتى max_lines) من كل غرفة لديها رسائل"""
+        batches = []
+        for room, lines in list(self._rooms.items()):
+            count = min(len(lines), self.max_lines)
+            if count:
+                batches.append((room, [lines.popleft() for _ in range(count)], self._dropped.pop(room, 0)))
+                self._pending -= count
+            if not lines:
+                del self._rooms[room]
+        return batches
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # انتظار مزيد من الرسائل لنفس الدفعة ما لم تمتلئ غرفة
+                self._cond.wait_for(self._full, timeout=self.interval)
+                batches = self._take()
+                self.stats['batches'] += len(batches)
+
+            for room, lines, dropped in batches:
+                try:
+                    socketio.emit('log_batch', {"messages": lines, "dropped": dropped}, to=room)
+                except Exception as e:
+                    logger.error(f"Log batch emit error for {room}: {str(e)}")
+
+log_buffer = LogBuffer()
+
+def emit_log(room, message):
+    """إرسال سطر سجل للواجهة ضمن الدفعة التالية للغرفة"""
+    log_buffer.add(room, message)
+
 # =========================== 
 # نظام Queue للتنبيهات المحسن
 # ===========================
-class AlertQueue:
-    """نظام queue متقدم لإدارة التنبيهات"""
+ALERT_QUEUE_SIZE = int(os.environ.get('ALERT_QUEUE_SIZE', '1000'))
+# ماذا يحدث عند امتلاء القائمة:
+#   drop_oldest  حذف أقدم تنبيه من أقل أولوية (أو الجديد إذا كانت أولويته أقل من الكل)
+#   coalesce     دمج الجديد مع تنبيه منتظر لنفس المحادثة والكلمة، وإلا حذفه
+# لا توجد سياسة انتظار: add_alert تُستدعى من event loop العملاء المشترك، والانتظار فيه
+# يوقف نفس الإرسالات التي تُفرغ القائمة
+ALERT_OVERFLOW_POLICY = os.environ.get('ALERT_OVERFLOW_POLICY', 'drop_oldest')
+ALERT_OVERFLOW_POLICIES = ('drop_oldest', 'coalesce')
+
+# إرسال التنبيهات يتم كـ coroutines على event loop العملاء بدلاً من thread لكل رسالة
+ALERT_DESTINATION_CONCURRENCY = int(os.environ.get('ALERT_DESTINATION_CONCURRENCY', '2'))  # لكل وجهة (محفوظات حساب / Admin)
+ALERT_MAX_IN_FLIGHT = int(os.environ.get('ALERT_MAX_IN_FLIGHT', '50'))  # بعدها يتوقف سحب التنبيهات من القائمة
+
+# مجموعة Admin التي تصلها نسخة من كل تنبيه
+ADMIN_GROUP = "https://t.me/+FRhxJ_9OV-4zZGRk"
+ADMIN_INVITE_HASH = "FRhxJ_9OV-4zZGRk"
+
+# وضع الملخص: تجميع التنبيهات لكل وجهة خلال نافذة زمنية وإرسالها كرسالة HTML واحدة
+ALERT_DIGEST_DEFAULT_WINDOW = 60
+ALERT_DIGEST_MIN_WINDOW = 10
+TELEGRAM_MESSAGE_LIMIT = 4096
+DIGEST_RESERVED_LENGTH = 200  # للعنوان والتذييل
+
+# نفس الرسالة قد تصل لعدة حسابات في نفس المجموعة - تُرسل لمجموعة Admin من أول حساب فقط
+ALERT_DEDUP_TTL = int(os.environ.get('ALERT_DEDUP_TTL', '600'))
+ALERT_DEDUP_MAX_SIZE = int(os.environ.get('ALERT_DEDUP_MAX_SIZE', '10000'))
+
+GENERIC_ALERT_KEYWORD = "رسالة جديدة"
+ALERT_PRIORITY_KEYWORD = 0   # تطابق كلمة مراقبة - يُعالج أولاً
+ALERT_PRIORITY_GENERIC = 1   # "رسالة جديدة" عند عدم وجود كلمات مراقبة
+
+class AlertDedup:
+    """فهرس مشترك بين الحسابات للتنبيهات المُرسلة (محدود الحجم والمدة)"""
+
+    def __init__(self, ttl=ALERT_DEDUP_TTL, max_size=ALERT_DEDUP_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = OrderedDict()  # المفتاح -> وقت الانتهاء
+        self._lock = Lock()
+
+    def first(self, key):
+        """True إذا كانت هذه أول مرة يُرى فيها المفتاح خلال المدة - ويُحجز حتى يُلغى بـ forget عند فشل الإرسال"""
+        now = time.monotonic()
+        with self._lock:
+            # حذف المنتهية من البداية (الأقدم أولاً)
+            while self._seen and next(iter(self._seen.values())) <= now:
+                self._seen.popitem(last=False)
+
+            if key in self._seen:
+                return False
+
+            self._seen[key] = now + self.ttl
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return True
+
+    def forget(self, keys):
+        """إلغاء حجز مفاتيح لم يُرسل تنبيهها حتى يرسله حساب آخر"""
+        with self._lock:
+            for key in keys:
+                self._seen.pop(key, None)
+
+    def __len__(self):
+        return len(self._seen)
 
-    def __init__(self):
-        self.queue = queue.Queue()
+class AlertQueue:
+    """نظام queue متقدم لإدارة التنبيهات - محدود الحجم ومرتب حسب الأولوية
+
+    مسار التنبيه الوحيد:
+        1. المطابقة: _handle_new_message يحدد الكلمة المطابقة
+        2. الإثراء: _trigger_keyword_alert يضيف معلومات المحادثة والمرسل ثم add_alert
+        3. التوزيع: كل وجهة مسجلة (sink) تُستدعى مرة واحدة لكل تنبيه
+
+    الوجهة دالة handler(user_id, alert_data, digest_window) تُرجع None إذا انتهت
+    (أو أُضيف التنبيه للملخص)، أو (client_manager, coroutine) ليُنفذ الإرسال على
+    event loop ذلك الحساب ويُقاس زمنه حتى الاكتمال.
+    """
+
+    def __init__(self, maxsize=ALERT_QUEUE_SIZE, overflow_policy=ALERT_OVERFLOW_POLICY):
+        if overflow_policy not in ALERT_OVERFLOW_POLICIES:
+            logger.warning(f"Unknown alert overflow policy '{overflow_policy}', using drop_oldest")
+            overflow_policy = 'drop_oldest'
+
+        self.maxsize = max(1, maxsize)
+        self.overflow_policy = overflow_policy
+        self._heap = []          # (الأولوية، الترتيب، التنبيه)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.counters = {'enqueued': 0, 'processed': 0, 'dropped': 0, 'coalesced': 0, 'deduplicated': 0, 'max_depth': 0}
+        self._in_flight = threading.BoundedSemaphore(ALERT_MAX_IN_FLIGHT)
+        self._limits = {}        # الوجهة -> asyncio.Semaphore (تُنشأ داخل event loop)
+        self._digests = {}       # الوجهة -> الملخص قيد التجميع (يُعدّل داخل event loop فقط)
+        self.admin_dedup = AlertDedup()
+        self.sinks = OrderedDict()
+        self.sink_metrics = {}
+        self.register_sink('ui', self._send_to_ui)
+        self.register_sink('saved_messages', self._send_to_saved_messages)
+        self.register_sink('admin_group', self._send_to_admin_group)
         self.running = False
         self.thread = None
 
+    def register_sink(self, name, handler):
+        """إضافة وجهة تنبيهات جديدة - تُستدعى بالترتيب بعد الوجهات المسجلة سابقاً"""
+        self.sinks[name] = handler
+        self.sink_metrics[name] = {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0}
+
+    def _record_sink(self, name, started, error=None):
+        """تسجيل زمن وجهة واحدة منذ started (perf_counter)"""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            metrics = self.sink_metrics[name]
+            metrics['calls'] += 1
+            metrics['total_ms'] += elapsed_ms
+            metrics['max_ms'] = max(metrics['max_ms'], elapsed_ms)
+            metrics['last_ms'] = elapsed_ms
+            if error is not None:
+                metrics['errors'] += 1
+
     def start(self):
         """بدء معالج التنبيهات"""
         if not self.running:
@@ -220,31 +443,136 @@ class AlertQueue:
     def stop(self):
         """إيقاف معالج التنبيهات"""
         self.running = False
+        with self._cond:
+            self._cond.notify_all()
         if self.thread:
             self.thread.join(timeout=5)
 
     def add_alert(self, user_id, alert_data):
-        """إضافة تنبيه جديد للقائمة"""
+        """إضافة تنبيه جديد للقائمة - يُرجع False إذا حُذف بسبب الامتلاء"""
+        if alert_data.get('keyword') == GENERIC_ALERT_KEYWORD:
+            priority = ALERT_PRIORITY_GENERIC
+        else:
+            priority = ALERT_PRIORITY_KEYWORD
+
+        alert = {
+            'user_id': user_id,
+            'alert_data': alert_data,
+            'timestamp': time.time()
+        }
+
+        with self._cond:
+            if len(self._heap) >= self.maxsize:
+                if self.overflow_policy == 'coalesce' and self._coalesce(alert):
+                    return True
+                if not self._make_room(priority):
+                    self.counters['dropped'] += 1
+                    logger.warning(f"Alert queue full for user {user_id} - alert dropped ({self.overflow_policy})")
+                    return False
+
+            heapq.heappush(self._heap, (priority, next(self._seq), alert))
+            self.counters['enqueued'] += 1
+            self.counters['max_depth'] = max(self.counters['max_depth'], len(self._heap))
+            self._cond.notify_all()
+            return True
+
+    def _coalesce(self, alert):
+        """دمج التنبيه مع تنبيه منتظر لنفس المستخدم والمحادثة والكلمة"""
+        alert_data = alert['alert_data']
+        key = (alert['user_id'], alert_data.get('chat_id'), alert_data.get('keyword'))
+        for _, _, queued in self._heap:
+            queued_data = queued['alert_data']
+            if (queued['user_id'], queued_data.get('chat_id'), queued_data.get('keyword')) == key:
+                queued_data['coalesced'] = queued_data.get('coalesced', 0) + 1
+                self.counters['coalesced'] += 1
+                return True
+        return False
+
+    def _make_room(self, priority):
+        """تطبيق سياسة الامتلاء - True إذا أصبح هناك مكان للتنبيه الجديد"""
+        # الضحية هي الأقدم من أقل أولوية
+        victim_index = max(range(len(self._heap)), key=lambda i: (self._heap[i][0], -self._heap[i][1]))
+        victim_priority = self._heap[victim_index][0]
+        if victim_priority < priority:
+            return False
+        if self.overflow_policy == 'coalesce' and victim_priority == priority:
+            # coalesce لا يحذف تنبيهاً منتظراً إلا لصالح تنبيه أعلى أولوية منه
+            return False
+
+        self._heap[victim_index] = self._heap[-1]
+        self._heap.pop()
+        heapq.heapify(self._heap)
+        self.counters['dropped'] += 1
+        return True
+
+    def stats(self):
+        """عدادات القائمة الحالية"""
+        with self._cond:
+            depth_by_priority = {'keyword': 0, 'generic': 0}
+            for priority, _, _ in self._heap:
+                depth_by_priority['keyword' if priority == ALERT_PRIORITY_KEYWORD else 'generic'] += 1
+            return {
+                **self.counters,
+                'depth': len(self._heap),
+                'depth_by_priority': depth_by_priority,
+                'dedup_size': len(self.admin_dedup),
+                'sinks': {
+                    name: {
+                        'calls': metrics['calls'],
+                        'errors': metrics['errors'],
+                        'avg_ms': round(metrics['total_ms'] / metrics['calls'], 2) if metrics['calls'] else 0.0,
+                        'max_ms': round(metrics['max_ms'], 2),
+                        'last_ms': round(metrics['last_ms'], 2)
+                    }
+                    for name, metrics in self.sink_metrics.items()
+                },
+                'maxsize': self.maxsize,
+                'overflow_policy': self.overflow_policy
+            }
+
+    def _destination_limit(self, destination):
+        """حد التوازي لوجهة واحدة - يُستدعى من داخل event loop"""
+        limit = self._limits.get(destination)
+        if limit is None:
+            limit = self._limits[destination] = asyncio.Semaphore(ALERT_DESTINATION_CONCURRENCY)
+        return limit
+
+    def _submit(self, client_manager, coro, on_complete=None):
+        """جدولة إرسال على event loop العميل - ينتظر إذا وصل عدد الإرسالات الجارية للحد"""
+        self._in_flight.acquire()
         try:
-            self.queue.put({
-                'user_id': user_id,
-                'alert_data': alert_data,
-                'timestamp': time.time()
-            }, timeout=1)
-        except queue.Full:
-            logger.warning(f"Alert queue full for user {user_id}")
+            future = client_manager.submit_coroutine(coro, timeout=120)
+        except Exception:
+            self._in_flight.release()
+            raise
+
+        def on_done(done_future):
+            self._in_flight.release()
+            error = None
+            if not done_future.cancelled() and done_future.exception():
+                error = done_future.exception()
+                logger.error(f"❌ Alert delivery failed: {str(error)}")
+            if on_complete:
+                on_complete(error)
+
+        future.add_done_callback(on_done)
 
     def _process_alerts(self):
-        """معالجة التنبيهات بشكل مستمر"""
+        """معالجة التنبيهات بشكل مستمر - الأعلى أولوية ثم الأقدم"""
         while self.running:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._heap or not self.running, timeout=1) or not self._heap:
+                    continue
+                _, _, alert = heapq.heappop(self._heap)
+                self._cond.notify_all()
+
             try:
-                alert = self.queue.get(timeout=1)
                 self._send_alert(alert)
-                self.queue.task_done()
-            except queue.Empty:
-                continue
             except Exception as e:
                 logger.error(f"Error processing alert: {str(e)}")
+            finally:
+                with self._cond:
+                    self.counters['processed'] += 1
 
     def _send_alert(self, alert):
         """إرسال التنبيه للمستخدم"""
@@ -252,29 +580,68 @@ class AlertQueue:
         alert_data = alert['alert_data']
 
         try:
-            # إرسال للواجهة
-            socketio.emit('new_alert', alert_data, to=user_id)
-            socketio.emit('log_update', {
-                "message": f"🚨 تنبيه فوري: '{alert_data['keyword']}' في {alert_data['group']}"
-            }, to=user_id)
+            # None = إرسال فوري، وإلا مدة تجميع الملخص بالثواني
+            digest_window = self._digest_window(user_id, alert_data)
+        except Exception as e:
+            logger.error(f"Failed to read digest settings for user {user_id}: {str(e)}")
+            digest_window = None
 
-            # إرسال للرسائل المحفوظة
-            self._send_to_saved_messages(user_id, alert_data)
+        for name, handler in list(self.sinks.items()):
+            started = time.perf_counter()
+            try:
+                delivery = handler(user_id, alert_data, digest_window)
+            except Exception as e:
+                logger.error(f"Alert sink {name} failed for user {user_id}: {str(e)}")
+                self._record_sink(name, started, e)
+                continue
 
-            # إرسال نسخة لمجموعة Admin
-            self._send_to_admin_group(user_id, alert_data)
+            if delivery is None:
+                self._record_sink(name, started)
+                continue
 
-        except Exception as e:
-            logger.error(f"Failed to send alert for user {user_id}: {str(e)}")
+            client_manager, coro = delivery
+            try:
+                self._submit(
+                    client_manager, coro,
+                    on_complete=lambda error, name=name, started=started: self._record_sink(name, started, error)
+                )
+            except Exception as e:
+                logger.error(f"Alert sink {name} could not be scheduled for user {user_id}: {str(e)}")
+                self._record_sink(name, started, e)
+
+    def _send_to_ui(self, user_id, alert_data, digest_window=None):
+        """إرسال التنبيه للواجهة - فوري دائماً"""
+        socketio.emit('new_alert', alert_data, to=user_id)
+        coalesced = alert_data.get('coalesced', 0)
+        coalesced_note = f" (+{coalesced} مشابهة)" if coalesced else ""
+        sender_note = f" من {alert_data['sender']}" if alert_data.get('sender') else ""
+        emit_log(user_id, f"🚨 تنبيه فوري: '{alert_data['keyword']}' في {alert_data['group']}{sender_note}{coalesced_note}")
+
+    def _digest_window(self, user_id, alert_data):
+        """مدة تجميع الملخص حسب إعدادات المستخدم - None للكلمات العاجلة أو عند تعطيل الملخص"""
+        with USERS_LOCK:
+            settings = USERS.get(user_id, {}).get('settings', {})
+            if not settings.get('alert_digest'):
+                return None
+            urgent = {keyword.strip().lower() for keyword in settings.get('alert_urgent_keywords', [])}
+            window = settings.get('alert_digest_window', ALERT_DIGEST_DEFAULT_WINDOW)
 
-    def _send_to_saved_messages(self, user_id, alert_data):
+        if str(alert_data.get('keyword', '')).strip().lower() in urgent:
+            return None
+        return max(ALERT_DIGEST_MIN_WINDOW, int(window or ALERT_DIGEST_DEFAULT_WINDOW))
+
+    def _send_to_saved_messages(self, user_id, alert_data, digest_window=None):
         """إرسال التنبيه للرسائل المحفوظة"""
-        try:
-            with USERS_LOCK:
-                if user_id in USERS:
-                    client_manager = USERS[user_id].get('client_manager')
-                    if client_manager and client_manager.client:
-                        notification_msg = f"""🚨 تنبيه فوري - مراقبة شاملة للحساب
+        with USERS_LOCK:
+            client_manager = USERS.get(user_id, {}).get('client_manager')
+        if not client_manager or not client_manager.client:
+            return
+
+        if digest_window:
+            self._add_to_digest(('saved', user_id), client_manager, self._digest_entry(alert_data), digest_window)
+            return
+
+        notification_msg = f"""🚨 تنبيه فوري - مراقبة شاملة للحساب
 
 📝 الكلمة المراقبة: {alert_data['keyword']}
 📊 المصدر: {alert_data['group']}
@@ -287,22 +654,12 @@ class AlertQueue:
 
 --- تنبيه فوري من المراقبة الشاملة اللحظية لكامل الحساب"""
 
-                        # تشغيل في thread منفصل لضمان عدم التأخير
-                        def send_alert_async():
-                            try:
-                                if hasattr(client_manager, 'run_coroutine'):
-                                    client_manager.run_coroutine(
-                                        client_manager.client.send_message('me', notification_msg)
-                                    )
-                                    logger.info(f"✅ Alert sent to saved messages for user {user_id}")
-                            except Exception as send_error:
-                                logger.error(f"❌ Failed to send alert message: {str(send_error)}")
-
-                        # تشغيل في thread منفصل
-                        threading.Thread(target=send_alert_async, daemon=True).start()
+        async def send():
+            async with self._destination_limit(('saved', user_id)):
+                await client_manager.pacing.call('send', lambda: client_manager.client.send_message('me', notification_msg))
+            logger.info(f"✅ Alert sent to saved messages for user {user_id}")
 
-        except Exception as e:
-            logger.error(f"Failed to send to saved messages: {str(e)}")
+        return client_manager, send()
 
     def _escape_html(self, text):
         """تهريب نص HTML لتجنب كسر التنسيق"""
@@ -311,66 +668,90 @@ class AlertQueue:
         text = str(text) if text is not None else ""
         return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
-    def _send_to_admin_group(self, user_id, alert_data):
+    def _alert_links(self, alert_data):
+        """روابط HTML حية للمصدر والمرسل والرسالة الأصلية"""
+        # استخراج معلومات المجموعة والرسالة مع التحقق من النوع
+        group_name = alert_data.get('group', 'غير معروف') or 'غير معروف'
+        message_id = alert_data.get('message_id', '') or ''
+        chat_id = alert_data.get('chat_id', '') or ''
+        sender_name = alert_data.get('sender', 'غير معروف') or 'غير معروف'
+
+        # إنشاء روابط حية بشكل آمن
+        # رابط المجموعة
+        group_username = alert_data.get('group_username')
+        if group_username and str(group_username).strip():
+            # إزالة @ إذا كانت موجودة
+            clean_username = str(group_username)[1:] if str(group_username).startswith('@') else str(group_username)
+            group_link = f"https://t.me/{clean_username}"
+            group_display = f'<a href="{group_link}">{self._escape_html(group_name)}</a>'
+        else:
+            group_display = self._escape_html(group_name)
+
+        # رابط الرسالة الأصلية
+        message_link = None
+        if chat_id and message_id:
+            if group_username:
+                # مجموعة عامة
+                clean_username = group_username[1:] if group_username.startswith('@') else group_username
+                message_link = f"https://t.me/{clean_username}/{message_id}"
+            elif str(chat_id).startswith('-100'):
+                # قناة/مجموعة خاصة
+                channel_id = str(chat_id)[4:]
+                message_link = f"https://t.me/c/{channel_id}/{message_id}"
+
+        if message_link:
+            message_display = f'<a href="{message_link}">اضغط للانتقال</a>'
+        else:
+            message_display = "رسالة خاصة"
+
+        # رابط المرسل
+        sender_username = alert_data.get('sender_username')
+        if sender_username and str(sender_username).strip():
+            clean_sender = str(sender_username)[1:] if str(sender_username).startswith('@') else str(sender_username)
+            sender_link = f"https://t.me/{clean_sender}"
+            sender_display = f'<a href="{sender_link}">{self._escape_html(sender_name)}</a>'
+        else:
+            sender_display = self._escape_html(sender_name)
+
+        return group_display, sender_display, message_display
+
+    def _admin_dedup_key(self, alert_data):
+        """مفتاح التنبيه المشترك بين الحسابات في مجموعة Admin أو None
+
+        معرفات الرسائل مشتركة بين الحسابات في القنوات والمجموعات الكبيرة فقط،
+        أما في المجموعات العادية والمحادثات الخاصة فهي خاصة بكل حساب فلا تُقارن.
+        """
+        if not alert_data.get('is_channel'):
+            return None
+        chat_id = alert_data.get('chat_id')
+        message_id = alert_data.get('message_id')
+        if not chat_id or not message_id:
+            return None
+        return (str(chat_id), message_id, alert_data.get('keyword', ''))
+
+    def _send_to_admin_group(self, user_id, alert_data, digest_window=None):
         """إرسال نسخة من التنبيه لمجموعة Admin مع روابط حية"""
-        try:
-            # رابط مجموعة Admin
-            ADMIN_GROUP = "https://t.me/+FRhxJ_9OV-4zZGRk"
-
-            # الحصول على اسم المستخدم
-            user_name = PREDEFINED_USERS.get(user_id, {}).get('name', user_id)
-
-            # استخراج معلومات المجموعة والرسالة مع التحقق من النوع
-            group_name = alert_data.get('group', 'غير معروف') or 'غير معروف'
-            message_id = alert_data.get('message_id', '') or ''
-            chat_id = alert_data.get('chat_id', '') or ''
-            sender_name = alert_data.get('sender', 'غير معروف') or 'غير معروف'
-            sender_id = alert_data.get('sender_id', '') or ''
-            keyword = alert_data.get('keyword', '') or ''
-            message_text = (alert_data.get('message', '') or '')[:300]
-
-            # إنشاء روابط حية بشكل آمن
-            # رابط المجموعة
-            group_username = alert_data.get('group_username')
-            if group_username and str(group_username).strip():
-                # إزالة @ إذا كانت موجودة
-                clean_username = str(group_username)[1:] if str(group_username).startswith('@') else str(group_username)
-                group_link = f"https://t.me/{clean_username}"
-                group_display = f'<a href="{group_link}">{self._escape_html(group_name)}</a>'
-            else:
-                group_display = self._escape_html(group_name)
-
-            # رابط الرسالة الأصلية
-            message_link = None
-            if chat_id and message_id:
-                if group_username:
-                    # مجموعة عامة
-                    clean_username = group_username[1:] if group_username.startswith('@') else group_username
-                    message_link = f"https://t.me/{clean_username}/{message_id}"
-                elif str(chat_id).startswith('-100'):
-                    # قناة/مجموعة خاصة
-                    channel_id = str(chat_id)[4:]
-                    message_link = f"https://t.me/c/{channel_id}/{message_id}"
-
-            if message_link:
-                message_display = f'<a href="{message_link}">اضغط للانتقال</a>'
-            else:
-                message_display = "رسالة خاصة"
-
-            # رابط المرسل
-            sender_username = alert_data.get('sender_username')
-            if sender_username and str(sender_username).strip():
-                clean_sender = str(sender_username)[1:] if str(sender_username).startswith('@') else str(sender_username)
-                sender_link = f"https://t.me/{clean_sender}"
-                sender_display = f'<a href="{sender_link}">{self._escape_html(sender_name)}</a>'
-            else:
-                sender_display = self._escape_html(sender_name)
+        # المفتاح يُحجز الآن حتى لا يرسل حساب آخر نفس التنبيه أثناء الإرسال، ويُلغى إذا فشل
+        dedup_key = self._admin_dedup_key(alert_data)
+        if dedup_key is not None and not self.admin_dedup.first(dedup_key):
+            with self._cond:
+                self.counters['deduplicated'] += 1
+            logger.debug(f"Duplicate admin alert skipped for {user_id}: {alert_data.get('chat_id')}/{alert_data.get('message_id')}")
+            return
+        dedup_keys = [dedup_key] if dedup_key is not None else []
+
+        # الحصول على اسم المستخدم
+        user_name = PREDEFINED_USERS.get(user_id, {}).get('name', user_id)
+        keyword = alert_data.get('keyword', '') or ''
+        message_text = (alert_data.get('message', '') or '')[:300]
+
+        group_display, sender_display, message_display = self._alert_links(alert_data)
 
-            # تهريب نص الرسالة
-            safe_message_text = self._escape_html(message_text)
+        # تهريب نص الرسالة
+        safe_message_text = self._escape_html(message_text)
 
-            # بناء رسالة التنبيه لـ Admin بصيغة HTML
-            admin_notification = f"""🚨 <b>تنبيه جديد من نظام المراقبة</b>
+        # بناء رسالة التنبيه لـ Admin بصيغة HTML
+        admin_notification = f"""🚨 <b>تنبيه جديد من نظام المراقبة</b>
 
 👤 <b>المستخدم:</b> {self._escape_html(user_name)}
 🔑 <b>الكلمة المراقبة:</b> {self._escape_html(keyword)}
@@ -387,84 +768,152 @@ class AlertQueue:
 ---
 📱 تنبيه تلقائي من مركز سرعة انجاز"""
 
-            # البحث عن عميل متصل لإرسال الرسالة
-            with USERS_LOCK:
-                # محاولة الإرسال من حساب المستخدم الحالي
-                if user_id in USERS:
-                    client_manager = USERS[user_id].get('client_manager')
+        # محاولة الإرسال من حساب المستخدم الحالي ثم من حساب آخر متصل إذا فشل
+        with USERS_LOCK:
+            client_manager = USERS.get(user_id, {}).get('client_manager')
+        if not client_manager or not client_manager.client:
+            client_manager = self._other_client_manager(user_id)
+        if not client_manager:
+            self.admin_dedup.forget(dedup_keys)
+            return
+
+        if digest_window:
+            self._add_to_digest(('admin',), client_manager, self._digest_entry(alert_data, user_name), digest_window, dedup_keys)
+            return
+
+        return client_manager, self._deliver_admin(client_manager, admin_notification, dedup_keys)
+
+    async def _deliver_admin(self, client_manager, message, dedup_keys=()):
+        """إرسال لمجموعة Admin من الحساب المحدد ثم من حساب آخر إذا فشل"""
+        delivered = False
+        try:
+            try:
+                async with self._destination_limit(('admin',)):
+                    await self._send_admin_message(client_manager, message)
+                delivered = True
+                logger.info(f"✅ Alert sent to Admin group from user {client_manager.user_id}")
+            except Exception as send_error:
+                logger.error(f"❌ Failed to send to Admin group: {str(send_error)}")
+                delivered = await self._try_send_from_other_user(message, client_manager.user_id)
+                if not delivered:
+                    raise
+        finally:
+            # التنبيه لم يصل (فشل أو انتهت المهلة) - يُسمح لحساب آخر بإرساله
+            if not delivered:
+                self.admin_dedup.forget(dedup_keys)
+
+    def _digest_entry(self, alert_data, user_name=None):
+        """سطر تنبيه واحد داخل الملخص بصيغة HTML"""
+        group_display, sender_display, message_display = self._alert_links(alert_data)
+        message_text = alert_data.get('message', '') or ''
+        safe_message_text = self._escape_html(message_text[:200]) + ('...' if len(message_text) > 200 else '')
+        user_part = f"👤 {self._escape_html(user_name)} | " if user_name else ""
+        coalesced = alert_data.get('coalesced', 0)
+        coalesced_part = f" (+{coalesced})" if coalesced else ""
+
+        return (f"🔑 <b>{self._escape_html(alert_data.get('keyword', ''))}</b>{coalesced_part} | 📊 {group_display}"
+                f" | ⏰ {alert_data.get('message_time', '')}\n"
+                f"{user_part}👥 {sender_display} | 🔗 {message_display}\n"
+                f"💬 {safe_message_text}")
+
+    def _add_to_digest(self, destination, client_manager, entry, window, dedup_keys=()):
+        """إضافة تنبيه لملخص الوجهة - التعديل يتم داخل event loop"""
+        client_manager.loop.call_soon_threadsafe(self._digest_add, destination, client_manager, entry, window, dedup_keys)
+
+    def _digest_add(self, destination, client_manager, entry, window, dedup_keys=()):
+        digest = self._digests.get(destination)
+
+        # الملخص لا يتجاوز حد طول رسالة التليجرام - يُرسل الحالي ويبدأ ملخص جديد
+        if digest and digest['length'] + len(entry) > TELEGRAM_MESSAGE_LIMIT - DIGEST_RESERVED_LENGTH:
+            self._flush_digest(destination)
+            digest = None
+
+        if digest is None:
+            digest = self._digests[destination] = {
+                'entries': [],
+                'length': 0,
+                'dedup_keys': [],
+                'client_manager': client_manager,
+                'timer': client_manager.loop.call_later(window, self._flush_digest, destination)
+            }
+
+        digest['entries'].append(entry)
+        digest['dedup_keys'].extend(dedup_keys)
+        digest['length'] += len(entry) + 2
+
+    def _flush_digest(self, destination):
+        """إرسال الملخص المتراكم للوجهة كرسالة واحدة"""
+        digest = self._digests.pop(destination, None)
+        if not digest or not digest['entries']:
+            return
+        digest['timer'].cancel()
+
+        entries = digest['entries']
+        message = f"🗂 <b>ملخص التنبيهات ({len(entries)})</b>\n\n" + "\n\n".join(entries)
+        client_manager = digest['client_manager']
+
+        if destination[0] == 'admin':
+            message += "\n\n---\n📱 تنبيه تلقائي من مركز سرعة انجاز"
+            delivery = self._deliver_admin(client_manager, message, digest['dedup_keys'])
+        else:
+            delivery = self._deliver_saved_digest(client_manager, message)
+
+        def on_done(task):
+            if not task.cancelled() and task.exception():
+                logger.error(f"❌ Digest delivery failed for {destination}: {str(task.exception())}")
+
+        asyncio.ensure_future(delivery).add_done_callback(on_done)
+
+    async def _deliver_saved_digest(self, client_manager, message):
+        async with self._destination_limit(('saved', client_manager.user_id)):
+            await client_manager.pacing.call('send', lambda: client_manager.client.send_message(
+                'me', message, parse_mode='html', link_preview=False
+            ))
+        logger.info(f"✅ Alert digest sent to saved messages for user {client_manager.user_id}")
+
+    async def _send_admin_message(self, client_manager, message):
+        """إرسال رسالة HTML لمجموعة Admin من حساب محدد"""
+        for attempt in range(2):
+            peer = await client_manager.get_admin_peer()
+            try:
+                await client_manager.pacing.call('send', lambda: client_manager.client.send_message(
+                    peer,
+                    message,
+                    parse_mode='html',
+                    link_preview=False
+                ))
+                return
+            except ADMIN_PEER_REFRESH_ERRORS as e:
+                # تم إخراج الحساب أو تغيرت الصلاحيات - إعادة الانضمام مرة واحدة
+                client_manager.invalidate_admin_peer()
+                if attempt:
+                    raise
+                logger.warning(f"Admin group peer refresh for {client_manager.user_id}: {str(e)}")
+
+    def _other_client_manager(self, exclude_user_id):
+        """أول حساب آخر متصل"""
+        with USERS_LOCK:
+            for uid, user_data in USERS.items():
+                if uid != exclude_user_id:
+                    client_manager = user_data.get('client_manager')
                     if client_manager and client_manager.client:
-                        def send_to_admin_async():
-                            try:
-                                if hasattr(client_manager, 'run_coroutine'):
-                                    # محاولة الانضمام للمجموعة أولاً إذا لم يكن عضواً
-                                    try:
-                                        from telethon.tl.functions.messages import ImportChatInviteRequest
-                                        invite_hash = "FRhxJ_9OV-4zZGRk"  # Hash من الرابط
-
-                                        # محاولة الانضمام (سيتم تجاهله إذا كان عضواً)
-                                        try:
-                                            client_manager.run_coroutine(
-                                                client_manager.client(ImportChatInviteRequest(invite_hash))
-                                            )
-                                            logger.info(f"✅ Joined Admin group for user {user_id}")
-                                        except Exception as join_error:
-                                            # قد يكون عضواً بالفعل - نتابع الإرسال
-                                            if "INVITE_HASH_INVALID" not in str(join_error):
-                                                logger.debug(f"Join attempt: {str(join_error)}")
-                                    except Exception as import_error:
-                                        logger.debug(f"Import error: {str(import_error)}")
-
-                                    # إرسال الرسالة مع parse_mode='html'
-                                    client_manager.run_coroutine(
-                                        client_manager.client.send_message(
-                                            ADMIN_GROUP,
-                                            admin_notification,
-                                            parse_mode='html',
-                                            link_preview=False
-                                        )
-                                    )
-                                    logger.info(f"✅ Alert sent to Admin group from user {user_id}")
-                            except Exception as send_error:
-                                logger.error(f"❌ Failed to send to Admin group: {str(send_error)}")
-                                # محاولة من مستخدم آخر إذا فشل
-                                self._try_send_from_other_user(admin_notification, user_id)
-
-                        threading.Thread(target=send_to_admin_async, daemon=True).start()
-                        return
-
-                # إذا لم يكن المستخدم الحالي متصلاً، جرب من مستخدم آخر
-                self._try_send_from_other_user(admin_notification, user_id)
+                        return client_manager
+        return None
 
-        except Exception as e:
-            logger.error(f"Failed to send alert to Admin group: {str(e)}")
+    async def _try_send_from_other_user(self, message, exclude_user_id):
+        """محاولة الإرسال من مستخدم آخر متصل - True إذا نجحت"""
+        client_manager = self._other_client_manager(exclude_user_id)
+        if not client_manager:
+            return False
 
-    def _try_send_from_other_user(self, message, exclude_user_id):
-        """محاولة الإرسال من مستخدم آخر متصل"""
         try:
-            with USERS_LOCK:
-                for uid, user_data in USERS.items():
-                    if uid != exclude_user_id:
-                        client_manager = user_data.get('client_manager')
-                        if client_manager and client_manager.client:
-                            def send_async():
-                                try:
-                                    if hasattr(client_manager, 'run_coroutine'):
-                                        client_manager.run_coroutine(
-                                            client_manager.client.send_message(
-                                                "https://t.me/+FRhxJ_9OV-4zZGRk",
-                                                message,
-                                                parse_mode='html',
-                                                link_preview=False
-                                            )
-                                        )
-                                        logger.info(f"✅ Alert sent to Admin group from backup user {uid}")
-                                except Exception as e:
-                                    logger.error(f"❌ Backup send failed from {uid}: {str(e)}")
-
-                            threading.Thread(target=send_async, daemon=True).start()
-                            return
+            async with self._destination_limit(('admin',)):
+                await self._send_admin_message(client_manager, message)
+            logger.info(f"✅ Alert sent to Admin group from backup user {client_manager.user_id}")
+            return True
         except Exception as e:
-            logger.error(f"Failed to send from backup user: {str(e)}")
+            logger.error(f"❌ Backup send failed from {client_manager.user_id}: {str(e)}")
+            return False
 
 # إنشاء نظام التنبيهات العالمي
 alert_queue = AlertQueue()
@@ -531,9 +980,486 @@ def load_all_sessions():
     logger.info(f"Loaded {session_count} sessions successfully")
     return session_count
 
+# =========================== 
+# بيئة asyncio مشتركة لجميع العملاء
+# ===========================
+class AsyncRuntime:
+    """event loop واحد في thread واحد يستضيف عملاء جميع المستخدمين كمهام"""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self._lock = Lock()
+        self._started = threading.Event()
+
+    def start(self):
+        """تشغيل الـ loop المشترك عند أول استخدام وإرجاعه"""
+        with self._lock:
+            if not (self.thread and self.thread.is_alive()):
+                self._started.clear()
+                self.thread = threading.Thread(target=self._run, name="telegram-runtime", daemon=True)
+                self.thread.start()
+                self._started.wait()
+        return self.loop
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        except Exception as e:
+            logger.error(f"Async runtime error: {str(e)}")
+
+# إنشاء بيئة asyncio المشتركة
+async_runtime = AsyncRuntime()
+
+# =========================== 
+# المُجدول المركزي للمهام الدورية
+# ===========================
+class Scheduler:
+    """thread واحد يحمل مواعيد مهام كل المستخدمين في heap وينام حتى أقرب موعد فقط
+
+    كل مهمة لها مفتاح فريد (user_id, نوع المهمة) وموعد واحد. الدالة تُنفذ في executor
+    وتُرجع موعدها التالي (time.time()) أو None لإيقافها.
+    """
+
+    def __init__(self, max_workers=8):
+        self._heap = []
+        self._entries = {}   # key -> (due, seq, callback)
+        self._running = {}   # key -> seq للمهام قيد التنفيذ
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="scheduler")
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+                self._thread.start()
+
+    def schedule(self, key, due, callback):
+        """جدولة مهمة أو تغيير موعدها إذا كانت مجدولة"""
+        self.start()
+        with self._cond:
+            self._push(key, due, callback)
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._entries.pop(key, None)
+            self._running.pop(key, None)
+
+    def cancel_user(self, user_id):
+        """إلغاء كل مهام المستخدم"""
+        with self._cond:
+            for key in [key for key in (*self._entries, *self._running) if key[0] == user_id]:
+                self._entries.pop(key, None)
+                self._running.pop(key, None)
+
+    def next_due(self, key):
+        with self._cond:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def _push(self, key, due, callback):
+        seq = next(self._seq)
+        self._entries[key] = (due, seq, callback)
+        heapq.heappush(self._heap, (due, seq, key))
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    # المواعيد الملغاة أو المُستبدلة تُحذف عند وصولها لرأس الـ heap
+                    while self._heap and self._entries.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                        heapq.heappop(self._heap)
+
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+
+                    due, seq, key = self._heap[0]
+                    delay = due - time.time()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+
+                    heapq.heappop(self._heap)
+                    _, _, callback = self._entries.pop(key)
+                    if key in self._running:
+                        # التنفيذ السابق لم ينتهِ بعد - لا تنفيذ متوازٍ لنفس المهمة
+                        self._push(key, time.time() + 1, callback)
+                        continue
+
+                    self._running[key] = seq
+                    break
+
+            self._executor.submit(self._run, key, seq, callback)
+
+    def _run(self, key, seq, callback):
+        try:
+            next_due = callback()
+        except Exception as e:
+            logger.error(f"Scheduled job {key} failed: {str(e)}")
+            next_due = None
+
+        with self._cond:
+            still_scheduled = self._running.get(key) == seq
+            if still_scheduled:
+                del self._running[key]
+            # لا إعادة جدولة إذا أُلغيت المهمة أو جُدولت من جديد أثناء تنفيذها
+            if next_due is not None and still_scheduled and key not in self._entries:
+                self._push(key, next_due, callback)
+                self._cond.notify()
+
+# إنشاء المُجدول المركزي
+scheduler = Scheduler()
+
+# =========================== 
+# سجل دائم لمواعيد الإرسال المجدول
+# ===========================
+class ScheduleStore:
+    """حفظ آخر وموعد الإرسال المجدول التالي لكل مستخدم حتى لا تضيع المواعيد أو تتكرر بعد إعادة التشغيل"""
+
+    def __init__(self):
+        # امتداد مختلف عن .json حتى لا يُقرأ كملف إعدادات في load_all_sessions
+        self.path = os.path.join(SESSIONS_DIR, "schedules.state")
+        self._entries = {}
+        self._lock = Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load schedule store {self.path}: {str(e)}")
+            self._entries = {}
+
+    def _save(self):
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not save schedule store {self.path}: {str(e)}")
+
+    def get(self, user_id):
+        with self._lock:
+            return dict(self._entries.get(user_id, {}))
+
+    def put(self, user_id, signature, next_fire, last_fire=None):
+        with self._lock:
+            entry = self._entries.setdefault(user_id, {})
+            entry['signature'] = signature
+            entry['next_fire'] = next_fire
+            if last_fire is not None:
+                entry['last_fire'] = last_fire
+            self._save()
+
+# إنشاء سجل المواعيد
+schedule_store = ScheduleStore()
+
+# =========================== 
+# ذاكرة مؤقتة لمعلومات المحادثات والمرسلين
+# ===========================
+class EntityCache:
+    """ذاكرة مؤقتة محدودة الحجم (LRU + TTL) لتجنب تكرار get_chat/get_sender"""
+
+    def __init__(self, max_size=2000, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """إرجاع القيمة المخزنة إن كانت صالحة أو None"""
+        item = self._items.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._items[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """تخزين قيمة مع حذف الأقدم عند تجاوز الحد الأقصى"""
+        self._items[key] = (value, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def stats(self):
+        """إحصائيات الذاكرة المؤقتة"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+# =========================== 
+# ذاكرة دائمة للمجموعات المحلولة (InputPeer)
+# ===========================
+INPUT_PEER_TYPES = {cls.__name__: cls for cls in (InputPeerUser, InputPeerChat, InputPeerChannel, InputPeerSelf)}
+
+# أخطاء تعني أن الهدف غير موجود فعلاً - تُخزن سلبياً لتجنب تكرار محاولة حلها
+UNRESOLVABLE_ERRORS = (ValueError, UsernameInvalidError, UsernameNotOccupiedError, InviteHashInvalidError, InviteHashExpiredError)
+
+# أخطاء إرسال تعني أن الـ InputPeer المخزن لم يعد صالحاً
+STALE_PEER_ERRORS = (ChannelPrivateError, ChannelInvalidError, PeerIdInvalidError)
+
+# أخطاء إرسال لمجموعة Admin تعني أن العضوية أو الصلاحية تغيرت - يُعاد حلها والانضمام لها
+ADMIN_PEER_REFRESH_ERRORS = (*STALE_PEER_ERRORS, ChatWriteForbiddenError, UserBannedInChannelError)
+
+PEER_CACHE_SAVE_DELAY = 5  # ثوانٍ لتجميع التغييرات المتتالية في كتابة واحدة للملف
+
+class PeerCache:
+    """ذاكرة دائمة لكل حساب تربط نص المجموعة من الإعدادات بـ InputPeer محلول"""
+
+    def __init__(self, user_id, ttl=86400, negative_ttl=1800):
+        # امتداد مختلف عن .json حتى لا يُقرأ كملف إعدادات في load_all_sessions
+        self.path = os.path.join(SESSIONS_DIR, f"{user_id}.peers")
+        # مفتاح الكتابة المؤجلة لا يبدأ بمعرف المستخدم حتى لا يُلغيه cancel_user قبل الكتابة
+        self._save_key = ('peer_cache', self.path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._dirty = False
+        self._lock = Lock()
+        self._file_lock = Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load peer cache {self.path}: {str(e)}")
+            self._entries = {}
+
+    def _save(self):
+        """جدولة الكتابة في المُجدول المركزي بدلاً من الكتابة داخل event loop (تُستدعى تحت self._lock)"""
+        if self._dirty:
+            return
+        self._dirty = True
+        scheduler.schedule(self._save_key, time.time() + PEER_CACHE_SAVE_DELAY, self.flush)
+
+    def flush(self):
+        """كتابة التغييرات المعلقة إلى الملف"""
+        with self._file_lock:
+            with self._lock:
+                if not self._dirty:
+                    return None
+                self._dirty = False
+                data = json.dumps(self._entries, ensure_ascii=False)
+
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.warning(f"Could not save peer cache {self.path}: {str(e)}")
+        return None
+
+    def get(self, target):
+        """إرجاع (peer, error) إذا كان الهدف مخزناً وصالحاً أو None"""
+        with self._lock:
+            entry = self._entries.get(target)
+            if entry:
+                ttl = self.ttl if entry.get('peer') else self.negative_ttl
+                if time.time() - entry.get('resolved_at', 0) < ttl:
+                    self.hits += 1
+                    peer_data = entry.get('peer')
+                    if not peer_data:
+                        return None, entry.get('error', 'unresolvable')
+                    peer_data = dict(peer_data)
+                    peer_cls = INPUT_PEER_TYPES[peer_data.pop('_')]
+                    return peer_cls(**peer_data), None
+
+            self.misses += 1
+            return None
+
+    def put(self, target, peer):
+        """تخزين InputPeer محلول"""
+        with self._lock:
+            self._entries[target] = {'peer': peer.to_dict(), 'resolved_at': time.time()}
+            self._save()
+
+    def put_failure(self, target, error):
+        """تخزين سلبي لهدف غير قابل للحل"""
+        with self._lock:
+            self._entries[target] = {'peer': None, 'error': error, 'resolved_at': time.time()}
+            self._save()
+
+    def invalidate(self, target):
+        """حذف هدف من الذاكرة لإعادة حله في المرة القادمة"""
+        with self._lock:
+            if self._entries.pop(target, None) is not None:
+                self._save()
+
+    def clear(self):
+        """مسح الذاكرة بالكامل - الـ access_hash خاص بكل حساب"""
+        with self._lock:
+            self._entries = {}
+            self._dirty = False
+        scheduler.cancel(self._save_key)
+
+        with self._file_lock:
+            if os.path.exists(self.path):
+                try:
+                    os.remove(self.path)
+                except Exception as e:
+                    logger.warning(f"Could not remove peer cache {self.path}: {str(e)}")
+
+    def stats(self):
+        """إحصائيات الذاكرة"""
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+# =========================== 
+# تنظيم معدل الطلبات لكل حساب
+# ===========================
+class TokenBucket:
+    """محدد معدل (token bucket) - يعمل داخل event loop العميل فقط"""
+
+    def __init__(self, rate_per_minute=30, capacity=3):
+        self.capacity = 1
+        self.configure(rate_per_minute, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    @property
+    def rate_per_minute(self):
+        return self.rate * 60
+
+    def configure(self, rate_per_minute, capacity=None):
+        """تغيير المعدل دون فقدان الرصيد الحالي"""
+        self.rate = max(float(rate_per_minute), 1.0) / 60.0
+        if capacity is not None:
+            self.capacity = max(int(capacity), 1)
+
+    def pause(self, seconds):
+        """إيقاف هذا النوع من الطلبات للمدة التي حددها التليجرام بالضبط"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # الرصيد يبدأ من الصفر بعد انتهاء المدة وليس منذ الخطأ - لا دفعة كاملة فور الاستئناف
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    def wait_time(self):
+        """الثواني المتبقية حتى انتهاء FloodWait"""
+        return max(self.paused_until - time.monotonic(), 0)
+
+    async def acquire(self):
+        """انتظار رصيد متاح لطلب واحد"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# أنواع الطلبات: (المعدل الابتدائي، الأدنى، الأعلى) بالطلب في الدقيقة
+PACING_LIMITS = {
+    'send': (30, 4, 60),
+    'join': (6, 1, 20),
+    'resolve': (60, 6, 120),
+    'search': (20, 2, 40),
+}
+PACING_INCREASE_EVERY = 10  # زيادة المعدل طلباً واحداً في الدقيقة بعد كل 10 نجاحات متتالية
+
+class PacingController:
+    """تنظيم معدل كل نوع من الطلبات لحساب واحد: مواعيد FloodWait وزيادة تدريجية وتخفيض للنصف عند الخطأ"""
+
+    def __init__(self, limits=None):
+        self.limits = {kind: list(values) for kind, values in (limits or PACING_LIMITS).items()}
+        self.buckets = {kind: TokenBucket(rate) for kind, (rate, _, _) in self.limits.items()}
+        self.streaks = {kind: 0 for kind in self.limits}
+        self.flood_waits = {kind: 0 for kind in self.limits}
+
+    def set_ceiling(self, kind, rate_per_minute):
+        """الحد الأعلى الذي يحدده المستخدم (مثل send_rate_per_minute)"""
+        limits = self.limits[kind]
+        limits[2] = max(float(rate_per_minute), limits[1])
+        bucket = self.buckets[kind]
+        if bucket.rate_per_minute > limits[2]:
+            bucket.configure(limits[2])
+
+    def wait_time(self, kind):
+        """الثواني المتبقية قبل السماح بطلبات من هذا النوع - للمستدعين الذين يفضلون إعادة الجدولة"""
+        return self.buckets[kind].wait_time()
+
+    async def acquire(self, kind):
+        await self.buckets[kind].acquire()
+
+    def record_success(self, kind):
+        """زيادة جمعية للمعدل بعد سلسلة نجاحات"""
+        self.streaks[kind] += 1
+        if self.streaks[kind] >= PACING_INCREASE_EVERY:
+            self.streaks[kind] = 0
+            bucket = self.buckets[kind]
+            bucket.configure(min(bucket.rate_per_minute + 1, self.limits[kind][2]))
+
+    def record_flood(self, kind, seconds):
+        """احترام مدة الانتظار بالضبط وتخفيض المعدل للنصف"""
+        self.streaks[kind] = 0
+        self.flood_waits[kind] += 1
+        bucket = self.buckets[kind]
+        bucket.pause(seconds)
+        bucket.configure(max(bucket.rate_per_minute / 2, self.limits[kind][1]))
+        logger.warning(f"FloodWait on {kind}: {seconds}s, pace lowered to {bucket.rate_per_minute:.1f}/min")
+
+    async def call(self, kind, coro_factory):
+        """تنفيذ طلب واحد بعد انتظار دوره وتسجيل نتيجته"""
+        await self.acquire(kind)
+        try:
+            result = await coro_factory()
+        except FloodWaitError as e:
+            # يُسجل الخطأ مرة واحدة لنوع الطلب الذي تسبب فيه (مثل resolve داخل send)
+            if getattr(e, 'paced_kind', None) is None:
+                e.paced_kind = kind
+                self.record_flood(kind, e.seconds)
+            raise
+        self.record_success(kind)
+        return result
+
+    def stats(self):
+        return {
+            kind: {
+                'rate_per_minute': round(bucket.rate_per_minute, 1),
+                'wait_seconds': round(bucket.wait_time()),
+                'flood_waits': self.flood_waits[kind]
+            }
+            for kind, bucket in self.buckets.items()
+        }
+
 # =========================== 
 # مدير التليجرام المحسن مع Event Handlers
 # ===========================
+MEMBERSHIP_TTL = 1800  # مدة صلاحية قائمة عضويات الحساب المستخدمة لتوزيع البث
+
 class TelegramClientManager:
     """مدير عملاء التليجرام المحسن مع Event Handlers"""
 
@@ -541,33 +1467,39 @@ class TelegramClientManager:
         self.user_id = user_id
         self.client = None
         self.loop = None
-        self.thread = None
-        self.stop_flag = threading.Event()
+        self.task = None
+        self.stop_event = None
         self.is_ready = threading.Event()
+        self.authorized = None  # None = غير معروف، يُحدّث عند الاتصال وعند أخطاء التصريح
+        self.authorized_checked_at = 0
         self.event_handlers_registered = False
         self.monitored_keywords = []
         self.monitored_groups = []
+        self.keyword_matcher = KeywordMatcher([])
+        self.entity_cache = EntityCache()
+        self.peer_cache = PeerCache(user_id)
+        self.pacing = PacingController()
+        self.memberships = None
+        self.memberships_at = 0
+        self._admin_peer_lock = None  # asyncio.Lock يُنشأ داخل event loop
 
     def start_client_thread(self):
-        """بدء thread منفصل للعميل"""
-        if self.thread and self.thread.is_alive():
+        """تشغيل العميل كمهمة داخل بيئة asyncio المشتركة"""
+        if self.task and not self.task.done():
             return
 
-        self.stop_flag.clear()
         self.is_ready.clear()
-        self.thread = threading.Thread(target=self._run_client_loop, daemon=True)
-        self.thread.start()
+        self.stop_event = asyncio.Event()
+        self.loop = async_runtime.start()
+        self.task = asyncio.run_coroutine_threadsafe(self._client_main(), self.loop)
 
         # انتظار حتى يصبح العميل جاهزاً
         if not self.is_ready.wait(timeout=30):
             raise Exception("Client initialization timeout")
 
-    def _run_client_loop(self):
-        """تشغيل event loop للعميل"""
+    async def _client_main(self):
+        """الوظيفة الرئيسية للعميل"""
         try:
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-
             session_file = os.path.join(SESSIONS_DIR, f"{self.user_id}_session.session")
             if API_ID and API_HASH:
                 self.client = TelegramClient(session_file, int(API_ID), API_HASH)
@@ -575,30 +1507,19 @@ class TelegramClientManager:
                 logger.error("API_ID or API_HASH not set")
                 return
 
-            self.loop.run_until_complete(self._client_main())
-
-        except Exception as e:
-            logger.error(f"Client thread error for {self.user_id}: {str(e)}")
-        finally:
-            if self.loop:
-                self.loop.close()
-
-    async def _client_main(self):
-        """الوظيفة الرئيسية للعميل"""
-        try:
-            if self.client:
-                await self.client.connect()
-                self.is_ready.set()
+            await self.client.connect()
+            await self.refresh_authorization()
+            self.is_ready.set()
 
-                # تسجيل event handlers
-                await self._register_event_handlers()
+            # تسجيل event handlers على العميل الجديد
+            self.event_handlers_registered = False
+            await self._register_event_handlers()
 
-                # الحفاظ على الاتصال
-                while not self.stop_flag.is_set():
-                    await asyncio.sleep(1)
+            # الحفاظ على الاتصال حتى إشارة الإيقاف - بدون استيقاظ دوري
+            await self.stop_event.wait()
 
         except Exception as e:
-            logger.error(f"Client main error: {str(e)}")
+            logger.error(f"Client main error for {self.user_id}: {str(e)}")
         finally:
             if self.client:
                 await self.client.disconnect()
@@ -626,67 +1547,110 @@ class TelegramClientManager:
             if not message.text:
                 return
 
-            # الحصول على معلومات المحادثة
-            chat = await event.get_chat()
-            chat_username = getattr(chat, 'username', None)
-            chat_title = getattr(chat, 'title', None)
-
-            # تحديد معرف المجموعة/المحادثة
-            group_identifier = None
-            if chat_username:
-                group_identifier = f"@{chat_username}"
-            elif chat_title:
-                group_identifier = chat_title
-            elif hasattr(chat, 'first_name'):
-                # محادثة شخصية
-                group_identifier = f"محادثة مع {chat.first_name}"
-            else:
-                group_identifier = f"محادثة {chat.id}"
-
             # ⚠️ إزالة فحص المجموعات المحددة - مراقبة شاملة لكل شيء
             # مراقبة كامل المجموعات والمحادثات بدون استثناء
 
-            # فحص الكلمات المفتاحية في كل رسالة
-            if self.monitored_keywords:  # إذا كان هناك كلمات مراقبة
-                message_lower = message.text.lower()
-                matched_keyword = None
-                
-                for keyword in self.monitored_keywords:
-                    keyword_lower = keyword.lower().strip()
-                    if keyword_lower and keyword_lower in message_lower:
-                        matched_keyword = keyword
-                        await self._trigger_keyword_alert(message, keyword, group_identifier, event)
-                        
-                        # تطبيق الرد التلقائي إذا كان مفعل
-                        await self._handle_auto_reply(event, keyword, group_identifier)
-                        break  # رد واحد فقط لكل رسالة
+            # فحص الكلمات المفتاحية أولاً على نص الرسالة فقط - أغلب الرسائل لا تطابق
+            # ولا نحتاج لها أي معلومات عن المحادثة أو المرسل
+            keyword_rules_active = bool(self.keyword_matcher)
+            if keyword_rules_active:  # إذا كان هناك قواعد مراقبة
+                # مرور واحد على النص مهما كان عدد الكلمات
+                matched_keyword = self.keyword_matcher.match(message.text)
+                if not matched_keyword:
+                    return
+            elif self.keyword_matcher.excludes(message.text):
+                return
             else:
-                # إذا لم تكن هناك كلمات محددة، راقب كل الرسائل
-                await self._trigger_keyword_alert(message, "رسالة جديدة", group_identifier, event)
+                # إذا لم تكن هناك كلمات محددة، راقب كل الرسائل (عدا كلمات الاستبعاد)
+                matched_keyword = GENERIC_ALERT_KEYWORD
+
+            # الحصول على معلومات المحادثة للرسائل المطابقة فقط (من الذاكرة المؤقتة إن وجدت)
+            chat_info = await self._get_chat_info(event)
+            group_identifier = chat_info['group_identifier']
+
+            await self._trigger_keyword_alert(message, matched_keyword, group_identifier, event)
+
+            if keyword_rules_active:
+                # تطبيق الرد التلقائي إذا كان مفعل - رد واحد فقط لكل رسالة
+                await self._handle_auto_reply(event, matched_keyword, group_identifier)
 
         except Exception as e:
             logger.error(f"Error handling new message: {str(e)}")
 
+    async def _get_chat_info(self, event):
+        """معلومات المحادثة مع معرف المجموعة المحسوب مسبقاً - طلب واحد لكل محادثة خلال مدة الصلاحية"""
+        key = ('chat', event.chat_id)
+        chat_info = self.entity_cache.get(key)
+        if chat_info is not None:
+            return chat_info
+
+        chat = await event.get_chat()
+        chat_username = getattr(chat, 'username', None)
+        chat_title = getattr(chat, 'title', None)
+        first_name = getattr(chat, 'first_name', None)
+
+        # تحديد معرف المجموعة/المحادثة
+        if chat_username:
+            group_identifier = f"@{chat_username}"
+        elif chat_title:
+            group_identifier = chat_title
+        elif hasattr(chat, 'first_name'):
+            # محادثة شخصية
+            group_identifier = f"محادثة مع {first_name}"
+        else:
+            group_identifier = f"محادثة {getattr(chat, 'id', event.chat_id)}"
+
+        chat_info = {
+            'id': str(chat.id) if chat else "",
+            'title': chat_title,
+            'username': chat_username or '',
+            'first_name': first_name,
+            'group_identifier': group_identifier
+        }
+        self.entity_cache.put(key, chat_info)
+        return chat_info
+
+    async def _get_sender_info(self, event):
+        """معلومات المرسل - طلب واحد لكل مرسل خلال مدة الصلاحية"""
+        key = ('sender', event.sender_id)
+        sender_info = self.entity_cache.get(key) if event.sender_id else None
+        if sender_info is not None:
+            return sender_info
+
+        sender_info = {
+            'id': "",
+            'name': "غير معروف",
+            'username': "",
+            'first_name': None
+        }
+        try:
+            sender = await event.get_sender()
+            if sender:
+                sender_info = {
+                    'id': str(sender.id),
+                    'name': getattr(sender, 'first_name', '') or getattr(sender, 'username', '') or str(sender.id),
+                    'username': getattr(sender, 'username', '') or '',
+                    'first_name': getattr(sender, 'first_name', None)
+                }
+        except Exception:
+            return sender_info
+
+        if event.sender_id:
+            self.entity_cache.put(key, sender_info)
+        return sender_info
+
     async def _trigger_keyword_alert(self, message, keyword, group_identifier, event):
         """تشغيل تنبيه الكلمة المفتاحية"""
         try:
-            # الحصول على معلومات المرسل
-            sender_name = "غير معروف"
-            sender_username = ""
-            sender_id = ""
-            try:
-                sender = await event.get_sender()
-                if sender:
-                    sender_name = getattr(sender, 'first_name', '') or getattr(sender, 'username', '') or str(sender.id)
-                    sender_username = getattr(sender, 'username', '')
-                    sender_id = str(sender.id) if sender else ""
-            except:
-                pass
+            # الحصول على معلومات المرسل والمجموعة من الذاكرة المؤقتة
+            sender_info = await self._get_sender_info(event)
+            sender_name = sender_info['name']
+            sender_username = sender_info['username']
+            sender_id = sender_info['id']
 
-            # الحصول على معلومات المجموعة
-            chat = await event.get_chat()
-            chat_id = str(chat.id) if chat else ""
-            group_username = getattr(chat, 'username', '')
+            chat_info = await self._get_chat_info(event)
+            chat_id = chat_info['id']
+            group_username = chat_info['username']
 
             # إنشاء بيانات التنبيه
             alert_data = {
@@ -701,22 +1665,13 @@ class TelegramClientManager:
                 "message_id": message.id,
                 "chat_id": chat_id,
                 "group_username": group_username,
+                "is_channel": bool(event.is_channel),
                 "full_message": message.text
             }
 
-            # إضافة التنبيه للقائمة بأولوية عالية
+            # الواجهة والرسائل المحفوظة ومجموعة Admin تُرسل كلها من قائمة التنبيهات
             alert_queue.add_alert(self.user_id, alert_data)
 
-            # إرسال فوري للواجهة أيضاً
-            try:
-                socketio.emit('new_alert', alert_data, to=self.user_id)
-                socketio.emit('log_update', {
-                    "message": f"🚨 تنبيه فوري: '{keyword}' في {group_identifier} من {sender_name}"
-                }, to=self.user_id)
-                logger.info(f"✅ Immediate alert sent to interface for user {self.user_id}")
-            except Exception as emit_error:
-                logger.error(f"❌ Failed to emit immediate alert: {str(emit_error)}")
-
             logger.info(f"✅ Keyword alert triggered for user {self.user_id}: '{keyword}' in {group_identifier}")
 
         except Exception as e:
@@ -725,72 +1680,184 @@ class TelegramClientManager:
     async def _handle_auto_reply(self, event, keyword, group_identifier):
         """معالجة الرد التلقائي للكلمات المفتاحية"""
         try:
-            # الحصول على إعدادات الرد التلقائي من المستخدم
+            # نسخ إعدادات الرد التلقائي ثم تحرير القفل قبل أي await
+            # كل الحسابات تعمل على نفس event loop - الانتظار مع القفل يوقفها جميعاً
             with USERS_LOCK:
-                if self.user_id in USERS:
-                    settings = USERS[self.user_id].get('settings', {})
-                    auto_reply_enabled = settings.get('auto_reply_enabled', False)
-                    auto_replies = settings.get('auto_replies', {})
-                    
-                    if not auto_reply_enabled:
-                        return
-                        
-                    # البحث عن رد مناسب للكلمة المفتاحية
-                    reply_text = None
-                    keyword_lower = keyword.lower().strip()
-                    
-                    # البحث المباشر أولاً
-                    if keyword_lower in auto_replies:
-                        reply_text = auto_replies[keyword_lower]
-                    else:
-                        # البحث الجزئي في حالة عدم وجود تطابق مباشر
-                        for stored_keyword, stored_reply in auto_replies.items():
-                            if stored_keyword.lower() in keyword_lower or keyword_lower in stored_keyword.lower():
-                                reply_text = stored_reply
-                                break
-                    
-                    if reply_text and reply_text.strip():
-                        # إضافة تأخير عشوائي لتجنب كشف البوت
-                        import random
-                        await asyncio.sleep(random.uniform(1, 3))
-                        
-                        # إرسال الرد
-                        await self.client.send_message(event.chat_id, reply_text)
-                        
-                        # تسجيل الرد في السجل
-                        socketio.emit('log_update', {
-                            "message": f"🤖 رد تلقائي تم إرساله: '{keyword}' → '{reply_text[:50]}...' في {group_identifier}"
-                        }, to=self.user_id)
-                        
-                        logger.info(f"Auto reply sent for keyword '{keyword}' in {group_identifier}")
-                        
+                if self.user_id not in USERS:
+                    return
+                settings = USERS[self.user_id].get('settings', {})
+                auto_reply_enabled = settings.get('auto_reply_enabled', False)
+                auto_replies = dict(settings.get('auto_replies', {}))
+
+            if not auto_reply_enabled:
+                return
+
+            # البحث عن رد مناسب للكلمة المفتاحية
+            reply_text = None
+            keyword_lower = keyword.lower().strip()
+
+            # البحث المباشر أولاً
+            if keyword_lower in auto_replies:
+                reply_text = auto_replies[keyword_lower]
+            else:
+                # البحث الجزئي في حالة عدم وجود تطابق مباشر
+                for stored_keyword, stored_reply in auto_replies.items():
+                    if stored_keyword.lower() in keyword_lower or keyword_lower in stored_keyword.lower():
+                        reply_text = stored_reply
+                        break
+
+            if reply_text and reply_text.strip():
+                # إضافة تأخير عشوائي لتجنب كشف البوت
+                import random
+                await asyncio.sleep(random.uniform(1, 3))
+
+                # إرسال الرد
+                await self.pacing.call('send', lambda: self.client.send_message(event.chat_id, reply_text))
+
+                # تسجيل الرد في السجل
+                emit_log(self.user_id, f"🤖 رد تلقائي تم إرساله: '{keyword}' → '{reply_text[:50]}...' في {group_identifier}")
+
+                logger.info(f"Auto reply sent for keyword '{keyword}' in {group_identifier}")
+
         except Exception as e:
             logger.error(f"Error in auto reply: {str(e)}")
-            socketio.emit('log_update', {
-                "message": f"❌ خطأ في الرد التلقائي: {str(e)}"
-            }, to=self.user_id)
+            emit_log(self.user_id, f"❌ خطأ في الرد التلقائي: {str(e)}")
 
-    def update_monitoring_settings(self, keywords, groups):
+    def update_monitoring_settings(self, keywords, groups, arabic_normalization=False):
         """تحديث إعدادات المراقبة - فقط الكلمات المفتاحية (المجموعات للإرسال فقط)"""
         self.monitored_keywords = [k.strip() for k in keywords if k.strip()]
+        # إعادة بناء فهرس الكلمات مرة واحدة بدلاً من المرور على كل كلمة في كل رسالة
+        self.keyword_matcher = KeywordMatcher(self.monitored_keywords, normalize=arabic_normalization)
+        for rule, error in self.keyword_matcher.errors:
+            logger.warning(f"Invalid keyword rule for {self.user_id}: {rule} ({error})")
+            emit_log(self.user_id, f"⚠️ قاعدة مراقبة غير صالحة تم تجاهلها: {rule}")
         # ⚠️ لا نحفظ مجموعات المراقبة - نراقب كل شيء
         # نحفظ مجموعات الإرسال منفصلة في الإعدادات العادية
 
         logger.info(f"Updated monitoring settings for {self.user_id}: {len(self.monitored_keywords)} keywords - مراقبة شاملة لكامل الحساب")
 
-    def run_coroutine(self, coro):
-        """تشغيل coroutine في event loop الخاص بالعميل"""
+    async def refresh_authorization(self):
+        """فحص حالة التصريح من التليجرام وتحديث الحالة المخزنة"""
+        try:
+            self.authorized = await self.client.is_user_authorized()
+        except Exception as e:
+            logger.warning(f"Authorization check failed for {self.user_id}: {str(e)}")
+            self.authorized = None
+        self.authorized_checked_at = time.time()
+        return self.authorized
+
+    async def ensure_authorized(self):
+        """التحقق من التصريح باستخدام الحالة المخزنة - طلب للتليجرام فقط إذا كانت الحالة غير معروفة"""
+        if self.authorized is None:
+            await self.refresh_authorization()
+        if not self.authorized:
+            raise Exception("جلسة التليجرام منتهية الصلاحية - يرجى إعادة تسجيل الدخول")
+
+    def handle_auth_error(self, error):
+        """أخطاء التصريح تجعل الحالة المخزنة غير معروفة حتى يُعاد فحصها"""
+        logger.warning(f"Auth error for {self.user_id}: {str(error)}")
+        self.authorized = None
+
+    async def resolve_peer(self, target):
+        """تحويل نص المجموعة إلى InputPeer مع ذاكرة دائمة وتخزين سلبي للأهداف غير القابلة للحل"""
+        cached = self.peer_cache.get(target)
+        if cached is not None:
+            peer, error = cached
+            if peer is None:
+                raise Exception(f"تعذر الوصول للمجموعة (محفوظ مؤقتاً): {error}")
+            return peer
+
+        try:
+            try:
+                peer = await self.pacing.call('resolve', lambda: self.client.get_input_entity(target))
+            except UNRESOLVABLE_ERRORS:
+                if target.startswith('@') or target.startswith('https://'):
+                    raise
+                peer = await self.pacing.call('resolve', lambda: self.client.get_input_entity('@' + target))
+        except UNRESOLVABLE_ERRORS as e:
+            self.peer_cache.put_failure(target, str(e))
+            raise
+
+        self.peer_cache.put(target, peer)
+        return peer
+
+    async def get_admin_peer(self):
+        """InputPeer لمجموعة Admin - الانضمام والحل مرة واحدة لكل حساب ثم من الذاكرة الدائمة"""
+        if self._admin_peer_lock is None:
+            self._admin_peer_lock = asyncio.Lock()
+
+        async with self._admin_peer_lock:
+            cached = self.peer_cache.get(ADMIN_GROUP)
+            if cached is not None and cached[0] is not None:
+                return cached[0]
+
+            try:
+                result = await self.pacing.call('join', lambda: self.client(ImportChatInviteRequest(ADMIN_INVITE_HASH)))
+                chat = result.chats[0]
+                logger.info(f"✅ Joined Admin group for user {self.user_id}")
+            except UserAlreadyParticipantError:
+                invite = await self.pacing.call('resolve', lambda: self.client(CheckChatInviteRequest(ADMIN_INVITE_HASH)))
+                if not isinstance(invite, ChatInviteAlready):
+                    raise Exception("تعذر الوصول لمجموعة Admin")
+                chat = invite.chat
+
+            peer = await self.client.get_input_entity(chat)
+            self.peer_cache.put(ADMIN_GROUP, peer)
+            return peer
+
+    def invalidate_admin_peer(self):
+        """إعادة حل مجموعة Admin والانضمام لها في الإرسال القادم"""
+        self.peer_cache.invalidate(ADMIN_GROUP)
+
+    async def get_memberships(self):
+        """معرفات وأسماء المجموعات والقنوات التي ينتمي لها الحساب - تُحدّث من قائمة المحادثات كل 30 دقيقة"""
+        if self.memberships is None or time.time() - self.memberships_at > MEMBERSHIP_TTL:
+            dialogs = await self.pacing.call('search', lambda: self.client.get_dialogs(limit=None))
+            keys = set()
+            for dialog in dialogs:
+                if not (dialog.is_group or dialog.is_channel):
+                    continue
+                keys.add(str(dialog.id))
+                keys.add(str(dialog.entity.id))
+                username = getattr(dialog.entity, 'username', None)
+                if username:
+                    keys.add(username.lower())
+            self.memberships = keys
+            self.memberships_at = time.time()
+        return self.memberships
+
+    def submit_coroutine(self, coro, callback=None, timeout=None):
+        """جدولة coroutine على event loop العميل وإرجاع future فوراً دون انتظار"""
         if not self.loop:
+            coro.close()
             raise Exception("Event loop not initialized")
 
+        if timeout:
+            coro = asyncio.wait_for(coro, timeout)
+
         future = asyncio.run_coroutine_threadsafe(coro, self.loop)
-        return future.result(timeout=30)
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def run_coroutine(self, coro, timeout=30):
+        """تشغيل coroutine في event loop الخاص بالعميل وانتظار النتيجة"""
+        future = self.submit_coroutine(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
 
     def stop(self):
         """إيقاف العميل"""
-        self.stop_flag.set()
-        if self.thread:
-            self.thread.join(timeout=5)
+        if self.loop and self.stop_event:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        if self.task:
+            try:
+                self.task.result(timeout=5)
+            except Exception:
+                pass
 
 def get_all_users_operations_status():
     """الحصول على حالة العمليات لجميع المستخدمين"""
@@ -834,38 +1901,47 @@ def notify_user_about_background_operations(user_id):
             for op in active_operations:
                 operations_text.append(f"• {op['user_name']}: {', '.join(op['operations'])}")
 
-            socketio.emit('log_update', {
-                "message": f"📊 العمليات النشطة في الخلفية:\n" + "\n".join(operations_text)
-            }, to=user_id)
+            emit_log(user_id, f"📊 العمليات النشطة في الخلفية:\n" + "\n".join(operations_text))
 
     except Exception as e:
         logger.error(f"Error notifying about background operations: {str(e)}")
 
-def update_monitoring_settings(self, keywords, groups):
-    """تحديث إعدادات المراقبة - فقط الكلمات المفتاحية (المجموعات للإرسال فقط)"""
-    self.monitored_keywords = [k.strip() for k in keywords if k.strip()]
-    # ⚠️ لا نحفظ مجموعات المراقبة - نراقب كل شيء
-    # نحفظ مجموعات الإرسال منفصلة في الإعدادات العادية
-
-    logger.info(f"Updated monitoring settings for {self.user_id}: {len(self.monitored_keywords)} keywords - مراقبة شاملة لكامل الحساب")
+def submit_background_job(user_id, client_manager, coro, kind, timeout=None, on_result=None):
+    """تشغيل عملية طويلة على event loop العميل وإرسال نتيجتها عبر Socket.IO بدلاً من حجز طلب HTTP"""
+    job_id = uuid.uuid4().hex[:12]
 
-def run_coroutine(self, coro):
-    """تشغيل coroutine في event loop الخاص بالعميل"""
-    if not self.loop:
-        raise Exception("Event loop not initialized")
-
-    future = asyncio.run_coroutine_threadsafe(coro, self.loop)
-    return future.result(timeout=30)
+    def on_done(future):
+        try:
+            result = future.result()
+            payload = on_result(result) if on_result else result
+            socketio.emit('job_result', {
+                'job_id': job_id,
+                'kind': kind,
+                'success': True,
+                'result': payload
+            }, to=user_id)
+        except Exception as e:
+            if isinstance(e, (asyncio.TimeoutError, concurrent.futures.TimeoutError)):
+                error_message = "انتهت مهلة العملية"
+            else:
+                error_message = str(e)
+            logger.error(f"Background job {kind} ({job_id}) failed for {user_id}: {error_message}")
+            socketio.emit('job_result', {
+                'job_id': job_id,
+                'kind': kind,
+                'success': False,
+                'message': f"❌ خطأ: {error_message}"
+            }, to=user_id)
 
-def stop(self):
-    """إيقاف العميل"""
-    self.stop_flag.set()
-    if self.thread:
-        self.thread.join(timeout=5)
+    client_manager.submit_coroutine(coro, callback=on_done, timeout=timeout)
+    return job_id
 
 # =========================== 
 # مدير التليجرام الرئيسي
 # ===========================
+ALBUM_SIZE = 10  # الحد الأقصى للصور في ألبوم واحد على التليجرام
+MEDIA_CAPTION_LIMIT = 1024  # الحد الأقصى لطول تعليق الوسائط
+
 class TelegramManager:
     """مدير عملاء التليجرام"""
 
@@ -882,9 +1958,7 @@ class TelegramManager:
         """إعداد عميل التليجرام"""
         try:
             if not API_ID or not API_HASH:
-                socketio.emit('log_update', {
-                    "message": "❌ لم يتم إعداد بيانات Telegram API"
-                }, to=user_id)
+                emit_log(user_id, "❌ لم يتم إعداد بيانات Telegram API")
                 return {
                     "status": "error", 
                     "message": "❌ بيانات API غير متوفرة - يرجى إضافة TELEGRAM_API_ID و TELEGRAM_API_HASH في الأسرار"
@@ -899,25 +1973,29 @@ class TelegramManager:
                 except Exception as e:
                     logger.warning(f"Could not remove old session file: {e}")
 
-            socketio.emit('log_update', {
-                "message": "🔄 جاري إعداد العميل..."
-            }, to=user_id)
+            emit_log(user_id, "🔄 جاري إعداد العميل...")
 
             client_manager = self.get_client_manager(user_id)
+            client_manager.peer_cache.clear()
             client_manager.start_client_thread()
 
-            socketio.emit('log_update', {
-                "message": "📡 فحص حالة التصريح..."
-            }, to=user_id)
+            emit_log(user_id, "📡 فحص حالة التصريح...")
 
-            is_authorized = client_manager.run_coroutine(
-                client_manager.client.is_user_authorized()
-            )
+            # حالة التصريح تُفحص مرة واحدة عند الاتصال - None تعني أن الفحص فشل وتُعاد مرة
+            is_authorized = client_manager.authorized
+            if is_authorized is None:
+                is_authorized = client_manager.run_coroutine(client_manager.refresh_authorization())
+
+            if is_authorized is None:
+                # حالة غير معروفة (مشكلة اتصال) - لا نطلب كوداً جديداً لحساب قد يكون مصرحاً له
+                emit_log(user_id, "⚠️ تعذر التحقق من حالة التصريح - تحقق من الاتصال ثم حاول مرة أخرى")
+                return {
+                    "status": "error",
+                    "message": "⚠️ تعذر التحقق من حالة التصريح، يرجى المحاولة مرة أخرى"
+                }
 
             if not is_authorized:
-                socketio.emit('log_update', {
-                    "message": f"📱 إرسال كود التحقق إلى: {phone_number}"
-                }, to=user_id)
+                emit_log(user_id, f"📱 إرسال كود التحقق إلى: {phone_number}")
 
                 sent = client_manager.run_coroutine(
                     client_manager.client.send_code_request(phone_number)
@@ -939,9 +2017,7 @@ class TelegramManager:
                     "is_running": False
                 }, to=user_id)
 
-                socketio.emit('log_update', {
-                    "message": "✅ تم إرسال كود التحقق - تحقق من رسائل تيليجرام"
-                }, to=user_id)
+                emit_log(user_id, "✅ تم إرسال كود التحقق - تحقق من رسائل تيليجرام")
 
                 return {
                     "status": "code_required", 
@@ -956,6 +2032,9 @@ class TelegramManager:
                         USERS[user_id]['awaiting_code'] = False
                         USERS[user_id]['awaiting_password'] = False
 
+                # استئناف مهام البث والانضمام التي توقفت قبل إعادة التشغيل
+                schedule_job_resume(user_id, delay=JOB_RESUME_DELAY)
+
                 # إرسال إشعار نجح تسجيل الدخول
                 socketio.emit('login_status', {
                     "logged_in": True,
@@ -977,14 +2056,10 @@ class TelegramManager:
 
             # معالجة خاصة لخطأ ResendCodeRequest
             if "ResendCodeRequest" in error_message or "all available options" in error_message:
-                socketio.emit('log_update', {
-                    "message": "⚠️ تم استنفاد محاولات إرسال الكود. يرجى الانتظار قليلاً ثم المحاولة مرة أخرى"
-                }, to=user_id)
+                emit_log(user_id, "⚠️ تم استنفاد محاولات إرسال الكود. يرجى الانتظار قليلاً ثم المحاولة مرة أخرى")
                 return {"status": "error", "message": "⚠️ يرجى الانتظار قبل طلب كود جديد"}
 
-            socketio.emit('log_update', {
-                "message": f"❌ خطأ في الإعداد: {error_message}"
-            }, to=user_id)
+            emit_log(user_id, f"❌ خطأ في الإعداد: {error_message}")
             return {"status": "error", "message": f"❌ خطأ: {error_message}"}
 
     def verify_code(self, user_id, code):
@@ -1005,6 +2080,7 @@ class TelegramManager:
                 user = client_manager.run_coroutine(
                     client_manager.client.sign_in(phone, code, phone_code_hash=phone_code_hash)
                 )
+                client_manager.authorized = True
 
                 with USERS_LOCK:
                     USERS[user_id]['connected'] = True
@@ -1012,6 +2088,8 @@ class TelegramManager:
                     USERS[user_id]['awaiting_code'] = False
                     USERS[user_id]['awaiting_password'] = False
 
+                schedule_job_resume(user_id, delay=JOB_RESUME_DELAY)
+
                 # إرسال تحديث حالة تسجيل الدخول
                 socketio.emit('login_status', {
                     "logged_in": True,
@@ -1070,12 +2148,15 @@ class TelegramManager:
                 await_result = client_manager.run_coroutine(
                     client_manager.client.sign_in(password=password)
                 )
+                client_manager.authorized = True
 
                 with USERS_LOCK:
                     USERS[user_id]['connected'] = True
                     USERS[user_id]['authenticated'] = True
                     USERS[user_id]['awaiting_password'] = False
 
+                schedule_job_resume(user_id, delay=JOB_RESUME_DELAY)
+
                 # إرسال تحديث حالة تسجيل الدخول بعد كلمة المرور
                 socketio.emit('login_status', {
                     'logged_in': True,
@@ -1093,381 +2174,830 @@ class TelegramManager:
             logger.error(f"Password verification error: {str(e)}")
             return {"status": "error", "message": f"❌ خطأ: {str(e)}"}
 
+    def get_sender_manager(self, user_id):
+        """مدير العميل الخاص بالإرسال بعد التأكد من تهيئته"""
+        with USERS_LOCK:
+            if user_id not in USERS:
+                raise Exception("المستخدم غير موجود - يرجى تسجيل الدخول أولاً")
+
+            client_manager = USERS[user_id].get('client_manager')
+
+        if not client_manager:
+            raise Exception("لم يتم تسجيل الدخول - يرجى تسجيل الدخول في التليجرام أولاً")
+
+        if not client_manager.client:
+            raise Exception("عميل التليجرام غير مُهيأ - يرجى إعادة تسجيل الدخول")
+
+        return client_manager
+
+    async def send_to_target(self, client_manager, entity, message, image_files=None, album=True):
+        """إرسال نص و/أو صور لمجموعة واحدة على event loop العميل - أخطاء التليجرام تُمرر كما هي"""
+        try:
+            await client_manager.ensure_authorized()
+            entity_obj = await client_manager.resolve_peer(entity)
+
+            if image_files and message:
+                return await self._send_message_with_media(client_manager, entity, entity_obj, message, image_files, album)
+            if image_files:
+                return await self._send_media(client_manager, entity_obj, image_files, album)
+
+            result = await self._paced_send(client_manager, lambda: client_manager.client.send_message(entity_obj, message))
+            return {"success": True, "message_id": result.id}
+
+        except STALE_PEER_ERRORS:
+            # المجموعة المخزنة لم تعد صالحة - تُحل من جديد في الإرسال القادم
+            client_manager.peer_cache.invalidate(entity)
+            raise
+        except UnauthorizedError as e:
+            client_manager.handle_auth_error(e)
+            raise
+
     def send_message_async(self, user_id, entity, message):
         """إرسال رسالة"""
         try:
-            with USERS_LOCK:
-                if user_id not in USERS:
-                    raise Exception("المستخدم غير موجود - يرجى تسجيل الدخول أولاً")
+            client_manager = self.get_sender_manager(user_id)
+            return client_manager.run_coroutine(
+                self.send_to_target(client_manager, entity, message)
+            )
+        except Exception as e:
+            logger.error(f"Send message error: {str(e)}")
+            raise Exception(str(e))
 
-                client_manager = USERS[user_id].get('client_manager')
-                if not client_manager:
-                    raise Exception("لم يتم تسجيل الدخول - يرجى تسجيل الدخول في التليجرام أولاً")
+    def send_media_async(self, user_id, entity, image_files, album=True):
+        """إرسال الصور فقط - كألبوم واحد لكل 10 صور افتراضياً"""
+        try:
+            client_manager = self.get_sender_manager(user_id)
+            return client_manager.run_coroutine(
+                self.send_to_target(client_manager, entity, '', image_files, album),
+                timeout=300
+            )
+        except Exception as e:
+            logger.error(f"Send media error: {str(e)}")
+            raise Exception(str(e))
 
-                if not client_manager.client:
-                    raise Exception("عميل التليجرام غير مُهيأ - يرجى إعادة تسجيل الدخول")
+    def send_message_with_media_async(self, user_id, entity, message, image_files, album=True):
+        """إرسال رسالة مع صور - كألبوم واحد افتراضياً أو صورة تلو الأخرى"""
+        try:
+            client_manager = self.get_sender_manager(user_id)
+            return client_manager.run_coroutine(
+                self.send_to_target(client_manager, entity, message, image_files, album),
+                timeout=300
+            )
+        except Exception as e:
+            logger.error(f"Send message with media error: {str(e)}")
+            raise Exception(str(e))
 
+    async def upload_media(self, client_manager, image_files):
+        """رفع الصور مرة واحدة لكل حساب قبل البث - تُعاد نفس النسخة المرفوعة لكل المجموعات"""
+        user_id = client_manager.user_id
+        uploaded = 0
+        for img_file in image_files:
+            uploads = img_file.setdefault('uploads', {})
+            if user_id in uploads:
+                continue
             try:
-                is_authorized = client_manager.run_coroutine(
-                    client_manager.client.is_user_authorized()
+                uploads[user_id] = await asyncio.wait_for(
+                    client_manager.client.upload_file(img_file['path']), 120
                 )
+                uploaded += 1
+            except Exception as e:
+                # عند فشل الرفع المسبق نعود للإرسال من المسار المحلي
+                logger.warning(f"Pre-upload failed for {img_file.get('name')}: {str(e)}")
+
+        return uploaded
+
+    async def _paced_send(self, client_manager, request, media_count=1):
+        """كل طلب إرسال يأخذ دوره في 'send' - الألبوم يأخذ دوراً لكل صورة لأن Telethon يرسل كل صورة فيه بطلب منفصل"""
+        pacing = client_manager.pacing
+        for _ in range(media_count - 1):
+            await pacing.acquire('send')
+        return await pacing.call('send', request)
+
+    def _media_source(self, user_id, img_file):
+        """أفضل مصدر متاح للصورة: وسائط مُرسلة سابقاً ← ملف مرفوع ← المسار المحلي"""
+        return (img_file.get('media', {}).get(user_id)
+                or img_file.get('uploads', {}).get(user_id)
+                or img_file['path'])
+
+    def _remember_media(self, user_id, img_file, result):
+        """حفظ الصورة كما خزنها التليجرام بعد أول إرسال لإعادة استخدامها دون رفع أو معالجة"""
+        media = getattr(result, 'media', None)
+        if media is not None:
+            img_file.setdefault('media', {})[user_id] = media
+
+    async def _send_media(self, client_manager, entity_obj, image_files, album):
+        """إرسال الصور فقط"""
+        user_id = client_manager.user_id
+        client = client_manager.client
+        results = []
+
+        if album and len(image_files) > 1:
+            # ألبوم لكل 10 صور مع اسم كل صورة كتعليق لها
+            for start in range(0, len(image_files), ALBUM_SIZE):
+                album_files = image_files[start:start + ALBUM_SIZE]
+                album_result = await self._paced_send(client_manager, lambda: client.send_file(
+                    entity_obj,
+                    [self._media_source(user_id, img_file) for img_file in album_files],
+                    caption=[f"📷 {img_file['name']}" for img_file in album_files]
+                ), len(album_files))
+                for img_file, sent in zip(album_files, album_result):
+                    self._remember_media(user_id, img_file, sent)
+                    results.append(sent.id)
 
-                if not is_authorized:
-                    raise Exception("جلسة التليجرام منتهية الصلاحية - يرجى إعادة تسجيل الدخول")
-            except Exception as auth_error:
-                raise Exception(f"خطأ في التحقق من التصريح: {str(auth_error)}")
+            return {"success": True, "message_ids": results}
 
+        # إرسال كل صورة منفصلة
+        for img_file in image_files:
             try:
-                entity_obj = client_manager.run_coroutine(
-                    client_manager.client.get_entity(entity)
-                )
-            except:
-                if not entity.startswith('@') and not entity.startswith('https://'):
-                    entity = '@' + entity
-                entity_obj = client_manager.run_coroutine(
-                    client_manager.client.get_entity(entity)
-                )
+                result = await self._paced_send(client_manager, lambda: client.send_file(
+                    entity_obj,
+                    self._media_source(user_id, img_file),
+                    caption=f"📷 {img_file['name']}"
+                ))
+                self._remember_media(user_id, img_file, result)
+                results.append(result.id)
+            except Exception as img_error:
+                logger.error(f"Error sending image {img_file['name']}: {str(img_error)}")
+                raise img_error
+
+        return {"success": True, "message_ids": results}
+
+    async def _send_message_with_media(self, client_manager, entity, entity_obj, message, image_files, album):
+        """إرسال رسالة مع صور"""
+        user_id = client_manager.user_id
+        client = client_manager.client
+        results = []
+
+        # تحضير الصور (المرفوعة مسبقاً أو الموجودة على القرص)
+        media_files = []
+        for img_file in image_files:
+            if img_file.get('uploads', {}).get(user_id) or os.path.exists(img_file['path']):
+                media_files.append(img_file)
+            else:
+                logger.warning(f"Image file not found: {img_file['path']}")
 
-            result = client_manager.run_coroutine(
-                client_manager.client.send_message(entity_obj, message)
-            )
+        try:
+            if len(media_files) == 1:
+                # صورة واحدة فقط
+                media_result = await self._paced_send(client_manager, lambda: client.send_file(
+                    entity_obj,
+                    self._media_source(user_id, media_files[0]),
+                    caption=message if message else "📷"
+                ))
+                self._remember_media(user_id, media_files[0], media_result)
+                results.append(media_result.id)
+                logger.info(f"Successfully sent single image with message to {entity}")
+            elif media_files and album:
+                # عدة صور - ألبوم واحد لكل 10 صور مع النص كتعليق على الألبوم الأول
+                caption = message if message and message.strip() else ''
+                if len(caption) > MEDIA_CAPTION_LIMIT:
+                    # التعليق طويل على الوسائط - يُرسل النص منفصلاً قبل الألبوم
+                    text_result = await self._paced_send(client_manager, lambda: client.send_message(entity_obj, message))
+                    results.append(text_result.id)
+                    caption = ''
+
+                for start in range(0, len(media_files), ALBUM_SIZE):
+                    album_files = media_files[start:start + ALBUM_SIZE]
+                    album_result = await self._paced_send(client_manager, lambda: client.send_file(
+                        entity_obj,
+                        [self._media_source(user_id, img_file) for img_file in album_files],
+                        caption=caption if start == 0 else ''
+                    ), len(album_files))
+                    for img_file, sent in zip(album_files, album_result):
+                        self._remember_media(user_id, img_file, sent)
+                        results.append(sent.id)
+
+                logger.info(f"Successfully sent message + {len(media_files)} images as album to {entity}")
+            elif media_files:
+                # عدة صور - إرسال النص أولاً ثم الصور أسفله واحدة تلو الأخرى
+                if message and message.strip():
+                    text_result = await self._paced_send(client_manager, lambda: client.send_message(entity_obj, message))
+                    results.append(text_result.id)
 
-            return {"success": True, "message_id": result.id}
+                for i, img_file in enumerate(media_files):
+                    try:
+                        media_result = await self._paced_send(client_manager, lambda: client.send_file(
+                            entity_obj,
+                            self._media_source(user_id, img_file),
+                            caption=f"📷 صورة {i+1} من {len(media_files)}"
+                        ))
+                        self._remember_media(user_id, img_file, media_result)
+                        results.append(media_result.id)
+                        logger.info(f"Sent image {i+1}/{len(media_files)} to {entity}")
+                    except FloodWaitError:
+                        raise
+                    except Exception as img_error:
+                        logger.error(f"Error sending individual image {i+1}: {str(img_error)}")
+                        continue
+
+                logger.info(f"Successfully sent message + {len(media_files)} images to {entity}")
+            elif message and message.strip():
+                # لا توجد صور صالحة - إرسال النص فقط
+                text_result = await self._paced_send(client_manager, lambda: client.send_message(entity_obj, message))
+                results.append(text_result.id)
+
+        except (FloodWaitError, UnauthorizedError, *STALE_PEER_ERRORS):
+            # أخطاء يعالجها المستدعي (الانتظار أو إعادة الحل أو إعادة التصريح)
+            raise
+        except Exception as media_error:
+            logger.error(f"Error in media sending process: {str(media_error)}")
+            # كحل أخير، أرسل النص فقط
+            if message and message.strip() and not results:
+                text_result = await self._paced_send(client_manager, lambda: client.send_message(entity_obj, message))
+                results.append(text_result.id)
+                logger.info(f"Sent text only due to media error: {str(media_error)}")
+
+        return {"success": True, "message_ids": results}
 
-        except Exception as e:
-            logger.error(f"Send message error: {str(e)}")
-            raise Exception(str(e))
 
-    def send_media_async(self, user_id, entity, image_files):
-        """إرسال الصور فقط"""
+# إنشاء مدير التليجرام
+telegram_manager = TelegramManager()
+
+# =========================== 
+# محرك البث المتزامن
+# ===========================
+def classify_send_error(error):
+    """وصف مختصر لسبب فشل الإرسال يظهر في السجل"""
+    error_msg = str(error).lower()
+    if "banned" in error_msg:
+        return "محظور"
+    if "private" in error_msg:
+        return "خاص/محدود"
+    if "can't write" in error_msg:
+        return "غير مسموح"
+    return "خطأ"
+
+class BroadcastEngine:
+    """إرسال لعدة مجموعات في وقت واحد ضمن حد معدل الحساب مع احترام FloodWait بالمدة المطلوبة بالضبط"""
+
+    def __init__(self, client_manager, concurrency=3, rate_per_minute=30, label="", max_flood_retries=3, report_to=None):
+        self.client_manager = client_manager
+        self.user_id = client_manager.user_id
+        self.room = report_to or self.user_id
+        self.concurrency = max(int(concurrency), 1)
+        self.rate_per_minute = rate_per_minute
+        self.label = label
+        self.max_flood_retries = max_flood_retries
+        self.summary = {'total': 0, 'completed': 0, 'successful': 0, 'failed': 0}
+
+    @classmethod
+    def from_settings(cls, client_manager, settings, label="", report_to=None):
+        """إنشاء المحرك من إعدادات المستخدم"""
+        return cls(
+            client_manager,
+            concurrency=settings.get('send_concurrency', 3),
+            rate_per_minute=settings.get('send_rate_per_minute', 30),
+            label=label,
+            report_to=report_to
+        )
+
+    async def run(self, items, send_one, total=None, on_result=None):
+        """إرسال دفعة [(رقم المجموعة، المجموعة)] - send_one(target) coroutine ترسل لهدف واحد وتنظم كل طلب فيها عبر pacing
+
+        يمكن استدعاؤها لعدة دفعات متتالية، والملخص يتراكم في self.summary.
+        on_result(number, error) تُستدعى بعد كل مجموعة (error = None عند النجاح).
+        """
+        pacing = self.client_manager.pacing
+        pacing.set_ceiling('send', self.rate_per_minute)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = self.summary
+        summary['total'] = total or summary['completed'] + len(items)
+
+        async def deliver(index, target):
+            async with semaphore:
+                error = None
+                for attempt in range(self.max_flood_retries + 1):
+                    try:
+                        await send_one(target)
+                        error = None
+                        break
+                    except FloodWaitError as e:
+                        # الحساب متوقف عن الإرسال للمدة المطلوبة - تُعاد المحاولة لنفس المجموعة بعدها
+                        error = e
+                        emit_log(self.room, f"⏳ طلب التليجرام الانتظار {e.seconds} ثانية - سيُستأنف {self.label}الإرسال تلقائياً")
+                    except Exception as e:
+                        error = e
+                        break
+
+                self._report(index, target, error, summary)
+                if on_result:
+                    on_result(index, error)
+
+        await asyncio.gather(*(deliver(index, target) for index, target in items))
+        return summary
+
+    def _report(self, index, target, error, summary):
+        """تحديث الإحصائيات وإرسال التقدم للواجهة بعد كل مجموعة"""
+        total = summary['total']
+        summary['completed'] += 1
+
+        if error is None:
+            summary['successful'] += 1
+            stat = 'sent'
+            log_message = f"✅ [{index}/{total}] {self.label}نجح إلى: {target}"
+        else:
+            summary['failed'] += 1
+            stat = 'errors'
+            logger.error(f"Send error to {target}: {str(error)}")
+            log_message = f"❌ [{index}/{total}] {self.label}فشل إلى {target}: {classify_send_error(error)}"
+
+        stats = None
+        with USERS_LOCK:
+            if self.user_id in USERS:
+                USERS[self.user_id]['stats'][stat] += 1
+                stats = dict(USERS[self.user_id]['stats'])
+
+        emit_log(self.room, log_message)
+        if stats is not None:
+            socketio.emit('stats_update', stats, to=self.user_id)
+        socketio.emit('broadcast_progress', {
+            'account': self.user_id,
+            'target': target,
+            'success': error is None,
+            **summary
+        }, to=self.room)
+
+# =========================== 
+# توزيع البث على عدة حسابات
+# ===========================
+def get_account_pool(user_id, accounts=None):
+    """الحسابات المسجلة والمصرح لها المشاركة في البث - الحساب الحالي دائماً أولها
+
+    accounts: قائمة معرفات المستخدمين أو "all" لكل الحسابات المسجلة
+    """
+    candidates = list(PREDEFINED_USERS) if accounts == 'all' else list(accounts or [])
+
+    pool = []
+    with USERS_LOCK:
+        for account_id in [user_id] + candidates:
+            user = USERS.get(account_id)
+            client_manager = user.get('client_manager') if user else None
+            if (client_manager in pool or not client_manager or not client_manager.loop
+                    or not user.get('authenticated') or client_manager.authorized is False):
+                continue
+            pool.append(client_manager)
+    return pool
+
+def target_key(target):
+    """تحويل نص المجموعة إلى مفتاح يطابق مفاتيح get_memberships"""
+    key = target.strip()
+    for prefix in ('https://t.me/', 'http://t.me/', 'https://telegram.me/', 't.me/', '@'):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    return key.lower()
+
+async def assign_targets(pool, items):
+    """توزيع [(الرقم، المجموعة)] على الحسابات: العضوية أولاً ثم أقرب وقت انتهاء متوقع حسب FloodWait ومعدل الإرسال"""
+    if not pool:
+        return {}
+
+    primary = pool[0]
+    if len(pool) == 1:
+        return {primary: list(items)}
+
+    memberships = {}
+    for client_manager in pool:
         try:
-            with USERS_LOCK:
-                if user_id not in USERS:
-                    raise Exception("المستخدم غير موجود")
+            memberships[client_manager] = await client_manager.get_memberships()
+        except Exception as e:
+            logger.warning(f"Could not load memberships for {client_manager.user_id}: {str(e)}")
+            memberships[client_manager] = set()
+
+    assignments = {client_manager: [] for client_manager in pool}
+
+    def finish_time(client_manager):
+        pacing = client_manager.pacing
+        rate = pacing.buckets['send'].rate_per_minute
+        return pacing.wait_time('send') + (len(assignments[client_manager]) + 1) * 60 / rate
+
+    # المجموعات التي ينتمي لها عدد أقل من الحسابات تُوزع أولاً
+    # المجموعات التي لا ينتمي لها أي حساب تبقى للحساب الحالي كما في الإرسال العادي
+    candidates = []
+    for number, target in items:
+        key = target_key(target)
+        members = [cm for cm in pool if key in memberships[cm]] or [primary]
+        candidates.append((len(members), number, target, members))
+    candidates.sort(key=lambda item: item[:2])
+
+    for _, number, target, members in candidates:
+        assignments[min(members, key=finish_time)].append((number, target))
+
+    return {
+        client_manager: sorted(assigned)
+        for client_manager, assigned in assignments.items() if assigned
+    }
 
-                client_manager = USERS[user_id].get('client_manager')
+# =========================== 
+# مهام البث والانضمام الدائمة
+# ===========================
+JOB_MEDIA_DIR = os.path.join(SESSIONS_DIR, "job_media")
+JOB_CLAIM_BATCH = 20  # عدد المجموعات التي يحجزها كل حساب من المهمة في كل دفعة
+JOB_RESUME_DELAY = 5  # ثوانٍ بعد تسجيل الدخول قبل استئناف المهام غير المكتملة
+
+job_store = JobStore(os.path.join(SESSIONS_DIR, "jobs.db"))
+ACTIVE_JOBS = set()  # المهام التي تعمل حالياً في هذه العملية - لا تُستأنف مرتين
+ACTIVE_JOBS_LOCK = Lock()
+
+async def job_store_call(method, *args):
+    """استدعاء سجل المهام من داخل event loop المشترك - SQLite يُنفذ في executor حتى لا يحجب الحسابات الأخرى"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: method(*args))
+
+def create_broadcast_job(user_id, targets, message, image_files=None, album=True, accounts=None, scheduled=False, media_dir=None):
+    """تسجيل مهمة بث في سجل المهام وإرجاع معرفها"""
+    return job_store.create(user_id, 'broadcast', {
+        'message': message,
+        'images': image_files or [],
+        'album': album,
+        'accounts': accounts,
+        'scheduled': scheduled,
+        'media_dir': media_dir
+    }, targets)
+
+def _claim_job(job_id):
+    """منع تشغيل نفس المهمة مرتين في نفس الوقت"""
+    with ACTIVE_JOBS_LOCK:
+        if job_id in ACTIVE_JOBS:
+            return False
+        ACTIVE_JOBS.add(job_id)
+        return True
 
-            if not client_manager:
-                raise Exception("العميل غير متصل")
+def _release_job(job_id):
+    with ACTIVE_JOBS_LOCK:
+        ACTIVE_JOBS.discard(job_id)
+
+def _finish_job(job_id, payload):
+    """إغلاق المهمة إذا لم يتبقَ فيها أهداف وحذف صورها المحفوظة"""
+    counts = job_store.counts(job_id)
+    if counts[TARGET_PENDING] or counts[TARGET_CLAIMED]:
+        # توقفت قبل النهاية - تبقى لتُستأنف لاحقاً
+        job_store.release_claims(job_id)
+        job_store.set_status(job_id, JOB_PENDING)
+        return counts
+
+    job_store.set_status(job_id, JOB_DONE)
+    media_dir = payload.get('media_dir')
+    if media_dir and os.path.isdir(media_dir):
+        shutil.rmtree(media_dir, ignore_errors=True)
+    return counts
+
+async def run_broadcast(job_id, pool, settings):
+    """تنفيذ مهمة بث عبر حسابات pool بالتوازي - المجموعات المنتهية سابقاً لا يُعاد الإرسال لها"""
+    job = await job_store_call(job_store.get, job_id)
+    user_id = job['user_id']
+    payload = job['payload']
+    message = payload.get('message', '')
+    image_files = [dict(img_file) for img_file in payload.get('images', [])]
+    album = payload.get('album', True)
+    label = "إرسال مجدول " if payload.get('scheduled') else ""
+
+    pending = await job_store_call(job_store.pending, job_id)
+    total = (await job_store_call(job_store.counts, job_id))['total']
+    assignments = await assign_targets(pool, pending)
+    await job_store_call(job_store.assign, job_id, {
+        number: client_manager.user_id
+        for client_manager, assigned in assignments.items() for number, _ in assigned
+    })
 
-            is_authorized = client_manager.run_coroutine(
-                client_manager.client.is_user_authorized()
-            )
+    if len(pool) > 1:
+        distribution = ' | '.join(
+            f"{PREDEFINED_USERS.get(cm.user_id, {}).get('name', cm.user_id)}: {len(assigned)}"
+            for cm, assigned in assignments.items()
+        )
+        emit_log(user_id, f"👥 توزيع {len(pending)} مجموعة على {len(assignments)} حساب - {distribution}")
 
-            if not is_authorized:
-                raise Exception("العميل غير مصرح")
+    # نتيجة كل مجموعة تُكتب فوراً في executor، وتُنتظر الكتابات في نهاية كل دفعة
+    completions = []
 
-            try:
-                entity_obj = client_manager.run_coroutine(
-                    client_manager.client.get_entity(entity)
-                )
-            except:
-                if not entity.startswith('@') and not entity.startswith('https://'):
-                    entity = '@' + entity
-                entity_obj = client_manager.run_coroutine(
-                    client_manager.client.get_entity(entity)
-                )
+    def on_result(number, error):
+        if error is None:
+            args = (job_id, number, TARGET_DONE)
+        else:
+            args = (job_id, number, TARGET_FAILED, str(error)[:200])
+        completions.append(asyncio.ensure_future(job_store_call(job_store.complete, *args)))
+
+    async def flush_completions():
+        while completions:
+            writes = completions[:]
+            del completions[:]
+            for result in await asyncio.gather(*writes, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.error(f"Could not record result for job {job_id}: {str(result)}")
+
+    async def run_account(client_manager):
+        account_label = label
+        if len(pool) > 1:
+            account_label = f"{label}[{PREDEFINED_USERS.get(client_manager.user_id, {}).get('name', client_manager.user_id)}] "
+
+        # رفع كل صورة مرة واحدة لكل حساب بدلاً من رفعها لكل مجموعة
+        if image_files:
+            uploaded = await telegram_manager.upload_media(client_manager, image_files)
+            if uploaded:
+                emit_log(user_id, f"📤 {account_label}تم رفع {uploaded} صورة مرة واحدة لكل المجموعات")
+
+        engine = BroadcastEngine.from_settings(client_manager, settings, label=account_label, report_to=user_id)
+
+        def send_one(group):
+            return telegram_manager.send_to_target(client_manager, group, message, image_files, album)
+
+        # حجز دفعات من المهمة حتى لا يتبقى شيء لهذا الحساب
+        while True:
+            batch = await job_store_call(job_store.claim, job_id, JOB_CLAIM_BATCH, client_manager.user_id)
+            if not batch:
+                break
+            await engine.run(batch, send_one, total=total, on_result=on_result)
+            await flush_completions()
+
+    results = await asyncio.gather(*(run_account(cm) for cm in assignments), return_exceptions=True)
+    for client_manager, result in zip(assignments, results):
+        if isinstance(result, Exception):
+            logger.error(f"Broadcast job {job_id} stopped for {client_manager.user_id}: {str(result)}")
+
+    await flush_completions()
+    counts = await job_store_call(_finish_job, job_id, payload)
+    remaining = counts[TARGET_PENDING] + counts[TARGET_CLAIMED]
+    title = "الإرسال المجدول" if payload.get('scheduled') else "الإرسال"
+    remaining_note = f" | ⏸️ {remaining} متبقي سيُستأنف لاحقاً" if remaining else ""
+    emit_log(user_id, f"📊 انتهى {title}: ✅ {counts[TARGET_DONE]} نجح | ❌ {counts[TARGET_FAILED]} فشل{remaining_note}")
+
+    return {
+        'total': total,
+        'successful': counts[TARGET_DONE],
+        'failed': counts[TARGET_FAILED],
+        'remaining': remaining,
+        'accounts': len(assignments)
+    }
 
-            # إرسال كل صورة منفصلة
-            results = []
-            for img_file in image_files:
-                try:
-                    result = client_manager.run_coroutine(
-                        client_manager.client.send_file(
-                            entity_obj, 
-                            img_file['path'],
-                            caption=f"📷 {img_file['name']}"
-                        )
-                    )
-                    results.append(result.id)
-                except Exception as img_error:
-                    logger.error(f"Error sending image {img_file['name']}: {str(img_error)}")
-                    raise img_error
+def start_broadcast_job(job_id):
+    """تشغيل أو استئناف مهمة بث على event loop حساب صاحبها وإرجاع future (أو None إذا كانت تعمل بالفعل)"""
+    if not _claim_job(job_id):
+        return None
 
-            return {"success": True, "message_ids": results}
+    try:
+        job = job_store.get(job_id)
+        user_id = job['user_id']
+        client_manager = telegram_manager.get_sender_manager(user_id)
+        with USERS_LOCK:
+            settings = dict(USERS[user_id].get('settings', {}))
+        pool = get_account_pool(user_id, job['payload'].get('accounts'))
+        if not pool:
+            # المهمة تبقى معلقة وتُستأنف عند تسجيل دخول حساب صالح
+            raise Exception("لا يوجد حساب متصل ومصرح له بالإرسال")
+
+        job_store.release_claims(job_id)
+        job_store.set_status(job_id, JOB_RUNNING)
+        future = client_manager.submit_coroutine(run_broadcast(job_id, pool, settings))
+    except Exception:
+        _release_job(job_id)
+        raise
 
+    def reset_job():
+        job_store.release_claims(job_id)
+        job_store.set_status(job_id, JOB_PENDING)
+
+    def on_done(done_future):
+        # تُستدعى غالباً على event loop المشترك - الكتابة في SQLite تتم في executor المُجدول
+        _release_job(job_id)
+        try:
+            done_future.result()
         except Exception as e:
-            logger.error(f"Send media error: {str(e)}")
-            raise Exception(str(e))
+            logger.error(f"Broadcast job {job_id} error: {str(e)}")
+            scheduler.schedule(('reset_job', job_id), time.time(), reset_job)
+            emit_log(user_id, f"❌ توقف الإرسال: {str(e)}")
+
+    future.add_done_callback(on_done)
+    return future
+
+def resume_user_jobs(user_id):
+    """استئناف مهام المستخدم غير المكتملة بعد إعادة التشغيل أو إعادة الاتصال"""
+    for job_id in job_store.unfinished(user_id):
+        job = job_store.get(job_id)
+        counts = job_store.counts(job_id)
+        remaining = counts[TARGET_PENDING] + counts[TARGET_CLAIMED]
 
-    def send_message_with_media_async(self, user_id, entity, message, image_files):
-        """إرسال رسالة مع صور - طريقة محسنة ومُصلحة"""
         try:
-            with USERS_LOCK:
-                if user_id not in USERS:
-                    raise Exception("المستخدم غير موجود")
+            if job['kind'] == 'broadcast':
+                started = start_broadcast_job(job_id)
+            elif job['kind'] == 'auto_join':
+                started = start_auto_join_job(job_id)
+            else:
+                continue
+        except Exception as e:
+            logger.warning(f"Could not resume job {job_id} for {user_id}: {str(e)}")
+            continue
 
-                client_manager = USERS[user_id].get('client_manager')
+        if started:
+            logger.info(f"Resumed {job['kind']} job {job_id} for {user_id}: {remaining} targets left")
+            emit_log(user_id, f"♻️ استئناف مهمة غير مكتملة: {remaining} من {counts['total']} متبقية")
 
-            if not client_manager:
-                raise Exception("العميل غير متصل")
+def schedule_job_resume(user_id, delay=0):
+    """جدولة استئناف مهام المستخدم في المُجدول المركزي"""
+    # المفتاح لا يبدأ بمعرف المستخدم حتى لا يُلغيه cancel_user عند إيقاف المراقبة - المهام مستقلة عنها
+    scheduler.schedule(('resume_jobs', user_id), time.time() + delay, lambda: resume_user_jobs(user_id))
 
-            is_authorized = client_manager.run_coroutine(
-                client_manager.client.is_user_authorized()
-            )
+# =========================== 
+# نظام المراقبة المحسن مع Event Handlers
+# ===========================
+AUTH_PROBE_INTERVAL = 300  # فحص التصريح في الخلفية كل 5 دقائق
+HEARTBEAT_INTERVAL = 30  # إرسال heartbeat كل 30 ثانية
 
-            if not is_authorized:
-                raise Exception("العميل غير مصرح")
+def start_monitoring_jobs(user_id):
+    """بدء المراقبة المحسنة مع Event Handlers وجدولة مهام المستخدم الدورية في المُجدول المركزي"""
+    logger.info(f"Starting enhanced monitoring with event handlers for user {user_id}")
 
-            try:
-                entity_obj = client_manager.run_coroutine(
-                    client_manager.client.get_entity(entity)
-                )
-            except:
-                if not entity.startswith('@') and not entity.startswith('https://'):
-                    entity = '@' + entity
-                entity_obj = client_manager.run_coroutine(
-                    client_manager.client.get_entity(entity)
-                )
+    with USERS_LOCK:
+        if user_id not in USERS:
+            raise Exception("بيانات المستخدم غير موجودة")
 
-            results = []
+        client_manager = USERS[user_id].get('client_manager')
+        settings = USERS[user_id]['settings']
+        USERS[user_id]['monitoring_active'] = True
+        USERS[user_id]['last_heartbeat'] = time.time()
+        USERS[user_id]['monitoring_start_time'] = time.time()
 
-            # إرسال الصور مع الرسالة النصية
-            if image_files and len(image_files) > 0:
-                # طريقة محسنة: إرسال جميع الصور مع النص كرسالة واحدة
-                try:
-                    # تحضير مسارات الصور
-                    image_paths = []
-                    for img_file in image_files:
-                        if os.path.exists(img_file['path']):
-                            image_paths.append(img_file['path'])
-                        else:
-                            logger.warning(f"Image file not found: {img_file['path']}")
-
-                    if image_paths:
-                        # إرسال كل الصور مع النص كرسالة واحدة
-                        if len(image_paths) == 1:
-                            # صورة واحدة فقط
-                            media_result = client_manager.run_coroutine(
-                                client_manager.client.send_file(
-                                    entity_obj, 
-                                    image_paths[0],
-                                    caption=message if message else "📷"
-                                )
-                            )
-                            results.append(media_result.id)
-                            logger.info(f"Successfully sent single image with message to {entity}")
-                        else:
-                            # عدة صور - إرسال النص أولاً ثم الصور أسفله واحدة تلو الأخرى
-                            # إرسال النص أولاً إذا كان موجوداً
-                            if message and message.strip():
-                                text_result = client_manager.run_coroutine(
-                                    client_manager.client.send_message(entity_obj, message)
-                                )
-                                results.append(text_result.id)
-
-                            # إرسال الصور واحدة تلو الأخرى أسفل الرسالة
-                            for i, img_path in enumerate(image_paths):
-                                try:
-                                    media_result = client_manager.run_coroutine(
-                                        client_manager.client.send_file(
-                                            entity_obj, 
-                                            img_path,
-                                            caption=f"📷 صورة {i+1} من {len(image_paths)}"
-                                        )
-                                    )
-                                    results.append(media_result.id)
-                                    logger.info(f"Sent image {i+1}/{len(image_paths)} to {entity}")
-                                except Exception as img_error:
-                                    logger.error(f"Error sending individual image {i+1}: {str(img_error)}")
-                                    continue
-
-                            logger.info(f"Successfully sent message + {len(image_paths)} images to {entity}")
-
-                except Exception as media_error:
-                    logger.error(f"Error in media sending process: {str(media_error)}")
-                    # كحل أخير، أرسل النص فقط
-                    if message and message.strip():
-                        text_result = client_manager.run_coroutine(
-                            client_manager.client.send_message(entity_obj, message)
-                        )
-                        results.append(text_result.id)
-                        logger.info(f"Sent text only due to media error: {str(media_error)}")
-            else:
-                # إذا لم تكن هناك صور، أرسل الرسالة النصية فقط
-                if message and message.strip():
-                    text_result = client_manager.run_coroutine(
-                        client_manager.client.send_message(entity_obj, message)
-                    )
-                    results.append(text_result.id)
-                    logger.info(f"Successfully sent text message to {entity}")
+    if not client_manager:
+        raise Exception("العميل غير متصل")
+
+    # تحديث إعدادات المراقبة في العميل
+    watch_words = settings.get('watch_words', [])
+    send_groups = settings.get('groups', [])  # مجموعات الإرسال فقط
+
+    client_manager.update_monitoring_settings(
+        watch_words, send_groups, settings.get('arabic_normalization', False)
+    )
+
+    # إرسال إشعار بدء المراقبة
+    auto_reply_status = "مُفعل" if settings.get('auto_reply_enabled', False) else "مُعطل"
+    if watch_words:
+        emit_log(user_id, f"🚀 بدأت المراقبة الشاملة الفورية - {len(watch_words)} كلمة مراقبة في كامل الحساب | الرد التلقائي: {auto_reply_status} | الإرسال لـ {len(send_groups)} مجموعة")
+    else:
+        emit_log(user_id, f"🚀 بدأت المراقبة الشاملة لكامل الرسائل في الحساب | الرد التلقائي: {auto_reply_status} | الإرسال لـ {len(send_groups)} مجموعة")
+
+    now = time.time()
+    scheduler.schedule((user_id, 'heartbeat'), now + HEARTBEAT_INTERVAL, lambda: heartbeat_job(user_id))
+
+    # فحص التصريح فوراً إذا كانت الحالة غير معروفة وإلا عند انتهاء صلاحية آخر فحص
+    auth_due = now if client_manager.authorized is None else client_manager.authorized_checked_at + AUTH_PROBE_INTERVAL
+    scheduler.schedule((user_id, 'auth_probe'), auth_due, lambda: auth_probe_job(user_id))
 
-            return {"success": True, "message_ids": results}
+    schedule_scheduled_send(user_id)
 
-        except Exception as e:
-            logger.error(f"Send message with media error: {str(e)}")
-            raise Exception(str(e))
+def stop_monitoring_jobs(user_id):
+    """إلغاء مهام المستخدم من المُجدول وتحديث حالته"""
+    scheduler.cancel_user(user_id)
 
+    with USERS_LOCK:
+        if user_id in USERS:
+            USERS[user_id]['is_running'] = False
+            USERS[user_id]['monitoring_active'] = False
+            USERS[user_id]['thread'] = None
 
-# إنشاء مدير التليجرام
-telegram_manager = TelegramManager()
+    emit_log(user_id, "⏹ تم إيقاف نظام المراقبة المحسن")
 
-# =========================== 
-# نظام المراقبة المحسن مع Event Handlers
-# ===========================
-def monitoring_worker(user_id):
-    """مهمة المراقبة المحسنة مع Event Handlers وحماية من التوقف"""
-    logger.info(f"Starting enhanced monitoring worker with event handlers for user {user_id}")
+    socketio.emit('heartbeat', {
+        'timestamp': time.strftime('%H:%M:%S'),
+        'status': 'stopped'
+    }, to=user_id)
+
+    logger.info(f"Enhanced monitoring ended for user {user_id}")
+
+def schedule_scheduled_send(user_id):
+    """جدولة الإرسال المجدول التالي حسب الإعدادات الحالية والموعد المحفوظ أو إلغاؤه إذا كان الإرسال يدوياً"""
+    with USERS_LOCK:
+        user = USERS.get(user_id)
+        if not user or not user.get('is_running', False):
+            return
+        settings = user.get('settings', {})
+
+    if settings.get('send_type', 'manual') != 'scheduled':
+        scheduler.cancel((user_id, 'scheduled_send'))
+        return
 
     try:
-        with USERS_LOCK:
-            if user_id not in USERS:
-                logger.error(f"No user data found for {user_id}")
-                return
+        rule = ScheduleRule.from_settings(settings, SCHEDULE_TIMEZONE)
+    except ValueError as e:
+        scheduler.cancel((user_id, 'scheduled_send'))
+        emit_log(user_id, f"⚠️ إعدادات الجدولة غير صحيحة: {str(e)}")
+        return
 
-            USERS[user_id]['monitoring_active'] = True
-            USERS[user_id]['last_heartbeat'] = time.time()
-            client_manager = USERS[user_id].get('client_manager')
-            settings = USERS[user_id]['settings']
+    now = time.time()
+    state = schedule_store.get(user_id)
 
-        if not client_manager:
-            logger.error(f"No client manager for user {user_id}")
-            return
+    if state.get('signature') == rule.signature:
+        # نفس القاعدة: نكمل من الموعد المحفوظ - موعد فات أثناء التوقف يُنفذ مرة واحدة الآن
+        next_fire = state.get('next_fire')
+    elif rule.mode == 'interval':
+        last_fire = state.get('last_fire')
+        next_fire = last_fire + rule.interval_seconds if last_fire else now
+        schedule_store.put(user_id, rule.signature, next_fire)
+    else:
+        next_fire = rule.next_fire(now)
+        schedule_store.put(user_id, rule.signature, next_fire)
 
-        # تحديث إعدادات المراقبة في العميل
-        watch_words = settings.get('watch_words', [])
-        send_groups = settings.get('groups', [])  # مجموعات الإرسال فقط
+    if next_fire is None:
+        scheduler.cancel((user_id, 'scheduled_send'))
+        return
 
-        if hasattr(client_manager, 'update_monitoring_settings'):
-            client_manager.update_monitoring_settings(watch_words, send_groups)
-        else:
-            logger.warning(f"Client manager for {user_id} does not have update_monitoring_settings method.")
+    scheduler.schedule((user_id, 'scheduled_send'), max(next_fire, now),
+                       lambda: scheduled_send_job(user_id))
 
-        # إرسال إشعار بدء المراقبة
-        auto_reply_status = "مُفعل" if settings.get('auto_reply_enabled', False) else "مُعطل"
-        if watch_words:
-            socketio.emit('log_update', {
-                "message": f"🚀 بدأت المراقبة الشاملة الفورية - {len(watch_words)} كلمة مراقبة في كامل الحساب | الرد التلقائي: {auto_reply_status} | الإرسال لـ {len(send_groups)} مجموعة"
-            }, to=user_id)
-        else:
-            socketio.emit('log_update', {
-                "message": f"🚀 بدأت المراقبة الشاملة لكامل الرسائل في الحساب | الرد التلقائي: {auto_reply_status} | الإرسال لـ {len(send_groups)} مجموعة"
-            }, to=user_id)
+    if next_fire > now:
+        emit_log(user_id, f"📅 الإرسال المجدول ({rule.describe()}) - الموعد التالي: {time.strftime('%Y-%m-%d %H:%M', time.localtime(next_fire))}")
 
-        # الحفاظ على المراقبة نشطة مع نظام مراقبة محسن
-        consecutive_errors = 0
-        max_consecutive_errors = 3
-        last_activity_check = time.time()
-        heartbeat_interval = 30  # إرسال heartbeat كل 30 ثانية
+def heartbeat_job(user_id):
+    """إرسال إشارة حياة محسنة - واكتشاف توقف المراقبة من أي مسار (تسجيل خروج، إيقاف...)"""
+    with USERS_LOCK:
+        user = USERS.get(user_id)
+        running = bool(user and user.get('is_running', False))
+        if running:
+            user['monitoring_active'] = True
+            user['last_heartbeat'] = time.time()
+            settings = user.get('settings', {})
+            client_manager = user.get('client_manager')
+            start_time = user.get('monitoring_start_time', time.time())
+
+    if not running:
+        stop_monitoring_jobs(user_id)
+        return None
 
-        while True:
-            with USERS_LOCK:
-                if user_id not in USERS or not USERS[user_id].get('is_running', False):
-                    logger.info(f"Stopping monitoring for user {user_id} as is_running is False")
-                    break
+    current_time = time.time()
+    status_info = {
+        'timestamp': time.strftime('%H:%M:%S'),
+        'status': 'active',
+        'type': 'event_driven_monitoring',
+        'keywords_active': bool(settings.get('watch_words')),
+        'event_handlers': True,
+        'auto_reply_enabled': settings.get('auto_reply_enabled', False),
+        'uptime': int(current_time - start_time)
+    }
+    if client_manager:
+        status_info['entity_cache'] = client_manager.entity_cache.stats()
+        status_info['pacing'] = client_manager.pacing.stats()
 
-                user_data = USERS[user_id].copy()
-                USERS[user_id]['monitoring_active'] = True
-                USERS[user_id]['last_heartbeat'] = time.time()
+    socketio.emit('heartbeat', status_info, to=user_id)
 
-            try:
-                current_time = time.time()
+    # تسجيل نشاط دوري كل 5 دقائق
+    if int(current_time) % 300 < HEARTBEAT_INTERVAL:
+        emit_log(user_id, f"✅ المراقبة نشطة - آخر فحص: {time.strftime('%H:%M:%S')}")
 
-                # فحص حالة العميل والاتصال
-                if client_manager and client_manager.client:
-                    try:
-                        # فحص دوري لحالة الاتصال
-                        is_connected = client_manager.run_coroutine(
-                            client_manager.client.is_user_authorized()
-                        )
-                        
-                        if not is_connected:
-                            logger.warning(f"Client not authorized for user {user_id}, attempting reconnection...")
-                            socketio.emit('log_update', {
-                                "message": "⚠️ فقدان الاتصال - محاولة إعادة الاتصال..."
-                            }, to=user_id)
-                            # محاولة إعادة الاتصال
-                            client_manager.start_client_thread()
-                            
-                    except Exception as conn_error:
-                        logger.warning(f"Connection check failed for user {user_id}: {str(conn_error)}")
-
-                # تنفيذ الإرسال المجدول إذا كان مطلوب
-                settings = user_data.get('settings', {})
-                send_type = settings.get('send_type', 'manual')
-
-                if send_type == 'scheduled':
-                    interval_seconds = int(settings.get('interval_seconds', 3600))
-                    last_send = user_data.get('last_scheduled_send', 0)
-
-                    if current_time - last_send >= interval_seconds:
-                        logger.info(f"Executing scheduled send for user {user_id}")
-                        execute_scheduled_messages(user_id, settings)
-
-                        with USERS_LOCK:
-                            if user_id in USERS:
-                                USERS[user_id]['last_scheduled_send'] = current_time
-
-                consecutive_errors = 0
-
-                # إرسال إشارة حياة محسنة
-                if current_time - last_activity_check >= heartbeat_interval:
-                    status_info = {
-                        'timestamp': time.strftime('%H:%M:%S'),
-                        'status': 'active',
-                        'type': 'event_driven_monitoring',
-                        'keywords_active': bool(watch_words),
-                        'event_handlers': True,
-                        'auto_reply_enabled': settings.get('auto_reply_enabled', False),
-                        'uptime': int(current_time - USERS[user_id].get('monitoring_start_time', current_time))
-                    }
+    return current_time + HEARTBEAT_INTERVAL
 
-                    socketio.emit('heartbeat', status_info, to=user_id)
-                    last_activity_check = current_time
+def auth_probe_job(user_id):
+    """فحص حالة العميل والاتصال - منخفض التكرار"""
+    with USERS_LOCK:
+        user = USERS.get(user_id)
+        if not user or not user.get('is_running', False):
+            return None
+        client_manager = user.get('client_manager')
 
-                    # تسجيل نشاط دوري كل 5 دقائق
-                    if int(current_time) % 300 == 0:
-                        socketio.emit('log_update', {
-                            "message": f"✅ المراقبة نشطة - آخر فحص: {time.strftime('%H:%M:%S')}"
-                        }, to=user_id)
+    if client_manager and client_manager.client:
+        try:
+            is_connected = client_manager.run_coroutine(
+                client_manager.refresh_authorization()
+            )
 
-            except Exception as e:
-                consecutive_errors += 1
-                logger.error(f"Monitoring cycle error for {user_id}: {str(e)}")
+            if not is_connected:
+                logger.warning(f"Client not authorized for user {user_id}, attempting reconnection...")
+                emit_log(user_id, "⚠️ فقدان الاتصال - محاولة إعادة الاتصال...")
+                # محاولة إعادة الاتصال
+                client_manager.start_client_thread()
 
-                socketio.emit('log_update', {
-                    "message": f"⚠️ خطأ في المراقبة ({consecutive_errors}/{max_consecutive_errors}): {str(e)[:100]}"
-                }, to=user_id)
+        except Exception as conn_error:
+            logger.warning(f"Connection check failed for user {user_id}: {str(conn_error)}")
 
-                if consecutive_errors >= max_consecutive_errors:
-                    socketio.emit('log_update', {
-                        "message": f"❌ إيقاف مؤقت للمراقبة - محاولة إعادة التشغيل خلال 30 ثانية..."
-                    }, to=user_id)
-                    
-                    # انتظار 30 ثانية ثم محاولة إعادة التشغيل
-                    time.sleep(30)
-                    consecutive_errors = 0
-                    
-                    socketio.emit('log_update', {
-                        "message": f"🔄 إعادة تشغيل المراقبة..."
-                    }, to=user_id)
-                    continue
+    return time.time() + AUTH_PROBE_INTERVAL
 
-            # فترة انتظار مناسبة
-            time.sleep(5)  # تقليل الفترة لاستجابة أسرع
+def scheduled_send_job(user_id):
+    """تنفيذ الإرسال المجدول في موعده وإرجاع الموعد التالي"""
+    with USERS_LOCK:
+        user = USERS.get(user_id)
+        if not user or not user.get('is_running', False):
+            return None
+        settings = user.get('settings', {})
 
-    except Exception as e:
-        logger.error(f"Monitoring worker top-level error for {user_id}: {str(e)}")
-        socketio.emit('log_update', {
-            "message": f"❌ خطأ رئيسي في المراقبة: {str(e)}"
-        }, to=user_id)
-    finally:
-        with USERS_LOCK:
-            if user_id in USERS:
-                USERS[user_id]['is_running'] = False
-                USERS[user_id]['monitoring_active'] = False
-                USERS[user_id]['thread'] = None
+    if settings.get('send_type', 'manual') != 'scheduled':
+        return None
 
-        socketio.emit('log_update', {
-            "message": "⏹ تم إيقاف نظام المراقبة المحسن"
-        }, to=user_id)
+    try:
+        rule = ScheduleRule.from_settings(settings, SCHEDULE_TIMEZONE)
+    except ValueError as e:
+        logger.error(f"Invalid schedule for {user_id}: {str(e)}")
+        return None
 
-        socketio.emit('heartbeat', {
-            'timestamp': time.strftime('%H:%M:%S'),
-            'status': 'stopped'
-        }, to=user_id)
+    # حفظ الموعد التالي قبل الإرسال: إعادة التشغيل أثناء الإرسال لا تكرره
+    # والمواعيد الفائتة أثناء التوقف تُختصر في إرسال واحد
+    started = time.time()
+    next_fire = rule.next_fire(started)
+    schedule_store.put(user_id, rule.signature, next_fire, last_fire=started)
+
+    logger.info(f"Executing scheduled send for user {user_id}")
+    try:
+        execute_scheduled_messages(user_id, settings)
+    except Exception as e:
+        logger.error(f"Scheduled send job error for {user_id}: {str(e)}")
+        emit_log(user_id, f"⚠️ خطأ في الإرسال المجدول: {str(e)[:100]}")
 
-        logger.info(f"Enhanced monitoring worker ended for user {user_id}")
+    return next_fire
 
 def execute_scheduled_messages(user_id, settings):
     """تنفيذ الإرسال المجدول"""
@@ -1478,45 +3008,22 @@ def execute_scheduled_messages(user_id, settings):
         return
 
     try:
-        socketio.emit('log_update', {
-            "message": f"📅 تنفيذ الإرسال المجدول إلى {len(groups)} مجموعة"
-        }, to=user_id)
-
-        successful = 0
-        failed = 0
-
-        for i, group in enumerate(groups, 1):
-            try:
-                result = telegram_manager.send_message_async(user_id, group, message)
-
-                socketio.emit('log_update', {
-                    "message": f"✅ [{i}/{len(groups)}] إرسال مجدول نجح إلى: {group}"
-                }, to=user_id)
-
-                successful += 1
-                with USERS_LOCK:
-                    if user_id in USERS:
-                        USERS[user_id]['stats']['sent'] += 1
-
-                if i < len(groups):
-                    time.sleep(3)
-
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Scheduled send error to {group}: {error_msg}")
-
-                socketio.emit('log_update', {
-                    "message": f"❌ [{i}/{len(groups)}] إرسال مجدول فشل إلى {group}"
-                }, to=user_id)
+        if not get_account_pool(user_id, settings.get('broadcast_accounts')):
+            logger.warning(f"Scheduled messages skipped for {user_id}: no authorized account")
+            emit_log(user_id, "❌ تعذر الإرسال المجدول: لا يوجد حساب متصل ومصرح له بالإرسال")
+            return
 
-                failed += 1
-                with USERS_LOCK:
-                    if user_id in USERS:
-                        USERS[user_id]['stats']['errors'] += 1
+        emit_log(user_id, f"📅 تنفيذ الإرسال المجدول إلى {len(groups)} مجموعة")
 
-        socketio.emit('log_update', {
-            "message": f"📊 انتهى الإرسال المجدول: ✅ {successful} نجح | ❌ {failed} فشل"
-        }, to=user_id)
+        job_id = create_broadcast_job(
+            user_id, groups, message,
+            accounts=settings.get('broadcast_accounts'),
+            scheduled=True
+        )
+        future = start_broadcast_job(job_id)
+        if future is not None:
+            # الانتظار حتى لا يتداخل موعدان لنفس المستخدم
+            future.result()
 
     except Exception as e:
         logger.error(f"Scheduled messages error: {str(e)}")
@@ -1872,21 +3379,20 @@ def api_save_login():
     if current_settings.get('phone') and current_settings.get('phone') != new_phone:
         logger.info(f"Phone number changed for {user_id} from {current_settings.get('phone')} to {new_phone}")
 
-        # إيقاف الجلسة الحالية إذا كانت نشطة
+        # إيقاف الجلسة الحالية إذا كانت نشطة - العميل يُوقف بعد تحرير القفل لأن stop() تنتظر
+        client_manager = None
         with USERS_LOCK:
             if user_id in USERS:
                 if USERS[user_id].get('is_running'):
                     USERS[user_id]['is_running'] = False
 
                 client_manager = USERS[user_id].get('client_manager')
-                if client_manager:
-                    client_manager.stop()
-
                 del USERS[user_id]
 
-        socketio.emit('log_update', {
-            "message": f"🔄 تم تحديث رقم الهاتف لـ {PREDEFINED_USERS[user_id]['name']}"
-        }, to=user_id)
+        if client_manager:
+            client_manager.stop()
+
+        emit_log(user_id, f"🔄 تم تحديث رقم الهاتف لـ {PREDEFINED_USERS[user_id]['name']}")
 
     settings = {
         'phone': new_phone,
@@ -1901,9 +3407,7 @@ def api_save_login():
         })
 
     try:
-        socketio.emit('log_update', {
-            "message": f"🔄 بدء عملية تسجيل الدخول لـ {PREDEFINED_USERS[user_id]['name']}..."
-        }, to=user_id)
+        emit_log(user_id, f"🔄 بدء عملية تسجيل الدخول لـ {PREDEFINED_USERS[user_id]['name']}...")
 
         # تحديث أو إنشاء الجلسة للمستخدم الحالي فقط
         with USERS_LOCK:
@@ -1929,9 +3433,7 @@ def api_save_login():
         result = telegram_manager.setup_client(user_id, settings['phone'])
 
         if result["status"] == "success":
-            socketio.emit('log_update', {
-                "message": "✅ تم تسجيل الدخول بنجاح"
-            }, to=user_id)
+            emit_log(user_id, "✅ تم تسجيل الدخول بنجاح")
 
             socketio.emit('connection_status', {
                 "status": "connected"
@@ -1952,9 +3454,7 @@ def api_save_login():
             })
 
         elif result["status"] == "code_required":
-            socketio.emit('log_update', {
-                "message": "📱 تم إرسال كود التحقق"
-            }, to=user_id)
+            emit_log(user_id, "📱 تم إرسال كود التحقق")
 
             return jsonify({
                 "success": True, 
@@ -1964,9 +3464,7 @@ def api_save_login():
 
         else:
             error_message = result.get('message', 'خطأ غير معروف')
-            socketio.emit('log_update', {
-                "message": f"❌ {error_message}"
-            }, to=user_id)
+            emit_log(user_id, f"❌ {error_message}")
 
             return jsonify({
                 "success": False, 
@@ -1975,9 +3473,7 @@ def api_save_login():
 
     except Exception as e:
         logger.error(f"Login error for user {user_id}: {str(e)}")
-        socketio.emit('log_update', {
-            "message": f"❌ خطأ: {str(e)}"
-        }, to=user_id)
+        emit_log(user_id, f"❌ خطأ: {str(e)}")
 
         return jsonify({
             "success": False, 
@@ -2018,9 +3514,7 @@ def api_verify_code():
             result = telegram_manager.verify_password(user_id, password)
 
         if result["status"] == "success":
-            socketio.emit('log_update', {
-                "message": "✅ تم التحقق بنجاح"
-            }, to=user_id)
+            emit_log(user_id, "✅ تم التحقق بنجاح")
 
             socketio.emit('connection_status', {
                 "status": "connected"
@@ -2040,9 +3534,7 @@ def api_verify_code():
 
         else:
             error_message = result.get('message', 'فشل التحقق')
-            socketio.emit('log_update', {
-                "message": f"❌ {error_message}"
-            }, to=user_id)
+            emit_log(user_id, f"❌ {error_message}")
 
             return jsonify({
                 "success": False, 
@@ -2050,9 +3542,7 @@ def api_verify_code():
             })
 
     except Exception as e:
-        socketio.emit('log_update', {
-            "message": f"❌ خطأ في التحقق: {str(e)}"
-        }, to=user_id)
+        emit_log(user_id, f"❌ خطأ في التحقق: {str(e)}")
 
         return jsonify({
             "success": False, 
@@ -2094,14 +3584,33 @@ def api_save_settings():
         'groups': [g.strip() for g in data.get('groups', '').split('\n') if g.strip()],
         'interval_seconds': int(data.get('interval_seconds', 3600)),
         'watch_words': [w.strip() for w in data.get('watch_words', '').split('\n') if w.strip()],
+        'arabic_normalization': bool(data.get('arabic_normalization', False)),
         'send_type': data.get('send_type', 'manual'),
         'scheduled_time': data.get('scheduled_time', ''),
+        'schedule_mode': data.get('schedule_mode', current_settings.get('schedule_mode', 'interval')),
+        'schedule_cron': (data.get('schedule_cron', current_settings.get('schedule_cron', '')) or '').strip(),
+        'schedule_timezone': (data.get('schedule_timezone', current_settings.get('schedule_timezone', '')) or '').strip(),
         'max_retries': int(data.get('max_retries', 5)),
+        'send_concurrency': int(data.get('send_concurrency', current_settings.get('send_concurrency', 3))),
+        'send_rate_per_minute': int(data.get('send_rate_per_minute', current_settings.get('send_rate_per_minute', 30))),
+        'broadcast_accounts': data.get('broadcast_accounts', current_settings.get('broadcast_accounts', [])),
         'auto_reconnect': data.get('auto_reconnect', False),
         'auto_reply_enabled': data.get('auto_reply_enabled', False),
-        'auto_replies': auto_replies
+        'auto_replies': auto_replies,
+        'alert_digest': bool(data.get('alert_digest', current_settings.get('alert_digest', False))),
+        'alert_digest_window': max(ALERT_DIGEST_MIN_WINDOW, int(data.get('alert_digest_window', current_settings.get('alert_digest_window', ALERT_DIGEST_DEFAULT_WINDOW)) or ALERT_DIGEST_DEFAULT_WINDOW)),
+        'alert_urgent_keywords': [w.strip() for w in data.get('alert_urgent_keywords', '\n'.join(current_settings.get('alert_urgent_keywords', []))).split('\n') if w.strip()]
     })
 
+    if current_settings['send_type'] == 'scheduled':
+        try:
+            ScheduleRule.from_settings(current_settings, SCHEDULE_TIMEZONE)
+        except ValueError as e:
+            return jsonify({
+                "success": False, 
+                "message": f"❌ إعدادات الجدولة غير صحيحة: {str(e)}"
+            })
+
     if save_settings(user_id, current_settings):
         with USERS_LOCK:
             if user_id in USERS:
@@ -2111,13 +3620,15 @@ def api_save_settings():
                 if client_manager and hasattr(client_manager, 'update_monitoring_settings'):
                     client_manager.update_monitoring_settings(
                         current_settings.get('watch_words', []),
-                        current_settings.get('groups', [])
+                        current_settings.get('groups', []),
+                        current_settings.get('arabic_normalization', False)
                     )
 
+        # تطبيق نوع وفترة الإرسال الجديدة على المُجدول إذا كانت المراقبة تعمل
+        schedule_scheduled_send(user_id)
+
         auto_reply_msg = "مُفعل" if current_settings.get('auto_reply_enabled', False) else "مُعطل"
-        socketio.emit('log_update', {
-            "message": f"✅ تم حفظ الإعدادات بنجاح - الرد التلقائي: {auto_reply_msg}"
-        }, to=user_id)
+        emit_log(user_id, f"✅ تم حفظ الإعدادات بنجاح - الرد التلقائي: {auto_reply_msg}")
 
         return jsonify({
             "success": True, 
@@ -2142,32 +3653,34 @@ def api_user_logout():
     try:
         logger.info(f"User {user_id} logging out...")
 
+        # إخراج المستخدم تحت القفل ثم إيقاف العميل بعد تحريره - stop() تنتظر حتى 5 ثوانٍ
+        # والـ event loop المشترك يحتاج USERS_LOCK لكل الحسابات
+        client_manager = None
         with USERS_LOCK:
             if user_id in USERS:
-                # إيقاف العميل والمراقبة
+                # إيقاف المراقبة أولاً
+                if USERS[user_id].get('is_running'):
+                    USERS[user_id]['is_running'] = False
                 client_manager = USERS[user_id].get('client_manager')
-                if client_manager:
-                    try:
-                        # إيقاف المراقبة أولاً
-                        if USERS[user_id].get('is_running'):
-                            USERS[user_id]['is_running'] = False
-
-                        # قطع الاتصال وإيقاف العميل
-                        if hasattr(client_manager, 'client') and client_manager.client:
-                            client_manager.client.disconnect()
-                            logger.info(f"Client disconnected for user {user_id}")
-
-                        # إيقاف thread إذا كان يعمل
-                        if hasattr(client_manager, 'stop'):
-                            client_manager.stop()
-
-                    except Exception as e:
-                        logger.error(f"خطأ في إغلاق العميل للمستخدم {user_id}: {e}")
 
                 # حذف بيانات المستخدم من الذاكرة
                 del USERS[user_id]
                 logger.info(f"User data removed from memory for {user_id}")
 
+        if client_manager:
+            try:
+                # قطع الاتصال وإيقاف العميل
+                if hasattr(client_manager, 'client') and client_manager.client:
+                    client_manager.client.disconnect()
+                    logger.info(f"Client disconnected for user {user_id}")
+
+                # إيقاف thread إذا كان يعمل
+                if hasattr(client_manager, 'stop'):
+                    client_manager.stop()
+
+            except Exception as e:
+                logger.error(f"خطأ في إغلاق العميل للمستخدم {user_id}: {e}")
+
         # مسح ملفات جلسة التليجرام
         session_file = os.path.join(SESSIONS_DIR, f"{user_id}_session.session")
         if os.path.exists(session_file):
@@ -2194,9 +3707,7 @@ def api_user_logout():
                 logger.error(f"خطأ في مسح الإعدادات: {e}")
 
         # إرسال إشعار مسح الجلسة
-        socketio.emit('log_update', {
-            "message": "🚪 تم تسجيل الخروج وإنهاء جلسة التليجرام"
-        }, to=user_id)
+        emit_log(user_id, "🚪 تم تسجيل الخروج وإنهاء جلسة التليجرام")
 
         socketio.emit('connection_status', {
             "status": "disconnected"
@@ -2347,20 +3858,10 @@ def api_start_monitoring():
 
         USERS[user_id]['is_running'] = True
 
-    socketio.emit('log_update', {
-        "message": "🚀 بدء تشغيل نظام المراقبة المحسن مع Event Handlers..."
-    }, to=user_id)
+    emit_log(user_id, "🚀 بدء تشغيل نظام المراقبة المحسن مع Event Handlers...")
 
     try:
-        monitoring_thread = threading.Thread(
-            target=monitoring_worker, 
-            args=(user_id,), 
-            daemon=True
-        )
-        monitoring_thread.start()
-
-        with USERS_LOCK:
-            USERS[user_id]['thread'] = monitoring_thread
+        start_monitoring_jobs(user_id)
 
         # إرسال تحديث حالة المراقبة للواجهة
         socketio.emit('monitoring_status', {
@@ -2404,9 +3905,7 @@ def api_stop_monitoring():
     with USERS_LOCK:
         if user_id in USERS and USERS[user_id]['is_running']:
             USERS[user_id]['is_running'] = False
-            socketio.emit('log_update', {
-                "message": "⏹ إيقاف نظام المراقبة..."
-            }, to=user_id)
+            emit_log(user_id, "⏹ إيقاف نظام المراقبة...")
 
             # إرسال تحديث حالة المراقبة للواجهة
             socketio.emit('monitoring_status', {
@@ -2419,15 +3918,17 @@ def api_stop_monitoring():
             socketio.emit('update_monitoring_buttons', {
                 "is_running": False
             }, to=user_id)
-
+        else:
             return jsonify({
-                "success": True, 
-                "message": "⏹ تم إيقاف المراقبة"
+                "success": False, 
+                "message": "❌ النظام غير مشغل"
             })
 
+    stop_monitoring_jobs(user_id)
+
     return jsonify({
-        "success": False, 
-        "message": "❌ النظام غير مشغل"
+        "success": True, 
+        "message": "⏹ تم إيقاف المراقبة"
     })
 
 @app.route("/api/send_now", methods=["POST"])
@@ -2454,6 +3955,15 @@ def api_send_now():
                 "message": "❌ يجب تسجيل الدخول أولاً"
             })
 
+        client_manager = USERS[user_id].get('client_manager')
+        settings = USERS[user_id].get('settings', {})
+
+    if not client_manager or not client_manager.loop:
+        return jsonify({
+            "success": False, 
+            "message": "❌ العميل غير متصل"
+        })
+
     # قراءة البيانات من الطلب المرسل من JavaScript
     data = request.get_json()
     if not data:
@@ -2465,6 +3975,10 @@ def api_send_now():
     message = data.get('message', '').strip()
     groups = data.get('groups', '').strip()
     images = data.get('images', [])
+    album_mode = bool(data.get('album_mode', True))
+    # "all" أو قائمة معرفات حسابات أخرى مسجلة تشارك في الإرسال
+    accounts = data.get('accounts', settings.get('broadcast_accounts'))
+    pool = get_account_pool(user_id, accounts)
 
     # التحقق من وجود محتوى للإرسال
     if not message and not images:
@@ -2488,36 +4002,43 @@ def api_send_now():
             "message": "❌ يجب تحديد مجموعة واحدة على الأقل"
         })
 
-    # تحضير الصور إذا وجدت
+    if not pool:
+        return jsonify({
+            "success": False, 
+            "message": "❌ لا يوجد حساب متصل ومصرح له بالإرسال - يرجى إعادة تسجيل الدخول"
+        })
+
+    # تحضير الصور إذا وجدت - تُحفظ مع المهمة حتى يمكن استئنافها بعد إعادة التشغيل
     image_files = []
+    media_dir = None
     if images:
         try:
             import base64
-            import tempfile
 
-            for img_data in images:
+            media_dir = os.path.join(JOB_MEDIA_DIR, uuid.uuid4().hex[:12])
+            os.makedirs(media_dir, exist_ok=True)
+
+            for index, img_data in enumerate(images):
                 # استخراج البيانات من Base64
                 base64_data = img_data['data'].split(',')[1]  # إزالة البادئة
                 image_bytes = base64.b64decode(base64_data)
 
-                # إنشاء ملف مؤقت
-                temp_file = tempfile.NamedTemporaryFile(delete=False, 
-                                                     suffix=f".{img_data['type'].split('/')[-1]}")
-                temp_file.write(image_bytes)
-                temp_file.flush()
+                image_path = os.path.join(media_dir, f"{index}.{img_data['type'].split('/')[-1]}")
+                with open(image_path, 'wb') as image_file:
+                    image_file.write(image_bytes)
 
                 image_files.append({
-                    'path': temp_file.name,
+                    'path': image_path,
                     'name': img_data['name'],
                     'type': img_data['type']
                 })
 
-            socketio.emit('log_update', {
-                "message": f"📷 تم تحضير {len(image_files)} صورة للإرسال"
-            }, to=user_id)
+            emit_log(user_id, f"📷 تم تحضير {len(image_files)} صورة للإرسال")
 
         except Exception as e:
             logger.error(f"Error processing images: {str(e)}")
+            if media_dir:
+                shutil.rmtree(media_dir, ignore_errors=True)
             return jsonify({
                 "success": False,
                 "message": f"❌ خطأ في معالجة الصور: {str(e)}"
@@ -2529,90 +4050,31 @@ def api_send_now():
     elif images:
         content_type = f"{len(images)} صورة"
 
-    socketio.emit('log_update', {
-        "message": f"🚀 بدء الإرسال الفوري: {content_type} إلى {len(groups_list)} مجموعة"
-    }, to=user_id)
-
-    def send_messages_with_images():
-        try:
-            successful = 0
-            failed = 0
-
-            for i, group in enumerate(groups_list, 1):
-                try:
-                    if images and message:
-                        # إرسال الصور مع النص
-                        result = telegram_manager.send_message_with_media_async(
-                            user_id, group, message, image_files
-                        )
-                    elif images:
-                        # إرسال الصور فقط
-                        result = telegram_manager.send_media_async(
-                            user_id, group, image_files
-                        )
-                    else:
-                        # إرسال النص فقط
-                        result = telegram_manager.send_message_async(user_id, group, message)
-
-                    socketio.emit('log_update', {
-                        "message": f"✅ [{i}/{len(groups_list)}] نجح إلى: {group}"
-                    }, to=user_id)
-
-                    successful += 1
-                    with USERS_LOCK:
-                        if user_id in USERS:
-                            USERS[user_id]['stats']['sent'] += 1
-
-                    socketio.emit('stats_update', USERS[user_id]['stats'], to=user_id)
-
-                    if i < len(groups_list):
-                        time.sleep(3)
-
-                except Exception as e:
-                    error_msg = str(e)
-                    if "banned" in error_msg.lower():
-                        error_type = "محظور"
-                    elif "private" in error_msg.lower():
-                        error_type = "خاص/محدود"
-                    elif "can't write" in error_msg.lower():
-                        error_type = "غير مسموح"
-                    else:
-                        error_type = "خطأ"
-
-                    logger.error(f"Send error to {group}: {error_msg}")
-                    socketio.emit('log_update', {
-                        "message": f"❌ [{i}/{len(groups_list)}] فشل إلى {group}: {error_type}"
-                    }, to=user_id)
-
-                    failed += 1
-                    with USERS_LOCK:
-                        if user_id in USERS:
-                            USERS[user_id]['stats']['errors'] += 1
-
-                    socketio.emit('stats_update', USERS[user_id]['stats'], to=user_id)
-
-            # ملخص نهائي
-            socketio.emit('log_update', {
-                "message": f"📊 انتهى الإرسال: ✅ {successful} نجح | ❌ {failed} فشل"
-            }, to=user_id)
-
-        except Exception as e:
-            logger.error(f"Send thread error: {str(e)}")
-        finally:
-            # تنظيف الملفات المؤقتة
-            for img_file in image_files:
-                try:
-                    if os.path.exists(img_file['path']):
-                        os.unlink(img_file['path'])
-                        logger.info(f"Cleaned up temp file: {img_file['name']}")
-                except Exception as e:
-                    logger.error(f"Error cleaning temp file {img_file.get('name', 'unknown')}: {str(e)}")
+    accounts_note = f" عبر {len(pool)} حساب" if len(pool) > 1 else ""
+    emit_log(user_id, f"🚀 بدء الإرسال الفوري: {content_type} إلى {len(groups_list)} مجموعة{accounts_note}")
 
-    threading.Thread(target=send_messages_with_images, daemon=True).start()
+    job_id = create_broadcast_job(
+        user_id, groups_list, message,
+        image_files=image_files, album=album_mode,
+        accounts=accounts, media_dir=media_dir
+    )
+    try:
+        start_broadcast_job(job_id)
+    except Exception as e:
+        # المهمة لم تبدأ - تُغلق حتى لا تُستأنف لاحقاً ثم يُرسلها المستخدم مرة أخرى
+        logger.error(f"Could not start broadcast job {job_id} for {user_id}: {str(e)}")
+        job_store.set_status(job_id, JOB_DONE)
+        if media_dir:
+            shutil.rmtree(media_dir, ignore_errors=True)
+        return jsonify({
+            "success": False, 
+            "message": f"❌ تعذر بدء الإرسال: {str(e)}"
+        })
 
     return jsonify({
         "success": True, 
-        "message": f"🚀 بدأ إرسال {content_type} لـ {len(groups_list)} مجموعة"
+        "message": f"🚀 بدأ إرسال {content_type} لـ {len(groups_list)} مجموعة",
+        "job_id": job_id
     })
 
 @app.route("/api/get_stats", methods=["GET"])
@@ -2627,6 +4089,14 @@ def api_get_stats():
 
     return jsonify({"sent": 0, "errors": 0})
 
+@app.route("/api/get_alert_queue_stats", methods=["GET"])
+def api_get_alert_queue_stats():
+    """عدادات قائمة التنبيهات: المضاف والمحذوف والمدمج والعمق الحالي"""
+    return jsonify({
+        "success": True,
+        "stats": alert_queue.stats()
+    })
+
 @app.route("/api/get_login_status", methods=["GET"])
 def api_get_login_status():
     user_id = session.get('user_id')
@@ -2693,28 +4163,30 @@ def api_reset_login():
     try:
         logger.info(f"Resetting login for user {user_id}")
 
+        # العميل يُوقف بعد تحرير القفل - stop() تنتظر والـ event loop المشترك يحتاج USERS_LOCK
+        client_manager = None
         with USERS_LOCK:
             if user_id in USERS:
                 # إيقاف المراقبة إذا كانت تعمل
                 if USERS[user_id].get('is_running', False):
                     USERS[user_id]['is_running'] = False
-
-                # إيقاف العميل
                 client_manager = USERS[user_id].get('client_manager')
-                if client_manager:
-                    try:
-                        if hasattr(client_manager, 'stop'):
-                            client_manager.stop()
-                        if hasattr(client_manager, 'client') and client_manager.client:
-                            client_manager.client.disconnect()
-                        logger.info(f"Client stopped and disconnected for user {user_id}")
-                    except Exception as e:
-                        logger.error(f"Error stopping client for {user_id}: {e}")
 
                 # حذف بيانات المستخدم من الذاكرة
                 del USERS[user_id]
                 logger.info(f"User data removed from memory for {user_id}")
 
+        # إيقاف العميل
+        if client_manager:
+            try:
+                if hasattr(client_manager, 'stop'):
+                    client_manager.stop()
+                if hasattr(client_manager, 'client') and client_manager.client:
+                    client_manager.client.disconnect()
+                logger.info(f"Client stopped and disconnected for user {user_id}")
+            except Exception as e:
+                logger.error(f"Error stopping client for {user_id}: {e}")
+
         # مسح ملف جلسة التليجرام
         session_file = os.path.join(SESSIONS_DIR, f"{user_id}_session.session")
         if os.path.exists(session_file):
@@ -2741,9 +4213,7 @@ def api_reset_login():
                 logger.error(f"خطأ في مسح الإعدادات: {e}")
 
         # إرسال إشعارات التحديث
-        socketio.emit('log_update', {
-            "message": f"🔄 تم إعادة تعيين جلسة تسجيل الدخول لـ {PREDEFINED_USERS[user_id]['name']}"
-        }, to=user_id)
+        emit_log(user_id, f"🔄 تم إعادة تعيين جلسة تسجيل الدخول لـ {PREDEFINED_USERS[user_id]['name']}")
 
         socketio.emit('connection_status', {
             "status": "disconnected"
@@ -3014,8 +4484,10 @@ def extract_telegram_links(text):
 
     return result_links
 
-async def join_telegram_group(client, group_link):
-    """الانضمام لمجموعة تليجرام"""
+async def join_telegram_group(client_manager, group_link):
+    """الانضمام لمجموعة تليجرام - كل طلب يمر عبر منظم معدل الحساب"""
+    client = client_manager.client
+    pacing = client_manager.pacing
     try:
         # تنظيف الرابط
         if group_link.startswith('https://t.me/'):
@@ -3030,12 +4502,12 @@ async def join_telegram_group(client, group_link):
         # محاولة الانضمام
         try:
             # التحقق من الحالة أولاً
-            entity = await client.get_entity(group_identifier)
+            entity = await pacing.call('resolve', lambda: client.get_entity(group_identifier))
 
             # محاولة الانضمام مباشرة (سنتعامل مع الاستثناءات)
             if hasattr(entity, 'megagroup') or hasattr(entity, 'broadcast'):
                 # قناة أو مجموعة كبيرة
-                result = await client(functions.channels.JoinChannelRequest(entity))
+                result = await pacing.call('join', lambda: client(functions.channels.JoinChannelRequest(entity)))
             else:
                 # مجموعة عادية - سنحاول الانضمام من خلال رابط دعوة
                 raise Exception("مجموعة عادية - يجب استخدام رابط دعوة")
@@ -3056,6 +4528,7 @@ async def join_telegram_group(client, group_link):
         except FloodWaitError as e:
             return {
                 "success": False,
+                "flood_wait": e.seconds,
                 "message": f"يرجى الانتظار {e.seconds} ثانية"
             }
 
@@ -3076,7 +4549,8 @@ async def join_telegram_group(client, group_link):
             try:
                 if '/' in group_identifier:
                     # قد يكون رابط دعوة
-                    result = await client(functions.messages.ImportChatInviteRequest(group_identifier.split('/')[-1]))
+                    invite_hash = group_identifier.split('/')[-1]
+                    result = await pacing.call('join', lambda: client(functions.messages.ImportChatInviteRequest(invite_hash)))
                     return {
                         "success": True,
                         "already_joined": False,
@@ -3090,6 +4564,12 @@ async def join_telegram_group(client, group_link):
                     "already_joined": True,
                     "message": "منضم مسبقاً للمجموعة"
                 }
+            except FloodWaitError as e:
+                return {
+                    "success": False,
+                    "flood_wait": e.seconds,
+                    "message": f"يرجى الانتظار {e.seconds} ثانية"
+                }
             except Exception as final_error:
                 return {
                     "success": False,
@@ -3176,17 +4656,23 @@ def api_join_group():
                     "message": "❌ يرجى تسجيل الدخول أولاً"
                 })
 
-        # تشغيل عملية الانضمام
-        result = client_manager.run_coroutine(
-            join_telegram_group(client_manager.client, group_link)
-        )
+        def on_join_result(result):
+            # تسجيل النتيجة
+            emit_log(user_id, f"{'✅' if result['success'] else '❌'} {group_link}: {result['message']}")
+            return result
 
-        # تسجيل النتيجة
-        socketio.emit('log_update', {
-            "message": f"{'✅' if result['success'] else '❌'} {group_link}: {result['message']}"
-        }, to=user_id)
+        # تشغيل عملية الانضمام في الخلفية - النتيجة تصل عبر job_result
+        job_id = submit_background_job(
+            user_id, client_manager,
+            join_telegram_group(client_manager, group_link),
+            'join_group', timeout=60, on_result=on_join_result
+        )
 
-        return jsonify(result)
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "message": f"⏳ جاري الانضمام إلى {group_link}"
+        })
 
     except Exception as e:
         logger.error(f"Error joining group: {str(e)}")
@@ -3195,6 +4681,121 @@ def api_join_group():
             "message": f"❌ خطأ: {str(e)}"
         })
 
+AUTO_JOIN_MAX_WAIT = 900  # أطول FloodWait يُنتظر أثناء الانضمام التلقائي قبل إيقافه
+
+def run_auto_join_job(job_id):
+    """تنفيذ مهمة انضمام تلقائي - الروابط المنتهية سابقاً لا يُعاد الانضمام لها"""
+    job = job_store.get(job_id)
+    user_id = job['user_id']
+    delay = job['payload'].get('delay', 3)  # أقل فاصل بين طلبات الانضمام - الفاصل الفعلي يحدده منظم المعدل
+
+    try:
+        with USERS_LOCK:
+            client_manager = USERS.get(user_id, {}).get('client_manager')
+        if not client_manager or not client_manager.client:
+            raise Exception("العميل غير متصل")
+
+        job_store.release_claims(job_id)
+        job_store.set_status(job_id, JOB_RUNNING)
+        counts = job_store.counts(job_id)
+        total = counts['total']
+
+        emit_log(user_id, f"🚀 بدء الانضمام التلقائي لـ {counts[TARGET_PENDING]} مجموعة...")
+
+        pacing = client_manager.pacing
+        pacing.set_ceiling('join', 60 / max(float(delay), 1.0))
+
+        while True:
+            # احترام FloodWait: انتظار المدة القصيرة أو تأجيل باقي المهمة إذا كانت طويلة
+            wait = max(pacing.wait_time('join'), pacing.wait_time('resolve'))
+            if wait > AUTO_JOIN_MAX_WAIT:
+                remaining = len(job_store.pending(job_id))
+                if not remaining:
+                    break
+                job_store.set_status(job_id, JOB_PENDING)
+                schedule_job_resume(user_id, delay=wait)
+                emit_log(user_id, f"⏸️ طلب التليجرام إيقاف الانضمام {int(wait // 60)} دقيقة - سيُستأنف تلقائياً للروابط المتبقية ({remaining})")
+                return
+            if wait > 0:
+                emit_log(user_id, f"⏳ انتظار {int(wait)} ثانية قبل الانضمام التالي (FloodWait)")
+                time.sleep(wait)
+
+            batch = job_store.claim(job_id, 1)
+            if not batch:
+                break
+            number, group_link = batch[0]
+
+            try:
+                # إرسال حالة التقدم
+                socketio.emit('join_progress', {
+                    'current': number,
+                    'total': total,
+                    'link': group_link
+                }, to=user_id)
+
+                # محاولة الانضمام
+                result = client_manager.run_coroutine(
+                    join_telegram_group(client_manager, group_link),
+                    timeout=120
+                )
+
+                if result['success']:
+                    if result.get('already_joined', False):
+                        job_store.complete(job_id, number, TARGET_SKIPPED)
+                        emit_log(user_id, f"ℹ️ منضم مسبقاً: {group_link}")
+                    else:
+                        job_store.complete(job_id, number, TARGET_DONE)
+                        emit_log(user_id, f"✅ تم الانضمام: {group_link}")
+                elif result.get('flood_wait'):
+                    # يعود للانتظار ويُعاد بعد انتهاء FloodWait
+                    job_store.complete(job_id, number, TARGET_PENDING)
+                    continue
+                else:
+                    job_store.complete(job_id, number, TARGET_FAILED, result['message'])
+                    emit_log(user_id, f"❌ فشل: {group_link} - {result['message']}")
+
+            except Exception as e:
+                job_store.complete(job_id, number, TARGET_FAILED, str(e)[:200])
+                emit_log(user_id, f"❌ خطأ في {group_link}: {str(e)}")
+
+            # تحديث الإحصائيات
+            counts = job_store.counts(job_id)
+            socketio.emit('join_stats', {
+                'success': counts[TARGET_DONE],
+                'fail': counts[TARGET_FAILED],
+                'already_joined': counts[TARGET_SKIPPED]
+            }, to=user_id)
+
+        counts = _finish_job(job_id, job['payload'])
+
+        # إرسال النتيجة النهائية
+        socketio.emit('auto_join_completed', {
+            'success': counts[TARGET_DONE],
+            'fail': counts[TARGET_FAILED],
+            'already_joined': counts[TARGET_SKIPPED],
+            'total': total
+        }, to=user_id)
+
+        emit_log(user_id, f"🎉 انتهى الانضمام التلقائي! النجح: {counts[TARGET_DONE]}, فشل: {counts[TARGET_FAILED]}, منضم مسبقاً: {counts[TARGET_SKIPPED]}")
+
+    except Exception as e:
+        logger.error(f"Auto join job {job_id} error: {str(e)}")
+        job_store.release_claims(job_id)
+        job_store.set_status(job_id, JOB_PENDING)
+        emit_log(user_id, f"❌ توقف الانضمام التلقائي: {str(e)}")
+
+    finally:
+        _release_job(job_id)
+
+def start_auto_join_job(job_id):
+    """تشغيل أو استئناف مهمة انضمام تلقائي في thread منفصل"""
+    if not _claim_job(job_id):
+        return None
+
+    thread = threading.Thread(target=run_auto_join_job, args=(job_id,), daemon=True)
+    thread.start()
+    return thread
+
 @app.route("/api/start_auto_join", methods=["POST"])
 def api_start_auto_join():
     """بدء الانضمام التلقائي المتعدد للمجموعات"""
@@ -3215,7 +4816,7 @@ def api_start_auto_join():
             })
 
         links = data.get('links', [])
-        delay = data.get('delay', 3)  # تأخير افتراضي 3 ثواني
+        delay = data.get('delay', 3)  # أقل فاصل بين طلبات الانضمام - الفاصل الفعلي يحدده منظم المعدل
 
         if not links:
             return jsonify({
@@ -3237,94 +4838,23 @@ def api_start_auto_join():
                     "message": "❌ يرجى تسجيل الدخول أولاً"
                 })
 
-        # بدء عملية الانضمام التلقائي في thread منفصل
-        import threading
-
-        def auto_join_worker():
-            success_count = 0
-            fail_count = 0
-            already_joined_count = 0
-
-            socketio.emit('log_update', {
-                "message": f"🚀 بدء الانضمام التلقائي لـ {len(links)} مجموعة..."
-            }, to=user_id)
-
-            for i, link_obj in enumerate(links):
-                try:
-                    # الحصول على الرابط
-                    if isinstance(link_obj, dict):
-                        group_link = link_obj.get('url', '') or link_obj.get('link', '') or str(link_obj)
-                    else:
-                        group_link = str(link_obj)
-
-                    group_link = group_link.strip()
-
-                    # إرسال حالة التقدم
-                    socketio.emit('join_progress', {
-                        'current': i + 1,
-                        'total': len(links),
-                        'link': group_link
-                    }, to=user_id)
-
-                    # محاولة الانضمام
-                    result = client_manager.run_coroutine(
-                        join_telegram_group(client_manager.client, group_link)
-                    )
-
-                    if result['success']:
-                        if result.get('already_joined', False):
-                            already_joined_count += 1
-                            socketio.emit('log_update', {
-                                "message": f"ℹ️ منضم مسبقاً: {group_link}"
-                            }, to=user_id)
-                        else:
-                            success_count += 1
-                            socketio.emit('log_update', {
-                                "message": f"✅ تم الانضمام: {group_link}"
-                            }, to=user_id)
-                    else:
-                        fail_count += 1
-                        socketio.emit('log_update', {
-                            "message": f"❌ فشل: {group_link} - {result['message']}"
-                        }, to=user_id)
-
-                    # تحديث الإحصائيات
-                    socketio.emit('join_stats', {
-                        'success': success_count,
-                        'fail': fail_count,
-                        'already_joined': already_joined_count
-                    }, to=user_id)
-
-                    # تأخير بين المجموعات لتجنب flood
-                    if i < len(links) - 1:  # لا نؤخر بعد آخر مجموعة
-                        time.sleep(delay)
-
-                except Exception as e:
-                    fail_count += 1
-                    socketio.emit('log_update', {
-                        "message": f"❌ خطأ في {group_link}: {str(e)}"
-                    }, to=user_id)
-
-            # إرسال النتيجة النهائية
-            socketio.emit('auto_join_completed', {
-                'success': success_count,
-                'fail': fail_count,
-                'already_joined': already_joined_count,
-                'total': len(links)
-            }, to=user_id)
-
-            socketio.emit('log_update', {
-                "message": f"🎉 انتهى الانضمام التلقائي! النجح: {success_count}, فشل: {fail_count}, منضم مسبقاً: {already_joined_count}"
-            }, to=user_id)
+        # تسجيل العملية كمهمة دائمة ثم تشغيلها في thread منفصل
+        targets = []
+        for link_obj in links:
+            if isinstance(link_obj, dict):
+                group_link = link_obj.get('url', '') or link_obj.get('link', '') or str(link_obj)
+            else:
+                group_link = str(link_obj)
+            targets.append(group_link.strip())
 
-        # تشغيل العملية في thread منفصل
-        thread = threading.Thread(target=auto_join_worker, daemon=True)
-        thread.start()
+        job_id = job_store.create(user_id, 'auto_join', {'delay': delay}, targets)
+        start_auto_join_job(job_id)
 
         return jsonify({
             "success": True,
             "message": f"✅ تم بدء الانضمام التلقائي لـ {len(links)} مجموعة",
-            "total_links": len(links)
+            "total_links": len(links),
+            "job_id": job_id
         })
 
     except Exception as e:
@@ -3464,17 +4994,24 @@ def api_search_my_links():
         # حساب التاريخ المحدد
         since_date = datetime.now() - timedelta(days=days)
 
-        # تشغيل البحث
-        result = client_manager.run_coroutine(
-            search_links_in_chats(client_manager.client, since_date)
-        )
+        def on_search_result(result):
+            logger.info(f"✅ تم العثور على {len(result)} رابط للمستخدم {user_id}")
+            return {
+                "links": result,
+                "message": f"تم العثور على {len(result)} رابط"
+            }
 
-        logger.info(f"✅ تم العثور على {len(result)} رابط للمستخدم {user_id}")
+        # تشغيل البحث في الخلفية - النتيجة تصل عبر job_result
+        job_id = submit_background_job(
+            user_id, client_manager,
+            search_links_in_chats(client_manager, since_date),
+            'search_my_links', timeout=600, on_result=on_search_result
+        )
 
         return jsonify({
             "success": True,
-            "links": result,
-            "message": f"تم العثور على {len(result)} رابط"
+            "job_id": job_id,
+            "message": f"⏳ جاري البحث في محادثات آخر {days} يوم"
         })
 
     except Exception as e:
@@ -3484,9 +5021,14 @@ def api_search_my_links():
             "message": f"❌ خطأ في البحث: {str(e)}"
         })
 
-async def search_links_in_chats(client, since_date):
+SEARCH_MAX_WAIT = 60  # أطول FloodWait يُنتظر أثناء البحث - بعده تُعاد النتائج الجزئية
+
+async def search_links_in_chats(client_manager, since_date):
     """البحث عن الروابط في جميع المحادثات"""
+    client = client_manager.client
+    pacing = client_manager.pacing
     found_links = []
+    titles = {}
 
     try:
         # الحصول على جميع المحادثات
@@ -3497,6 +5039,7 @@ async def search_links_in_chats(client, since_date):
                     continue
 
                 chat_title = dialog.title or "محادثة غير معروفة"
+                await pacing.acquire('search')
 
                 # البحث في رسائل هذه المحادثة
                 async for message in client.iter_messages(
@@ -3509,8 +5052,10 @@ async def search_links_in_chats(client, since_date):
                         links = extract_telegram_links(message.text)
 
                         for link in links:
-                            # الحصول على معلومات القناة إن أمكن
-                            title = await get_channel_title(client, link['username'])
+                            # الحصول على معلومات القناة إن أمكن - مرة واحدة لكل اسم
+                            if link['username'] not in titles:
+                                titles[link['username']] = await get_channel_title(client_manager, link['username'])
+                            title = titles[link['username']]
 
                             found_links.append({
                                 'url': link['url'],
@@ -3520,14 +5065,25 @@ async def search_links_in_chats(client, since_date):
                                 'original_text': link['original_text']
                             })
 
+                pacing.record_success('search')
+
                 # حد أقصى للمحادثات المفحوصة لتجنب الإبطاء
                 if len(found_links) > 500:
                     break
 
+            except FloodWaitError as e:
+                pacing.record_flood('search', e.seconds)
+                if e.seconds > SEARCH_MAX_WAIT:
+                    logger.warning(f"إيقاف البحث بسبب FloodWait {e.seconds} ثانية - إرجاع النتائج الجزئية")
+                    break
+                continue
             except Exception as e:
                 logger.warning(f"تخطي محادثة بسبب خطأ: {str(e)}")
                 continue
 
+    except FloodWaitError as e:
+        pacing.record_flood('search', e.seconds)
+        logger.warning(f"إيقاف البحث بسبب FloodWait {e.seconds} ثانية - إرجاع النتائج الجزئية")
     except Exception as e:
         logger.error(f"خطأ في البحث عن الروابط: {str(e)}")
 
@@ -3545,13 +5101,16 @@ async def search_links_in_chats(client, since_date):
 
     return unique_links
 
-async def get_channel_title(client, username):
-    """الحصول على عنوان القناة من username"""
+async def get_channel_title(client_manager, username):
+    """الحصول على عنوان القناة من username - يُتخطى أثناء FloodWait لأنه غير ضروري"""
     try:
         if username.startswith('@'):
             username = username[1:]
 
-        entity = await client.get_entity(username)
+        if client_manager.pacing.wait_time('resolve') > 0:
+            return None
+
+        entity = await client_manager.pacing.call('resolve', lambda: client_manager.client.get_entity(username))
         return entity.title if hasattr(entity, 'title') else username
     except Exception:
         return None
@@ -3595,17 +5154,24 @@ def api_search_public_channels():
 
         logger.info(f"🌐 بدء البحث العام للمستخدم {user_id} عن: {query}")
 
-        # تشغيل البحث العام
-        result = client_manager.run_coroutine(
-            search_public_telegram(client_manager.client, query, limit)
-        )
+        def on_search_result(result):
+            logger.info(f"✅ تم العثور على {len(result)} قناة/مجموعة للمستخدم {user_id}")
+            return {
+                "channels": result,
+                "message": f"تم العثور على {len(result)} قناة/مجموعة"
+            }
 
-        logger.info(f"✅ تم العثور على {len(result)} قناة/مجموعة للمستخدم {user_id}")
+        # تشغيل البحث العام في الخلفية - النتيجة تصل عبر job_result
+        job_id = submit_background_job(
+            user_id, client_manager,
+            search_public_telegram(client_manager, query, limit),
+            'search_public_channels', timeout=120, on_result=on_search_result
+        )
 
         return jsonify({
             "success": True,
-            "channels": result,
-            "message": f"تم العثور على {len(result)} قناة/مجموعة"
+            "job_id": job_id,
+            "message": f"⏳ جاري البحث العام عن: {query}"
         })
 
     except Exception as e:
@@ -3615,19 +5181,21 @@ def api_search_public_channels():
             "message": f"❌ خطأ في البحث: {str(e)}"
         })
 
-async def search_public_telegram(client, query, limit=50):
+async def search_public_telegram(client_manager, query, limit=50):
     """البحث العام في التليجرام"""
+    client = client_manager.client
+    pacing = client_manager.pacing
     results = []
 
     try:
         # البحث العام باستخدام SearchGlobalRequest
-        global_search = await client(SearchGlobalRequest(
+        global_search = await pacing.call('search', lambda: client(SearchGlobalRequest(
             q=query,
             offset_date=None,
             offset_peer=None,
             offset_id=0,
             limit=limit
-        ))
+        )))
 
         # معالجة النتائج
         for message in global_search.messages:
@@ -3658,10 +5226,10 @@ async def search_public_telegram(client, query, limit=50):
         if len(results) < 10:
             try:
                 # محاولة البحث باستخدام اسم المستخدم مباشرة
-                if not query.startswith('@'):
+                if not query.startswith('@') and pacing.wait_time('resolve') == 0:
                     potential_username = '@' + query.replace(' ', '').replace('@', '')
                     try:
-                        entity = await client.get_entity(potential_username)
+                        entity = await pacing.call('resolve', lambda: client.get_entity(potential_username))
                         if isinstance(entity, (Channel, Chat)):
                             result_item = {
                                 'id': str(entity.id),
@@ -0,0 +1,66 @@
+"""مقارنة أداء مطابقة كلمات المراقبة: الحلقة القديمة مقابل الفهرس المُجمّع
+
+الاستخدام:
+    python benchmark_keywords.py [--messages 2000]
+"""
+import argparse
+import random
+import time
+
+from keyword_matcher import KeywordMatcher
+
+ARABIC_LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+KEYWORD_COUNTS = (10, 100, 1000, 10000)
+
+
+def random_word(rng, min_len=3, max_len=8):
+    return ''.join(rng.choice(ARABIC_LETTERS) for _ in range(rng.randint(min_len, max_len)))
+
+
+def random_message(rng, words=30):
+    return ' '.join(random_word(rng, 2, 7) for _ in range(words))
+
+
+def loop_match(keywords, text):
+    """نسخة من الحلقة السابقة في _handle_new_message"""
+    message_lower = text.lower()
+    for keyword in keywords:
+        keyword_lower = keyword.lower().strip()
+        if keyword_lower and keyword_lower in message_lower:
+            return keyword
+    return None
+
+
+def run(messages_count):
+    rng = random.Random(42)
+    messages = [random_message(rng) for _ in range(messages_count)]
+
+    print(f"{'keywords':>9} | {'loop (µs/msg)':>14} | {'matcher (µs/msg)':>17} | {'build (ms)':>10} | {'speedup':>8}")
+    print('-' * 72)
+
+    for count in KEYWORD_COUNTS:
+        keywords = [random_word(rng, 5, 10) for _ in range(count)]
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        loop_results = [loop_match(keywords, text) for text in messages]
+        loop_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+        start = time.perf_counter()
+        matcher_results = [matcher.match(text) for text in messages]
+        matcher_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+        # الطريقتان يجب أن تتفقا على وجود تطابق (قد تختلف الكلمة المُبلغ عنها عند تعدد التطابقات)
+        assert [r is None for r in loop_results] == [r is None for r in matcher_results]
+
+        print(f"{count:>9} | {loop_us:>14.1f} | {matcher_us:>17.1f} | {build_ms:>10.1f} | {loop_us / matcher_us:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='عدد الرسائل المُختبرة لكل حجم')
+    args = parser.parse_args()
+    run(args.messages)
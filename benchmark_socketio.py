@@ -0,0 +1,176 @@
+"""قياس زمن وصول أحداث Socket.IO واستهلاك المعالج في الخادم: polling مقابل WebSocket
+
+يشغل خادم Flask-SocketIO بنفس إعدادات app.py (وضع threading) في عملية منفصلة
+لكل نوع نقل، ويوصل إليه عدداً من لوحات التحكم ثم يرسل أحداثاً للغرفة ويقيس:
+    - زمن الوصول من emit في الخادم حتى الاستقبال في العميل (p50 / p95 / max)
+    - وقت المعالج المستهلك في الخادم لكل 1000 حدث مُسلّم
+
+الاستخدام:
+    python benchmark_socketio.py [--clients 5 50 500] [--events 50] [--interval 0.1]
+
+يحتاج: pip install "python-socketio[client]" simple-websocket
+
+نتائج تشغيل محلي (معالج واحد، العملاء والخادم على نفس الجهاز):
+    polling     5 عملاء:  p50 4.5 ms                          0.85 s/1000 حدث  (30 حدثاً)
+    polling    50 عميلاً: p50 142 ms                          0.56 s/1000 حدث  (30 حدثاً)
+    polling   500 عميل:   وصل 1449/25000 فقط، p50 5007 ms، p95 6331 ms - لم يصل 'done' فلا قياس للمعالج
+    websocket   5 عملاء:  p50 1.5 ms                          0.15 s/1000 حدث  (30 حدثاً)
+    websocket  50 عميلاً: p50 10 ms                           0.08 s/1000 حدث  (30 حدثاً)
+    websocket 500 عميل:   وصل 25000/25000، p50 222 ms، p95 928 ms  0.12 s/1000 حدث
+"""
+import argparse
+import logging
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+TRANSPORTS = ('polling', 'websocket')
+CLIENT_COUNTS = (5, 50, 500)
+ROOM = 'benchmark'
+
+
+def serve(port, transport):
+    """الخادم: ينضم كل عميل للغرفة، و'start' يرسل أحداث tick ثم 'done' مع وقت المعالج"""
+    from flask import Flask
+    from flask_socketio import SocketIO, join_room
+
+    # أخطاء إغلاق الاتصالات في نهاية التجربة ليست جزءاً من القياس
+    logging.getLogger('werkzeug').setLevel(logging.CRITICAL)
+
+    app = Flask(__name__)
+    transports = ['polling', 'websocket'] if transport == 'websocket' else ['polling']
+    socketio = SocketIO(
+        app,
+        async_mode='threading',
+        ping_timeout=30,
+        ping_interval=10,
+        allow_upgrades=transport == 'websocket',
+        transports=transports
+    )
+
+    @socketio.on('join')
+    def on_join():
+        join_room(ROOM)
+
+    @socketio.on('start')
+    def on_start(data):
+        def run():
+            cpu_start = time.process_time()
+            for sequence in range(data['events']):
+                socketio.emit('tick', {'sequence': sequence, 'sent': time.time()}, to=ROOM)
+                time.sleep(data['interval'])
+            socketio.emit('done', {'cpu': time.process_time() - cpu_start}, to=ROOM)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    socketio.run(app, host='127.0.0.1', port=port, allow_unsafe_werkzeug=True, log_output=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def run_case(transport, clients_count, events, interval):
+    import socketio as socketio_client
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, __file__, '--serve', str(port), transport])
+    clients = []
+    try:
+        wait_for_port(port)
+        latencies = []
+        lock = threading.Lock()
+        done = threading.Event()
+        result = {}
+
+        def make_client(index):
+            client = socketio_client.Client(reconnection=False)
+
+            @client.on('tick')
+            def on_tick(data):
+                received = time.time()
+                with lock:
+                    latencies.append(received - data['sent'])
+
+            if index == 0:
+                @client.on('done')
+                def on_done(data):
+                    result['cpu'] = data['cpu']
+                    done.set()
+
+            # polling يبقى polling فقط، websocket يبدأ polling ثم يترقى كما في المتصفح
+            transports = ['polling'] if transport == 'polling' else ['polling', 'websocket']
+            client.connect(f'http://127.0.0.1:{port}', transports=transports, wait_timeout=30)
+            client.emit('join')
+            return client
+
+        for index in range(clients_count):
+            clients.append(make_client(index))
+
+        upgraded = sum(1 for client in clients if client.transport() == 'websocket')
+        time.sleep(1)
+
+        clients[0].emit('start', {'events': events, 'interval': interval})
+        done.wait(timeout=events * interval + 60)
+        time.sleep(0.5)
+
+        expected = events * clients_count
+        delivered = len(latencies)
+        latencies.sort()
+        return {
+            'delivered': f"{delivered}/{expected}",
+            'websocket': upgraded,
+            'p50': statistics.median(latencies) * 1000 if latencies else float('nan'),
+            'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else float('nan'),
+            'max': latencies[-1] * 1000 if latencies else float('nan'),
+            'cpu_per_1000': result.get('cpu', float('nan')) / max(delivered, 1) * 1000,
+        }
+    finally:
+        for client in clients:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def run(client_counts, events, interval):
+    print(f"{'transport':>9} | {'clients':>7} | {'delivered':>13} | {'on ws':>5} | "
+          f"{'p50 (ms)':>8} | {'p95 (ms)':>8} | {'max (ms)':>8} | {'cpu s/1000 ev':>13}")
+    print('-' * 96)
+
+    for transport in TRANSPORTS:
+        for clients_count in client_counts:
+            r = run_case(transport, clients_count, events, interval)
+            print(f"{transport:>9} | {clients_count:>7} | {r['delivered']:>13} | {r['websocket']:>5} | "
+                  f"{r['p50']:>8.1f} | {r['p95']:>8.1f} | {r['max']:>8.1f} | {r['cpu_per_1000']:>13.3f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]), sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=list(CLIENT_COUNTS), help='أعداد لوحات التحكم المتصلة')
+    parser.add_argument('--events', type=int, default=50, help='عدد الأحداث المرسلة في كل تجربة')
+    parser.add_argument('--interval', type=float, default=0.1, help='الفاصل بين الأحداث بالثواني')
+    args = parser.parse_args()
+    run(args.clients, args.events, args.interval)
@@ -0,0 +1,179 @@
+"""سجل دائم (SQLite) لمهام البث والانضمام التلقائي وحالة كل مجموعة فيها
+
+كل مهمة لها تعريف (النوع والبيانات) وقائمة أهداف. العامل يحجز الأهداف على دفعات
+ويُسجل نتيجة كل هدف، فإذا توقف التطبيق تُستأنف المهمة من الأهداف غير المنتهية فقط.
+
+حالات الهدف:
+    pending     لم يُرسل بعد
+    claimed     محجوز لدى عامل (يعود pending عند الاستئناف)
+    done        تم بنجاح
+    skipped     لا حاجة للتنفيذ (مثل: منضم مسبقاً)
+    failed      فشل
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+
+TARGET_PENDING = 'pending'
+TARGET_CLAIMED = 'claimed'
+TARGET_DONE = 'done'
+TARGET_SKIPPED = 'skipped'
+TARGET_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_targets (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL,
+    account TEXT,
+    detail TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, user_id);
+CREATE INDEX IF NOT EXISTS idx_job_targets_status ON job_targets (job_id, status, account);
+"""
+
+
+class JobStore:
+    """وصول آمن من عدة threads لقاعدة مهام واحدة"""
+
+    def __init__(self, path, retention_days=7):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self.purge(retention_days * 86400)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def create(self, user_id, kind, payload, targets):
+        """تسجيل مهمة جديدة بأهدافها وإرجاع معرفها"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "INSERT INTO jobs (id, user_id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, user_id, kind, json.dumps(payload, ensure_ascii=False), JOB_PENDING, now, now)
+                )
+                self._db.executemany(
+                    "INSERT INTO job_targets (job_id, position, target, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    [(job_id, position, target, TARGET_PENDING, now) for position, target in enumerate(targets, 1)]
+                )
+        return job_id
+
+    def get(self, job_id):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def unfinished(self, user_id):
+        """المهام التي لم تكتمل للمستخدم - الأقدم أولاً"""
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE user_id = ? AND status IN (?, ?) ORDER BY created_at",
+            (user_id, JOB_PENDING, JOB_RUNNING)
+        )
+        return [row['id'] for row in rows]
+
+    def set_status(self, job_id, status):
+        self._execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id))
+
+    def release_claims(self, job_id):
+        """إرجاع الأهداف المحجوزة لعامل توقف إلى الانتظار - تُستدعى قبل استئناف المهمة"""
+        self._execute(
+            "UPDATE job_targets SET status = ?, account = NULL WHERE job_id = ? AND status = ?",
+            (TARGET_PENDING, job_id, TARGET_CLAIMED)
+        )
+
+    def pending(self, job_id):
+        """[(الرقم، الهدف)] للأهداف التي لم تنفذ بعد"""
+        rows = self._execute(
+            "SELECT position, target FROM job_targets WHERE job_id = ? AND status = ? ORDER BY position",
+            (job_id, TARGET_PENDING)
+        )
+        return [(row['position'], row['target']) for row in rows]
+
+    def assign(self, job_id, accounts):
+        """تعيين حساب لكل هدف: {الرقم: معرف الحساب}"""
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "UPDATE job_targets SET account = ? WHERE job_id = ? AND position = ?",
+                    [(account, job_id, position) for position, account in accounts.items()]
+                )
+
+    def claim(self, job_id, limit, account=None):
+        """حجز دفعة من الأهداف المنتظرة (لحساب محدد إن وُجد) وإرجاع [(الرقم، الهدف)]"""
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                if account is None:
+                    rows = self._db.execute(
+                        "SELECT position, target FROM job_targets WHERE job_id = ? AND status = ? ORDER BY position LIMIT ?",
+                        (job_id, TARGET_PENDING, limit)
+                    ).fetchall()
+                else:
+                    rows = self._db.execute(
+                        "SELECT position, target FROM job_targets WHERE job_id = ? AND status = ? AND account = ? ORDER BY position LIMIT ?",
+                        (job_id, TARGET_PENDING, account, limit)
+                    ).fetchall()
+                self._db.executemany(
+                    "UPDATE job_targets SET status = ?, updated_at = ? WHERE job_id = ? AND position = ?",
+                    [(TARGET_CLAIMED, time.time(), job_id, row['position']) for row in rows]
+                )
+        return [(row['position'], row['target']) for row in rows]
+
+    def complete(self, job_id, position, status, detail=None):
+        """تسجيل نتيجة هدف واحد"""
+        self._execute(
+            "UPDATE job_targets SET status = ?, detail = ?, updated_at = ? WHERE job_id = ? AND position = ?",
+            (status, detail, time.time(), job_id, position)
+        )
+
+    def counts(self, job_id):
+        """عدد الأهداف في كل حالة"""
+        rows = self._execute(
+            "SELECT status, COUNT(*) AS n FROM job_targets WHERE job_id = ? GROUP BY status", (job_id,)
+        )
+        counts = {status: 0 for status in (TARGET_PENDING, TARGET_CLAIMED, TARGET_DONE, TARGET_SKIPPED, TARGET_FAILED)}
+        counts.update({row['status']: row['n'] for row in rows})
+        counts['total'] = sum(counts.values())
+        return counts
+
+    def purge(self, max_age):
+        """حذف المهام المنتهية الأقدم من max_age ثانية"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                old = [row[0] for row in self._db.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND updated_at < ?", (JOB_DONE, cutoff)
+                )]
+                self._db.executemany("DELETE FROM job_targets WHERE job_id = ?", [(job_id,) for job_id in old])
+                self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in old])
@@ -0,0 +1,208 @@
+"""مطابقة كلمات المراقبة بمرور واحد على نص الرسالة
+
+كل سطر في كلمات المراقبة قاعدة واحدة:
+    كلمة            احتواء جزئي (الافتراضي)
+    word:كلمة       كلمة كاملة فقط
+    phrase:عبارة    عبارة كاملة (أو "عبارة" بين علامتي تنصيص)
+    re:نمط          تعبير نمطي
+    not:كلمة        استبعاد أي رسالة تحتوي هذه الكلمة
+"""
+import re
+
+# توحيد أشكال الحروف العربية: التشكيل والتطويل وأشكال الألف والهمزة والتاء المربوطة
+_ARABIC_FOLD = {
+    **{code: None for code in range(0x064B, 0x0660)},   # التشكيل (فتحة، ضمة، كسرة، شدة، سكون...)
+    **{code: None for code in range(0x06D6, 0x06EE)},   # علامات المصحف
+    0x0670: None,                                       # الألف الخنجرية
+    0x0640: None,                                       # التطويل (ـ)
+    ord('أ'): 'ا', ord('إ'): 'ا', ord('آ'): 'ا', ord('ٱ'): 'ا',
+    ord('ؤ'): 'و', ord('ئ'): 'ي', ord('ى'): 'ي',
+    ord('ة'): 'ه',
+}
+
+_WHITESPACE = re.compile(r'\s+')
+
+RULE_SUBSTRING = 'substring'
+RULE_WORD = 'word'
+RULE_PHRASE = 'phrase'
+RULE_REGEX = 'regex'
+RULE_EXCLUDE = 'exclude'
+
+RULE_PREFIXES = {
+    'word:': RULE_WORD,
+    'phrase:': RULE_PHRASE,
+    're:': RULE_REGEX,
+    'not:': RULE_EXCLUDE,
+}
+
+
+def normalize_arabic(text):
+    """توحيد النص العربي قبل المطابقة حتى تتطابق الكتابات المختلفة لنفس الكلمة"""
+    return text.lower().translate(_ARABIC_FOLD)
+
+
+def parse_rule(line):
+    """تحويل سطر من كلمات المراقبة إلى (نوع القاعدة، النص)"""
+    line = line.strip()
+    lowered = line.lower()
+    for prefix, kind in RULE_PREFIXES.items():
+        if lowered.startswith(prefix):
+            return kind, line[len(prefix):].strip()
+
+    if len(line) > 2 and line[0] == line[-1] == '"':
+        return RULE_PHRASE, line[1:-1].strip()
+
+    return RULE_SUBSTRING, line
+
+
+def _trie_pattern(words):
+    """بناء تعبير نمطي على شكل شجرة بادئات بحيث لا يتأثر زمن المطابقة بعدد الكلمات"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def node_pattern(node, branches):
+        if not branches:
+            return ''
+
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # الكلمة تنتهي هنا - نفضل الأطول إن وجد
+            return '(?:' + body + ')?'
+        return body
+
+    # بناء النمط من الأوراق إلى الجذر بمكدس صريح - التعاود يتجاوز حد Python مع الكلمات الطويلة
+    patterns = {}
+    stack = [(trie, False)]
+    while stack:
+        node, children_done = stack.pop()
+        children = [(char, child) for char, child in sorted(node.items()) if char]
+        if children_done:
+            branches = [re.escape(char) + patterns.pop(id(child)) for char, child in children]
+            patterns[id(node)] = node_pattern(node, branches)
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for _, child in children)
+
+    return patterns[id(trie)]
+
+
+def _flat_pattern(words):
+    """بدائل مسطحة (الأطول أولاً) - بديل للشجرة عندما يتجاوز تداخلها حد مُجمّع التعابير النمطية"""
+    return '(?:' + '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)) + ')'
+
+
+class KeywordMatcher:
+    """فهرس مُجمّع لقواعد المراقبة - يُبنى مرة واحدة عند تغيير الإعدادات"""
+
+    def __init__(self, keywords, normalize=False):
+        self.normalize = normalize
+        self.keywords = []
+        self.errors = []
+        self._substrings = {}
+        self._words = {}
+        self._excludes = {}
+        self._regexes = []
+        self._pattern = None
+        self._exclude_pattern = None
+
+        literal_rules = {
+            RULE_SUBSTRING: self._substrings,
+            RULE_WORD: self._words,
+            RULE_PHRASE: self._words,
+            RULE_EXCLUDE: self._excludes,
+        }
+
+        for line in keywords:
+            kind, term = parse_rule(line)
+            if not term:
+                continue
+
+            if kind == RULE_REGEX:
+                try:
+                    self._regexes.append((re.compile(term, re.IGNORECASE), term))
+                    self.keywords.append(term)
+                except re.error as e:
+                    self.errors.append((line.strip(), str(e)))
+                continue
+
+            key = _WHITESPACE.sub(' ', self._fold(term))
+            target = literal_rules[kind]
+            if key and key not in target:
+                target[key] = term
+                if kind != RULE_EXCLUDE:
+                    self.keywords.append(term)
+
+        # المسافات المتعددة تُوحّد في الرسالة فقط إذا كانت هناك قواعد تحتوي مسافات
+        self._collapse_spaces = any(' ' in key for key in (*self._substrings, *self._words, *self._excludes))
+
+        try:
+            self._compile(_trie_pattern)
+        except (RecursionError, re.error):
+            # كلمات طويلة متداخلة البادئات تجعل الشجرة أعمق مما يحتمله re
+            self._compile(_flat_pattern)
+
+    def _compile(self, build_pattern):
+        alternatives = []
+        if self._words:
+            alternatives.append(r'(?<!\w)(?P<word>' + build_pattern(self._words) + r')(?!\w)')
+        if self._substrings:
+            alternatives.append('(?P<substring>' + build_pattern(self._substrings) + ')')
+        if alternatives:
+            self._pattern = re.compile('|'.join(alternatives))
+        if self._excludes:
+            self._exclude_pattern = re.compile(build_pattern(self._excludes))
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def _fold(self, text):
+        return normalize_arabic(text) if self.normalize else text.lower()
+
+    def _prepare(self, text):
+        text = self._fold(text)
+        if self._collapse_spaces:
+            text = _WHITESPACE.sub(' ', text)
+        return text
+
+    def excludes(self, text, prepared=None):
+        """هل تحتوي الرسالة على كلمة من كلمات الاستبعاد"""
+        if self._exclude_pattern is None or not text:
+            return False
+        if prepared is None:
+            prepared = self._prepare(text)
+        return self._exclude_pattern.search(prepared) is not None
+
+    def match(self, text):
+        """إرجاع أول قاعدة مراقبة تنطبق على النص أو None"""
+        if not self.keywords or not text:
+            return None
+
+        prepared = self._prepare(text)
+        matched = None
+
+        if self._pattern is not None:
+            found = self._pattern.search(prepared)
+            if found is not None:
+                rules = self._words if found.lastgroup == 'word' else self._substrings
+                matched = rules[found.group(found.lastgroup)]
+
+        if matched is None and self._regexes:
+            # النمط يكتبه المستخدم على النص الأصلي، والنص الموحّد يُجرب أيضاً
+            # حتى يطابق "أحمد" في النمط "احمد" في الرسالة والعكس
+            candidates = (text, prepared) if self.normalize else (text,)
+            for pattern, rule in self._regexes:
+                if any(pattern.search(candidate) for candidate in candidates):
+                    matched = rule
+                    break
+
+        if matched is None or self.excludes(text, prepared):
+            return None
+
+        return matched
@@ -0,0 +1,220 @@
+"""مواعيد الإرسال المجدول بتوقيت منطقة زمنية محددة
+
+أنواع الجدولة (schedule_mode في الإعدادات):
+    interval    كل interval_seconds ثانية من آخر إرسال
+    time        وقت محدد: "2025-01-31T09:00" مرة واحدة، أو "09:00, 21:30" يومياً
+    cron        تعبير cron من 5 حقول: دقيقة ساعة يوم-الشهر شهر يوم-الأسبوع
+                مثل "0 9 * * sun-thu" أو "*/30 8-22 * * *"
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+MODE_INTERVAL = 'interval'
+MODE_TIME = 'time'
+MODE_CRON = 'cron'
+MODES = (MODE_INTERVAL, MODE_TIME, MODE_CRON)
+
+MONTH_NAMES = {name: index for index, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+WEEKDAY_NAMES = {name: index for index, name in enumerate(
+    ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))}
+
+# أقصى مدة بحث عن الموعد التالي (تكفي لـ 29 فبراير)
+CRON_SEARCH_LIMIT = timedelta(days=366 * 5)
+
+
+def get_timezone(name):
+    """المنطقة الزمنية من اسمها (مثل Asia/Riyadh) - UTC إذا كان الاسم فارغاً"""
+    if not name:
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"منطقة زمنية غير معروفة: {name}")
+
+
+def _parse_field(field, low, high, names=None):
+    """تحويل حقل cron إلى مجموعة القيم المسموحة"""
+    def value(text):
+        text = text.strip().lower()
+        if names and text in names:
+            return names[text]
+        if not text.isdigit():
+            raise ValueError(f"قيمة غير صحيحة في cron: {text}")
+        return int(text)
+
+    values = set()
+    for part in field.split(','):
+        step = 1
+        has_step = '/' in part
+        if has_step:
+            part, step_text = part.split('/', 1)
+            step = value(step_text)
+            if step < 1:
+                raise ValueError(f"خطوة غير صحيحة في cron: {field}")
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = value(start_text), value(end_text)
+        else:
+            start = value(part)
+            end = high if has_step else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"قيمة خارج النطاق في cron: {field}")
+        values.update(range(start, end + 1, step))
+
+    return values
+
+
+class CronExpression:
+    """تعبير cron قياسي من 5 حقول"""
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError("تعبير cron يجب أن يحتوي 5 حقول: دقيقة ساعة يوم-الشهر شهر يوم-الأسبوع")
+
+        self.expression = ' '.join(parts)
+        self.minutes = _parse_field(parts[0], 0, 59)
+        self.hours = _parse_field(parts[1], 0, 23)
+        self.days = _parse_field(parts[2], 1, 31)
+        self.months = _parse_field(parts[3], 1, 12, MONTH_NAMES)
+        # 7 تعني الأحد أيضاً كما في cron
+        self.weekdays = {day % 7 for day in _parse_field(parts[4], 0, 7, WEEKDAY_NAMES)}
+        # كما في cron: إذا تم تقييد يوم الشهر ويوم الأسبوع معاً يكفي تطابق أحدهما
+        self._either_day = not parts[2].startswith('*') and not parts[4].startswith('*')
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._either_day:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment):
+        """أول دقيقة تطابق التعبير بعد moment (وقت محلي بدون منطقة زمنية)"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + CRON_SEARCH_LIMIT
+
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+
+        raise ValueError(f"تعبير cron لا يتحقق أبداً: {self.expression}")
+
+
+def _parse_wall_clock(text):
+    """'2025-01-31T09:00' ← (datetime، None) أو '09:00, 21:30' ← (None، [(9, 0), (21, 30)])"""
+    text = (text or '').strip()
+    if not text:
+        raise ValueError("يجب تحديد وقت الإرسال")
+
+    if 'T' in text or '-' in text:
+        try:
+            return datetime.fromisoformat(text.replace(' ', 'T')), None
+        except ValueError:
+            raise ValueError(f"صيغة التاريخ غير صحيحة: {text}")
+
+    times = []
+    for part in text.replace('،', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            hour, minute = (int(piece) for piece in part.split(':', 1))
+        except ValueError:
+            raise ValueError(f"صيغة الوقت غير صحيحة: {part}")
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"صيغة الوقت غير صحيحة: {part}")
+        times.append((hour, minute))
+
+    if not times:
+        raise ValueError("يجب تحديد وقت الإرسال")
+    return None, sorted(set(times))
+
+
+class ScheduleRule:
+    """قاعدة جدولة واحدة تحسب موعد الإرسال التالي كـ timestamp"""
+
+    def __init__(self, mode=MODE_INTERVAL, interval_seconds=3600, scheduled_time='', cron='', timezone_name=''):
+        if mode not in MODES:
+            raise ValueError(f"نوع جدولة غير معروف: {mode}")
+
+        self.mode = mode
+        self.interval_seconds = max(int(interval_seconds or 3600), 60)
+        self.scheduled_time = (scheduled_time or '').strip()
+        self.cron = ' '.join((cron or '').split())
+        self.timezone_name = timezone_name or ''
+        self.tz = get_timezone(self.timezone_name)
+
+        self._once = None
+        self._daily = None
+        self._cron = None
+        if mode == MODE_TIME:
+            self._once, self._daily = _parse_wall_clock(self.scheduled_time)
+        elif mode == MODE_CRON:
+            self._cron = CronExpression(self.cron)
+
+    @classmethod
+    def from_settings(cls, settings, default_timezone=''):
+        return cls(
+            mode=settings.get('schedule_mode', MODE_INTERVAL),
+            interval_seconds=settings.get('interval_seconds', 3600),
+            scheduled_time=settings.get('scheduled_time', ''),
+            cron=settings.get('schedule_cron', ''),
+            timezone_name=settings.get('schedule_timezone') or default_timezone
+        )
+
+    @property
+    def signature(self):
+        """نص يتغير عند تغيير القاعدة - تُقارن به المواعيد المحفوظة بعد إعادة التشغيل"""
+        if self.mode == MODE_INTERVAL:
+            return f"interval:{self.interval_seconds}"
+        if self.mode == MODE_TIME:
+            return f"time:{self.scheduled_time}@{self.timezone_name}"
+        return f"cron:{self.cron}@{self.timezone_name}"
+
+    def _to_timestamp(self, local):
+        return local.replace(tzinfo=self.tz).timestamp()
+
+    def next_fire(self, after):
+        """أول موعد بعد after (timestamp) أو None إذا انتهت القاعدة (وقت لمرة واحدة مضى)"""
+        if self.mode == MODE_INTERVAL:
+            return after + self.interval_seconds
+
+        local = datetime.fromtimestamp(after, self.tz).replace(tzinfo=None)
+
+        if self._cron is not None:
+            return self._to_timestamp(self._cron.next_after(local))
+
+        if self._once is not None:
+            fire = self._to_timestamp(self._once)
+            return fire if fire > after else None
+
+        for day_offset in (0, 1):
+            day = local.date() + timedelta(days=day_offset)
+            for hour, minute in self._daily:
+                fire = self._to_timestamp(datetime(day.year, day.month, day.day, hour, minute))
+                if fire > after:
+                    return fire
+        return None
+
+    def describe(self):
+        """وصف مختصر يظهر في السجل"""
+        if self.mode == MODE_INTERVAL:
+            return f"كل {self.interval_seconds} ثانية"
+        zone = self.timezone_name or 'UTC'
+        if self.mode == MODE_CRON:
+            return f"cron '{self.cron}' ({zone})"
+        return f"{self.scheduled_time} ({zone})"
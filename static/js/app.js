@@ -3843,10 +3843,11 @@
 function initializeSocket() {
     // إعداد Socket.IO مع إعادة الاتصال التلقائي
     try {
+        // يبدأ بـ polling ثم يترقى إلى WebSocket إذا سمح الخادم - polling يبقى احتياطياً
         socket = io({
-            transports: ['polling'],
-            upgrade: false,
-            rememberUpgrade: false,
+            transports: ['polling', 'websocket'],
+            upgrade: true,
+            rememberUpgrade: true,
             timeout: 10000,
             autoConnect: true,
             forceNew: true,
@@ -3875,6 +3876,16 @@ function initializeSocket() {
             }
         });
 
+        // رسائل السجل تصل مجمعة من الخادم
+        socket.on('log_batch', function(data) {
+            if (data.dropped) {
+                addLogEntry(`⚠️ تم تخطي ${data.dropped} رسالة سجل بسبب كثرة الرسائل`, 'warning');
+            }
+            (data.messages || []).forEach(function(message) {
+                addLogEntry(message, getLogType(message));
+            });
+        });
+
         socket.on('console_log', function(data) {
             addConsoleEntry(data.message);
         });
@@ -3946,6 +3957,16 @@ function initializeSocket() {
             updateJoinStats(data);
         });
 
+        // نتائج العمليات الطويلة (الانضمام والبحث) التي تعمل في الخلفية
+        socket.on('job_result', function(data) {
+            if (data.success) {
+                const message = (data.result && data.result.message) || '✅ اكتملت العملية';
+                addLogEntry(message, 'success');
+            } else {
+                addLogEntry(data.message, 'error');
+            }
+        });
+
         socket.on('auto_join_completed', function(data) {
             handleAutoJoinCompleted(data);
         });
@@ -4677,9 +4698,17 @@ function handleSaveSettings(e) {
         message: document.getElementById('message').value.trim(),
         groups: document.getElementById('groups').value.trim(),
         watch_words: document.getElementById('watchWords').value.trim(),
+        arabic_normalization: document.getElementById('arabicNormalization').checked,
+        alert_digest: document.getElementById('alertDigest').checked,
+        alert_digest_window: parseInt(document.getElementById('alertDigestWindow').value) || 60,
+        alert_urgent_keywords: document.getElementById('alertUrgentKeywords').value.trim(),
+        broadcast_accounts: document.getElementById('multiAccountSend').checked ? 'all' : [],
         send_type: document.getElementById('sendType').value,
         interval_seconds: parseInt(document.getElementById('intervalSeconds').value) || 3600,
         scheduled_time: document.getElementById('scheduledTime').value,
+        schedule_mode: document.getElementById('scheduleMode').value,
+        schedule_cron: document.getElementById('scheduleCron').value,
+        schedule_timezone: document.getElementById('scheduleTimezone').value,
         auto_reply_enabled: autoReplyEnabled,
         auto_replies: autoReplies
     };
@@ -4810,10 +4839,12 @@ function updateUsersStatusIndicators(allStatus) {
         showNotification(`بدء إرسال ${contentDescription}...`, 'info');
 
         // تحضير بيانات الإرسال
+        const multiAccountField = document.getElementById('multiAccountSend');
         const sendData = {
             message: message || '',
             groups: groups,
-            images: []
+            images: [],
+            accounts: multiAccountField && multiAccountField.checked ? 'all' : []
         };
 
         // تحويل الصور إلى Base64 إذا وجدت
@@ -4891,13 +4922,16 @@ function handleSendTypeChange() {
     const sendType = document.getElementById('sendType').value;
     const intervalDiv = document.getElementById('intervalDiv');
     const scheduledTimeDiv = document.getElementById('scheduledTimeDiv');
+    const scheduleModeDiv = document.getElementById('scheduleModeDiv');
 
     if (sendType === 'scheduled') {
         if (intervalDiv) intervalDiv.style.display = 'block';
         if (scheduledTimeDiv) scheduledTimeDiv.style.display = 'block';
+        if (scheduleModeDiv) scheduleModeDiv.style.display = 'block';
     } else {
         if (intervalDiv) intervalDiv.style.display = 'none';
         if (scheduledTimeDiv) scheduledTimeDiv.style.display = 'none';
+        if (scheduleModeDiv) scheduleModeDiv.style.display = 'none';
     }
 }
 
@@ -5142,6 +5176,32 @@ function updateFormFields(settings) {
             }
         }
 
+        // تحديث توحيد الحروف العربية
+        const arabicNormalizationField = document.getElementById('arabicNormalization');
+        if (arabicNormalizationField) {
+            arabicNormalizationField.checked = settings.arabic_normalization || false;
+        }
+
+        // تحديث وضع ملخص التنبيهات
+        const alertDigestField = document.getElementById('alertDigest');
+        if (alertDigestField) {
+            alertDigestField.checked = settings.alert_digest || false;
+        }
+        const alertDigestWindowField = document.getElementById('alertDigestWindow');
+        if (alertDigestWindowField) {
+            alertDigestWindowField.value = settings.alert_digest_window || 60;
+        }
+        const alertUrgentKeywordsField = document.getElementById('alertUrgentKeywords');
+        if (alertUrgentKeywordsField) {
+            alertUrgentKeywordsField.value = (settings.alert_urgent_keywords || []).join('\n');
+        }
+
+        // تحديث توزيع الإرسال على الحسابات
+        const multiAccountField = document.getElementById('multiAccountSend');
+        if (multiAccountField) {
+            multiAccountField.checked = !!(settings.broadcast_accounts && settings.broadcast_accounts.length);
+        }
+
         // تحديث نوع الإرسال
         const sendTypeField = document.getElementById('sendType');
         if (sendTypeField) {
@@ -5160,6 +5220,22 @@ function updateFormFields(settings) {
             scheduledTimeField.value = settings.scheduled_time || '';
         }
 
+        // تحديث طريقة الجدولة
+        const scheduleModeField = document.getElementById('scheduleMode');
+        if (scheduleModeField) {
+            scheduleModeField.value = settings.schedule_mode || 'interval';
+        }
+
+        const scheduleCronField = document.getElementById('scheduleCron');
+        if (scheduleCronField) {
+            scheduleCronField.value = settings.schedule_cron || '';
+        }
+
+        const scheduleTimezoneField = document.getElementById('scheduleTimezone');
+        if (scheduleTimezoneField) {
+            scheduleTimezoneField.value = settings.schedule_timezone || '';
+        }
+
         // تحديث إعدادات الرد التلقائي
         const autoReplyEnabledField = document.getElementById('autoReplyEnabled');
         if (autoReplyEnabledField) {